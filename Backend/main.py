@@ -1,13 +1,67 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routes import upload, query, report, documents, queries
-from services.db_service import init_db
+from fastapi.responses import ORJSONResponse
+from routes import upload, query, report, documents, queries, analytics, index, admin
+from services.admission import AdmissionMiddleware, scheduler
+from services.db_service import ensure_db
+from services.profiling import RequestProfilingMiddleware
+from services.query_log_writer import query_log_writer
+from services.resources import get_collection, get_llm_service, timed
 
-app = FastAPI(title="Insurance Claim Analysis System")
+# "background" (default) starts serving immediately and warms Chroma/Gemini
+# concurrently; "block" waits for warm-up before serving; "off" loads on first use.
+WARMUP_MODE = os.getenv("WARMUP_MODE", "background").lower()
+
+
+async def warm_up():
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        asyncio.to_thread(timed, "vector store", get_collection),
+        asyncio.to_thread(timed, "llm service", get_llm_service),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"[WARN] Warm-up step failed (will retry on first use): {result}")
+    print(f"[INFO] Warm-up finished in {time.perf_counter() - started:.2f}s")
+
+
+# -----------------------------
+# ✅ Application Lifespan
+# -----------------------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The database is cheap to initialise and needed by every route
+    await asyncio.to_thread(timed, "database", ensure_db)
+    query_log_writer.start()
+
+    warm_task = None
+    if WARMUP_MODE == "block":
+        await warm_up()
+    elif WARMUP_MODE == "background":
+        warm_task = asyncio.create_task(warm_up())
+
+    yield
+
+    if warm_task is not None and not warm_task.done():
+        warm_task.cancel()
+    # Flush buffered query logs before the process exits
+    query_log_writer.stop()
+
+
+# orjson encodes responses several times faster than the stdlib json encoder
+app = FastAPI(title="Insurance Claim Analysis System", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # -----------------------------
 # ✅ CORS Configuration
 # -----------------------------
+# Per-workload concurrency pools; added first so it sits inside CORS and
+# shed requests (429/503 + Retry-After) still carry CORS headers
+app.add_middleware(AdmissionMiddleware)
 # This allows both local development and Render-deployed frontend
 app.add_middleware(
     CORSMiddleware,
@@ -31,12 +85,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Last-Modified", "X-Profile-Id", "Retry-After", "X-Queue-Wait-Ms"],
 )
-
-# -----------------------------
-# ✅ Initialize Database
-# -----------------------------
-init_db()
+# Stage timings for every /api request; slow ones and admin-requested profiles are kept
+app.add_middleware(RequestProfilingMiddleware)
 
 # -----------------------------
 # ✅ Include Routers
@@ -46,6 +98,9 @@ app.include_router(query.router, prefix="/api")
 app.include_router(report.router, prefix="/api")
 app.include_router(documents.router, prefix="/api")
 app.include_router(queries.router, prefix="/api")
+app.include_router(analytics.router, prefix="/api")
+app.include_router(index.router, prefix="/api")
+app.include_router(admin.router, prefix="/api")
 
 # -----------------------------
 # ✅ Root Endpoint
@@ -70,4 +125,5 @@ async def options_process_pdf():
 # -----------------------------
 @app.api_route("/api/health", methods=["GET", "HEAD"])
 async def health_check():
-    return {"status": "healthy", "message": "Backend is running"}
+    return {"status": "healthy", "message": "Backend is running", "query_log": query_log_writer.stats(),
+            "admission": scheduler.stats(), "caches": query.cache_stats()}
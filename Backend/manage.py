@@ -0,0 +1,397 @@
+"""Maintenance commands for the backend.
+
+Run from the Backend/ directory, e.g. `python manage.py blob-stats`.
+"""
+import argparse
+import json
+
+from services.db_service import (
+    SessionLocal, engine, init_db, migrate_raw_columns, get_blob_stats, rebuild_rollups, ANALYTICS_ROLLUPS_ENABLED,
+)
+
+
+def vacuum():
+    with engine.connect() as conn:
+        conn.exec_driver_sql("VACUUM")
+    print("[INFO] Database vacuumed.")
+
+
+def cmd_migrate_blobs(args):
+    db = SessionLocal()
+    try:
+        migrated = migrate_raw_columns(db, batch_size=args.batch_size)
+        print(f"[INFO] Migrated {migrated} query rows into compressed blobs.")
+        if args.vacuum:
+            # Reclaim the pages freed by the cleared inline columns
+            db.close()
+            vacuum()
+    finally:
+        db.close()
+
+
+def cmd_archive_queries(args):
+    from services.query_archive import ARCHIVE_BATCH_SIZE, QUERY_RETENTION_DAYS, archive_queries
+
+    days = args.days if args.days is not None else QUERY_RETENTION_DAYS
+    batch_size = args.batch_size or ARCHIVE_BATCH_SIZE
+    db = SessionLocal()
+    try:
+        summary = archive_queries(db, days=days, batch_size=batch_size, dry_run=args.dry_run)
+    finally:
+        db.close()
+    if args.dry_run:
+        print(f"[INFO] Would archive {summary['rows']} query rows from {summary['days']} days "
+              f"before {summary['cutoff']}.")
+        return
+    print(f"[INFO] Archived {summary['rows']} query rows into {len(summary['files'])} files "
+          f"and deleted {summary['blobs_deleted']} unreferenced blobs.")
+    for f in summary["files"]:
+        print(f"  {f['day']}  {f['rows']:>8} rows  {f['bytes']:>10} bytes  {f['path']}")
+    if summary["rows"] and not args.no_vacuum:
+        # Deleted rows only become free pages; VACUUM gives the space back and re-packs the table
+        vacuum()
+
+
+def cmd_archive_stats(args):
+    from services.query_archive import get_archive_stats
+
+    db = SessionLocal()
+    try:
+        print(json.dumps(get_archive_stats(db), indent=2))
+    finally:
+        db.close()
+
+
+def cmd_blob_stats(args):
+    db = SessionLocal()
+    try:
+        print(json.dumps(get_blob_stats(db), indent=2))
+    finally:
+        db.close()
+
+
+def cmd_rebuild_rollups(args):
+    if not ANALYTICS_ROLLUPS_ENABLED:
+        print("[INFO] ANALYTICS_ROLLUPS=0; rollups are disabled, nothing to rebuild.")
+        return
+    db = SessionLocal()
+    try:
+        scanned = rebuild_rollups(db)
+        print(f"[INFO] Rebuilt analytics rollups from {scanned} query rows.")
+    finally:
+        db.close()
+
+
+def cmd_hnsw_eval(args):
+    from services.hnsw_eval import DEFAULT_PARAM_SETS, parse_param_set, run_hnsw_eval
+    from services.resources import get_collection, get_llm_service
+
+    param_sets = [parse_param_set(spec) for spec in args.params] if args.params else DEFAULT_PARAM_SETS
+    if args.space:
+        param_sets = [{**p, "space": p.get("space", args.space)} for p in param_sets]
+    db = SessionLocal()
+    try:
+        report = run_hnsw_eval(db, get_collection(), get_llm_service(), param_sets, sample=args.sample, k=args.k)
+    finally:
+        db.close()
+
+    print(f"Corpus: {report['corpus_size']} chunks, {report['queries']} queries ({report['query_source']}), k={report['k']}")
+    columns = list(report["results"][0].keys())
+    print("  ".join(f"{c:>16}" for c in columns))
+    for row in report["results"]:
+        print("  ".join(f"{str(row.get(c, '')):>16}" for c in columns))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def cmd_chunking_report(args):
+    from services.chunking_eval import DEFAULT_CONFIGS, parse_config, run_chunking_report
+    from services.resources import get_collection, get_llm_service
+
+    configs = [parse_config(spec) for spec in args.config] if args.config else DEFAULT_CONFIGS
+    db = SessionLocal()
+    try:
+        report = run_chunking_report(db, get_collection(), get_llm_service(), configs, docs=args.docs,
+                                     queries=args.queries, k=args.k)
+    finally:
+        db.close()
+
+    print(f"Documents: {report['documents']}, {report['queries']} sentence queries, k={report['k']}, "
+          f"{report['embeddings_computed']} chunk texts embedded for this report")
+    columns = list(report["results"][0].keys())
+    print("  ".join(f"{c:>18}" for c in columns))
+    for row in report["results"]:
+        print("  ".join(f"{str(row.get(c, '')):>18}" for c in columns))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def cmd_rebuild_index(args):
+    from services.index_service import create_index_version, run_rebuild, version_to_dict
+
+    db = SessionLocal()
+    try:
+        version = create_index_version(db, {"strategy": args.strategy, "chunk_size": args.chunk_size,
+                                            "chunk_overlap": args.chunk_overlap})
+        print(f"[INFO] Building index v{version.id} ({version.label}) into {version.collection_name}...")
+        run_rebuild(version.id)
+        db.refresh(version)
+        print(json.dumps(version_to_dict(version), indent=2))
+    finally:
+        db.close()
+
+
+def cmd_index_versions(args):
+    from services.index_service import list_index_versions, version_to_dict
+
+    db = SessionLocal()
+    try:
+        print(json.dumps([version_to_dict(v) for v in list_index_versions(db)], indent=2))
+    finally:
+        db.close()
+
+
+def cmd_activate_index(args):
+    from services.index_service import activate_index
+
+    db = SessionLocal()
+    try:
+        version = activate_index(db, args.version_id)
+        print(f"[INFO] Index v{version.id} ({version.label}) is now active.")
+    finally:
+        db.close()
+
+
+def cmd_drop_index(args):
+    from services.index_service import drop_index_version
+
+    db = SessionLocal()
+    try:
+        drop_index_version(db, args.version_id)
+        print(f"[INFO] Dropped index v{args.version_id}.")
+    finally:
+        db.close()
+
+
+def cmd_rebuild_shard(args):
+    from services.index_service import rebuild_shard
+
+    db = SessionLocal()
+    try:
+        print(json.dumps(rebuild_shard(db, args.shard), indent=2))
+    finally:
+        db.close()
+
+
+def cmd_index_shards(args):
+    from services.resources import get_collection
+
+    store = get_collection()
+    if not hasattr(store, "shard_counts"):
+        print(f"[INFO] The active index is not sharded ({store.count()} chunks).")
+        return
+    print(json.dumps({"sharding": store.sharding, "chunks": store.shard_counts()}, indent=2))
+
+
+def cmd_build_summaries(args):
+    from services.routing_service import build_missing_summaries
+
+    db = SessionLocal()
+    try:
+        count = build_missing_summaries(db, force=args.force)
+        print(f"[INFO] Built summaries and section centroids for {count} documents.")
+    finally:
+        db.close()
+
+
+def cmd_ingest(args):
+    import os
+    import shutil
+    from services.bulk_ingest import create_documents, extract_zip_pdfs, ingest_files, is_pdf_name, upload_path
+
+    sources = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                sources += [os.path.join(root, n) for n in sorted(names) if is_pdf_name(n) or n.lower().endswith(".zip")]
+        else:
+            sources.append(path)
+    # Copy into uploads/ like the API does: index rebuilds re-chunk from the kept file
+    files = []
+    for path in sources:
+        if path.lower().endswith(".zip"):
+            files += extract_zip_pdfs(path)
+        elif is_pdf_name(path):
+            files.append({"name": os.path.basename(path), "path": shutil.copy(path, upload_path(path))})
+        else:
+            print(f"[WARN] Skipping {path}: not a PDF or ZIP")
+    if not files:
+        print("[INFO] No PDF files to ingest.")
+        return
+
+    db = SessionLocal()
+    try:
+        insurer = (args.insurer or "").strip() or None
+        create_documents(db, files, insurer)
+        print(f"[INFO] Ingesting {len(files)} PDFs...")
+
+        def on_result(r):
+            detail = f"{r['pages']} pages, {r['chunks']} chunks" if r["status"] == "completed" else r["error"]
+            print(f"  [{r['status']}] doc {r['doc_id']} {r['name']}: {detail}")
+
+        stats = ingest_files(db, files, insurer, on_result=on_result)
+    finally:
+        db.close()
+    results = stats.pop("results")
+    print(json.dumps(stats, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({**stats, "results": results}, f, indent=2)
+
+
+def cmd_snapshot_export(args):
+    from services.snapshot_service import export_snapshot
+
+    db = SessionLocal()
+    try:
+        manifest = export_snapshot(db, args.out, since=args.since)
+    finally:
+        db.close()
+    chunks = {key: {k: v for k, v in c.items() if k != "deleted"} | {"deleted": len(c["deleted"])}
+              for key, c in manifest["collections"].items()}
+    print(f"[INFO] Wrote {manifest['kind']} snapshot {manifest['id']} to {args.out}")
+    print(json.dumps({"counts": manifest["counts"], "chunks": chunks}, indent=2))
+
+
+def cmd_snapshot_import(args):
+    from services.snapshot_service import import_snapshot
+
+    db = SessionLocal()
+    try:
+        manifest = import_snapshot(db, args.path, force=args.force)
+        print(f"[INFO] Imported {manifest['kind']} snapshot {manifest['id']} "
+              f"(index v{manifest['index_version']['id']}, {manifest['counts']['documents']} documents).")
+    finally:
+        db.close()
+
+
+def cmd_snapshots(args):
+    from services.snapshot_service import list_snapshots
+
+    db = SessionLocal()
+    try:
+        for s in list_snapshots(db, limit=args.limit):
+            print(f"{s.applied_at:%Y-%m-%d %H:%M:%S}  {s.direction:<6}  {s.kind:<11}  {s.snapshot_id}  "
+                  f"+{s.chunks_added}/-{s.chunks_deleted} chunks  {s.path}")
+    finally:
+        db.close()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Insurance Claim Analysis System maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("migrate-blobs", help="Move inline raw_context/raw_response into compressed blobs")
+    p.add_argument("--batch-size", type=int, default=500)
+    p.add_argument("--vacuum", action="store_true", help="VACUUM the database afterwards")
+    p.set_defaults(func=cmd_migrate_blobs)
+
+    p = sub.add_parser("blob-stats", help="Show space saved by blob compression and deduplication")
+    p.set_defaults(func=cmd_blob_stats)
+
+    p = sub.add_parser("archive-queries",
+                       help="Move query log rows older than the retention period into compressed archive files")
+    p.add_argument("--days", type=int, help="Retention in days; defaults to QUERY_RETENTION_DAYS (90)")
+    p.add_argument("--batch-size", type=int, help="Rows read per SELECT; defaults to ARCHIVE_BATCH_SIZE (1000)")
+    p.add_argument("--dry-run", action="store_true", help="Only report what would be archived")
+    p.add_argument("--no-vacuum", action="store_true", help="Skip the VACUUM afterwards")
+    p.set_defaults(func=cmd_archive_queries)
+
+    p = sub.add_parser("archive-stats", help="Show hot query log size and the archived days")
+    p.set_defaults(func=cmd_archive_stats)
+
+    p = sub.add_parser("rebuild-rollups", help="Recompute the analytics rollup table from the queries table")
+    p.set_defaults(func=cmd_rebuild_rollups)
+
+    p = sub.add_parser("hnsw-eval", help="Measure recall@k vs latency for HNSW parameter sets")
+    p.add_argument("--params", action="append",
+                   help='Parameter set, e.g. "M=16,ef_construction=200,ef_search=50" (repeatable)')
+    p.add_argument("--space", choices=["cosine", "l2", "ip"], help="Distance metric for sets that do not set one")
+    p.add_argument("--sample", type=int, default=200, help="Number of logged queries to use")
+    p.add_argument("-k", type=int, default=8, help="Neighbours per query (the app retrieves 8)")
+    p.add_argument("--json", help="Also write the results to this file")
+    p.set_defaults(func=cmd_hnsw_eval)
+
+    p = sub.add_parser("rebuild-index", help="Re-chunk and re-embed all documents into a new index, then swap it in")
+    p.add_argument("--strategy", choices=["recursive", "structure"], help="Defaults to CHUNK_STRATEGY (recursive)")
+    p.add_argument("--chunk-size", type=int, help="Defaults to CHUNK_SIZE (1000)")
+    p.add_argument("--chunk-overlap", type=int,
+                   help="Defaults to CHUNK_OVERLAP (150), or STRUCTURE_CHUNK_OVERLAP (0) for --strategy structure")
+    p.set_defaults(func=cmd_rebuild_index)
+
+    p = sub.add_parser("chunking-report",
+                       help="Compare chunk count, embedding cost, index size and retrieval quality of chunking configs")
+    p.add_argument("--config", action="append",
+                   help='Chunking config, e.g. "strategy=structure,chunk_size=1000,chunk_overlap=0" (repeatable)')
+    p.add_argument("--docs", type=int, default=20, help="Most recent completed documents to chunk")
+    p.add_argument("--queries", type=int, default=100, help="Sentences sampled from them as queries")
+    p.add_argument("-k", type=int, default=8, help="Chunks retrieved per query (the app retrieves 8)")
+    p.add_argument("--json", help="Also write the results to this file")
+    p.set_defaults(func=cmd_chunking_report)
+
+    p = sub.add_parser("index-versions", help="List index versions and rebuild progress")
+    p.set_defaults(func=cmd_index_versions)
+
+    p = sub.add_parser("activate-index", help="Serve queries from another index version (rollback)")
+    p.add_argument("version_id", type=int)
+    p.set_defaults(func=cmd_activate_index)
+
+    p = sub.add_parser("index-shards", help="Show the active index's shards and their chunk counts")
+    p.set_defaults(func=cmd_index_shards)
+
+    p = sub.add_parser("rebuild-shard", help="Rebuild one shard of the active index and swap it in")
+    p.add_argument("shard", help='Shard key, e.g. "s2" (SHARD_BY=hash) or an insurer slug')
+    p.set_defaults(func=cmd_rebuild_shard)
+
+    p = sub.add_parser("build-summaries", help="Backfill document summaries and routing centroids")
+    p.add_argument("--force", action="store_true", help="Rebuild them for every document, not just missing ones")
+    p.set_defaults(func=cmd_build_summaries)
+
+    p = sub.add_parser("drop-index", help="Delete a retired, failed or stalled index version and its collection")
+    p.add_argument("version_id", type=int)
+    p.set_defaults(func=cmd_drop_index)
+
+    p = sub.add_parser("ingest", help="Bulk-ingest PDFs, ZIPs of PDFs or directories through the pipelined uploader")
+    p.add_argument("paths", nargs="+")
+    p.add_argument("--insurer", help="Insurer to tag every document with")
+    p.add_argument("--json", help="Also write per-file results and throughput to this file")
+    p.set_defaults(func=cmd_ingest)
+
+    p = sub.add_parser("snapshot-export", help="Write a compressed snapshot of the database and active index")
+    p.add_argument("out", help="Archive to write, e.g. snapshot.tar.gz")
+    p.add_argument("--since", metavar="BASE",
+                   help="Previous snapshot file; only ship chunks and queries changed since it")
+    p.set_defaults(func=cmd_snapshot_export)
+
+    p = sub.add_parser("snapshot-import", help="Restore a snapshot (full: replaces local data; incremental: applies changes)")
+    p.add_argument("path")
+    p.add_argument("--force", action="store_true", help="Apply an incremental snapshot without checking its base")
+    p.set_defaults(func=cmd_snapshot_import)
+
+    p = sub.add_parser("snapshots", help="List snapshots exported or imported on this node")
+    p.add_argument("--limit", type=int, default=20)
+    p.set_defaults(func=cmd_snapshots)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    init_db()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
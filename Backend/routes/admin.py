@@ -0,0 +1,45 @@
+import os
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import FileResponse, PlainTextResponse
+from services.profiling import (
+    ADMIN_TOKEN, SLOW_REQUEST_MS, get_slow_requests, is_admin_token, list_profiles, profile_path, profile_text,
+)
+
+NOT_FOUND = "Profile not found"
+
+
+def require_admin(x_admin_token: str | None = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled (set ADMIN_TOKEN)")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+@router.get("/admin/slow-requests")
+def slow_requests(limit: int | None = Query(None, ge=1)):
+    """Requests slower than SLOW_REQUEST_MS on this worker, newest first, with stage timings"""
+    return {"threshold_ms": SLOW_REQUEST_MS, "requests": get_slow_requests(limit)}
+
+
+@router.get("/admin/profiles")
+def profiles():
+    return list_profiles()
+
+
+@router.get("/admin/profiles/{profile_id}")
+def get_profile(profile_id: str, format: str = "text", sort: str = "cumulative", limit: int = Query(40, ge=1, le=500)):
+    """Top functions as text, or the raw cProfile dump (format=prof) for snakeviz/pstats"""
+    path = profile_path(profile_id)
+    if format == "prof":
+        if not path or not os.path.exists(path):
+            raise HTTPException(status_code=404, detail=NOT_FOUND)
+        return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+    if sort not in ("cumulative", "tottime", "calls", "ncalls"):
+        raise HTTPException(status_code=400, detail="sort must be cumulative, tottime, calls or ncalls")
+    text = profile_text(profile_id, sort=sort, limit=limit)
+    if text is None:
+        raise HTTPException(status_code=404, detail=NOT_FOUND)
+    return PlainTextResponse(text)
@@ -0,0 +1,29 @@
+from datetime import date
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from services.db_service import get_db
+from services.analytics_service import aggregate_queries
+
+router = APIRouter()
+
+
+@router.get("/analytics")
+def get_analytics(
+    group_by: str = "decision",
+    start: date | None = None,
+    end: date | None = None,
+    document_id: int | None = None,
+    source: str = "auto",
+    db: Session = Depends(get_db),
+):
+    """Aggregate query counts and amounts in SQL.
+    group_by is a comma-separated list of decision, document and day;
+    start/end are inclusive ISO dates.
+    """
+    dims = [d.strip() for d in group_by.split(",") if d.strip()]
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must be on or before end")
+    try:
+        return aggregate_queries(db, dims, start=start, end=end, document_id=document_id, source=source)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,41 +1,65 @@
-from fastapi import APIRouter, HTTPException, Depends
+from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
 from sqlalchemy.orm import Session
-from services.db_service import get_db, create_document, get_documents, get_document_by_id, update_document, delete_document
+from schemas import DocumentOut
+from services.db_service import get_db, create_document, list_documents_page, get_document_by_id, update_document, delete_document
+from services.change_feed import VersionedCache
+from services.http_cache import conditional_get
 
 NOT_FOUND = "Document not found"
 
 router = APIRouter()
 
+# Pages and single documents, dropped whenever any worker changes the documents table
+_pages = VersionedCache(["documents"], max_entries=64)
+_docs = VersionedCache(["documents"], max_entries=1024)
 
-@router.post("/documents")
+
+@router.post("/documents", response_model=DocumentOut)
 def create_doc(payload: dict, db: Session = Depends(get_db)):
     name = payload.get('name')
     file_path = payload.get('file_path')
     file_size = payload.get('file_size')
-    doc = create_document(db, name=name, file_path=file_path, file_size=file_size, status='completed')
-    return {"id": doc.id, "name": doc.name, "file_size": doc.file_size, "status": doc.status, "uploaded_at": doc.uploaded_at.isoformat(), "processed_at": doc.processed_at.isoformat() if doc.processed_at else None}
+    return create_document(db, name=name, file_path=file_path, file_size=file_size, status='completed')
 
 
-@router.get("/documents")
-def list_docs(db: Session = Depends(get_db)):
-    docs = get_documents(db)
-    return [{"id": d.id, "name": d.name, "file_size": d.file_size, "status": d.status, "uploaded_at": d.uploaded_at.isoformat(), "processed_at": d.processed_at.isoformat() if d.processed_at else None} for d in docs]
+@router.get("/documents", response_model=List[DocumentOut])
+def list_docs(request: Request, response: Response, limit: int = Query(1000, ge=1, le=1000), after: str | None = None, db: Session = Depends(get_db)):
+    not_modified = conditional_get(request, response, "documents")
+    if not_modified:
+        return not_modified
+    def load_page():
+        docs, cursor = list_documents_page(db, limit=limit, after=after)
+        return [DocumentOut.model_validate(d) for d in docs], cursor
+    try:
+        docs, next_cursor = _pages.get_or_set((limit, after), load_page)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return docs
 
 
-@router.get("/documents/{doc_id}")
-def get_doc(doc_id: int, db: Session = Depends(get_db)):
-    doc = get_document_by_id(db, doc_id)
+@router.get("/documents/{doc_id}", response_model=DocumentOut)
+def get_doc(doc_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    not_modified = conditional_get(request, response, "documents")
+    if not_modified:
+        return not_modified
+    def load_doc():
+        doc = get_document_by_id(db, doc_id)
+        return DocumentOut.model_validate(doc) if doc else None
+    doc = _docs.get_or_set(doc_id, load_doc)
     if not doc:
         raise HTTPException(status_code=404, detail=NOT_FOUND)
-    return {"id": doc.id, "name": doc.name, "file_size": doc.file_size, "status": doc.status, "uploaded_at": doc.uploaded_at.isoformat(), "processed_at": doc.processed_at.isoformat() if doc.processed_at else None}
+    return doc
 
 
-@router.put("/documents/{doc_id}")
+@router.put("/documents/{doc_id}", response_model=DocumentOut)
 def put_doc(doc_id: int, updates: dict, db: Session = Depends(get_db)):
     doc = update_document(db, doc_id, updates)
     if not doc:
         raise HTTPException(status_code=404, detail=NOT_FOUND)
-    return {"id": doc.id, "name": doc.name, "file_size": doc.file_size, "status": doc.status, "uploaded_at": doc.uploaded_at.isoformat(), "processed_at": doc.processed_at.isoformat() if doc.processed_at else None}
+    return doc
 
 
 @router.delete("/documents/{doc_id}")
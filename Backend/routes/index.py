@@ -0,0 +1,51 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from services.db_service import get_db, IndexVersion
+from services.index_service import list_index_versions, start_rebuild, activate_index, version_to_dict
+from routes.admin import require_admin
+
+router = APIRouter()
+
+
+@router.get("/index/versions")
+def get_index_versions(db: Session = Depends(get_db)):
+    return [version_to_dict(v) for v in list_index_versions(db)]
+
+
+@router.get("/index/versions/{version_id}")
+def get_index_version(version_id: int, db: Session = Depends(get_db)):
+    version = db.get(IndexVersion, version_id)
+    if not version:
+        raise HTTPException(status_code=404, detail="Index version not found")
+    return version_to_dict(version)
+
+
+@router.post("/index/rebuild", status_code=202, dependencies=[Depends(require_admin)])
+def post_index_rebuild(payload: dict | None = None, db: Session = Depends(get_db)):
+    """Start a background rebuild; body may set strategy ("recursive" or "structure"),
+    chunk_size and chunk_overlap.
+    Poll /index/versions/{id} for progress. Queries use the current index until it finishes.
+    """
+    payload = payload or {}
+    try:
+        chunking = {k: int(payload[k]) for k in ("chunk_size", "chunk_overlap") if payload.get(k) is not None}
+        if payload.get("strategy"):
+            chunking["strategy"] = str(payload["strategy"]).lower()
+        version = start_rebuild(db, chunking)
+    except ValueError as e:
+        raise HTTPException(status_code=409 if "already running" in str(e) else 400, detail=str(e))
+    return version_to_dict(version)
+
+
+@router.post("/index/versions/{version_id}/activate", dependencies=[Depends(require_admin)])
+def post_index_activate(version_id: int, db: Session = Depends(get_db)):
+    """Switch queries to another finished version, e.g. to roll back a rebuild."""
+    version = db.get(IndexVersion, version_id)
+    if not version:
+        raise HTTPException(status_code=404, detail="Index version not found")
+    if version.status == "building":
+        raise HTTPException(status_code=409, detail="Index version is still building")
+    try:
+        return version_to_dict(activate_index(db, version_id))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,29 +1,65 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-from services.db_service import get_db, create_query, get_queries_by_document, get_recent_queries
+from schemas import QueryOut
+from services.db_service import get_db, create_query, list_queries_page, get_blob_stats
+from services.http_cache import conditional_get
+from services.query_archive import get_archive_stats
 
 router = APIRouter()
 
 
-@router.post("/queries")
+@router.post("/queries", response_model=QueryOut)
 def create_q(payload: dict, db: Session = Depends(get_db)):
     document_id = payload.get('document_id')
     query_text = payload.get('query_text')
     response = payload.get('response')
     raw_context = payload.get('raw_context')
     raw_response = payload.get('raw_response')
-    q = create_query(db, document_id=document_id, query_text=query_text, response=response, raw_context=raw_context, raw_response=raw_response)
-    return {"id": q.id, "document_id": q.document_id, "query_text": q.query, "decision": q.decision, "amount": q.amount, "justification": q.justification, "reference_clauses": q.reference_clauses, "timestamp": q.timestamp.isoformat()}
+    return create_query(db, document_id=document_id, query_text=query_text, response=response, raw_context=raw_context, raw_response=raw_response)
 
 
-@router.get("/queries")
-def get_all_queries(db: Session = Depends(get_db)):
-    """Get all queries for analytics"""
-    qs = get_recent_queries(db, limit=1000)  # Get more queries for analytics
-    return [{"id": q.id, "document_id": q.document_id, "query_text": q.query, "decision": q.decision, "amount": q.amount, "justification": q.justification, "reference_clauses": q.reference_clauses, "timestamp": q.timestamp.isoformat()} for q in qs]
+def set_next_cursor(response: Response, next_cursor: str | None):
+    """Expose the keyset cursor for the next page without changing the list body"""
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
 
 
-@router.get("/documents/{doc_id}/queries")
-def list_queries(doc_id: int, db: Session = Depends(get_db)):
-    qs = get_queries_by_document(db, doc_id)
-    return [{"id": q.id, "document_id": q.document_id, "query_text": q.query, "decision": q.decision, "amount": q.amount, "justification": q.justification, "reference_clauses": q.reference_clauses, "timestamp": q.timestamp.isoformat()} for q in qs]
+@router.get("/queries", response_model=List[QueryOut])
+def get_all_queries(request: Request, response: Response, limit: int = Query(1000, ge=1, le=1000), after: str | None = None, db: Session = Depends(get_db)):
+    """Get queries newest-first; pass the X-Next-Cursor header back as `after` for the next page"""
+    not_modified = conditional_get(request, response, "queries")
+    if not_modified:
+        return not_modified
+    try:
+        qs, next_cursor = list_queries_page(db, limit=limit, after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    set_next_cursor(response, next_cursor)
+    return qs
+
+
+@router.get("/documents/{doc_id}/queries", response_model=List[QueryOut])
+def list_queries(doc_id: int, request: Request, response: Response, limit: int = Query(1000, ge=1, le=1000), after: str | None = None, db: Session = Depends(get_db)):
+    not_modified = conditional_get(request, response, "queries")
+    if not_modified:
+        return not_modified
+    try:
+        qs, next_cursor = list_queries_page(db, limit=limit, after=after, document_id=doc_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    set_next_cursor(response, next_cursor)
+    return qs
+
+
+
+@router.get("/queries/storage-stats")
+def queries_storage_stats(db: Session = Depends(get_db)):
+    """Space used by raw context/response blobs and how much compression saves"""
+    return get_blob_stats(db)
+
+
+@router.get("/queries/archive-stats")
+def queries_archive_stats(db: Session = Depends(get_db)):
+    """Hot query log size and the days rolled out to archive files (manage.py archive-queries)"""
+    return get_archive_stats(db)
@@ -1,9 +1,14 @@
+import asyncio
+import copy
+import os
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
-import chromadb
-from services.llm_service import LLMService
+from services.change_feed import INDEX_COUNTER, VersionedCache
+from services.resources import get_llm_service, get_collection
 from services.retrieval_service import build_context_and_refs
+from services.routing_service import two_stage_query
+from services.request_trace import note, stage
 import re
 
 def build_clause_details(context: str, reference_clauses: list[str]) -> list[dict]:
@@ -39,21 +44,34 @@ def build_clause_details(context: str, reference_clauses: list[str]) -> list[dic
             "snippet": snippet or "Relevant excerpt not found in source; refer to document context.",
         })
     return details
-from services.db_service import get_db, log_query
-from chromadb.config import Settings
+from services.db_service import get_db
+from services.query_log_writer import query_log_writer
 
 router = APIRouter()
-llm_service = LLMService()
 
-# Initialize ChromaDB (disable anonymized telemetry to avoid PostHog atexit issues)
-client = chromadb.PersistentClient(path="./vector_db/chroma", settings=Settings(anonymized_telemetry=False))
-collection = client.get_or_create_collection(name="insurance_policies")
+# Per-worker caches; uploads, deletions and index swaps on any worker empty
+# the ones that depend on them within CHANGE_CHECK_INTERVAL
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "256"))
+_chunk_counts = VersionedCache(["documents", INDEX_COUNTER], max_entries=16)
+_query_embeddings = VersionedCache([], max_entries=QUERY_CACHE_SIZE)
+_answers = VersionedCache(["documents", INDEX_COUNTER], max_entries=QUERY_CACHE_SIZE)
+
+
+def cache_stats() -> dict:
+    return {"chunk_counts": _chunk_counts.stats(), "query_embeddings": _query_embeddings.stats(),
+            "answers": _answers.stats()}
+
 
 @router.get("/query")
-async def query_insurance(query: str, db: Session = Depends(get_db)):
+async def query_insurance(query: str, insurer: str | None = None, db: Session = Depends(get_db)):
+    # One normalized form for the caches, the LLM prompt and the query log
+    query = query.strip()
     try:
+        llm_service = get_llm_service()
+        collection = get_collection()
+
         # Check if collection has any documents
-        collection_count = collection.count()
+        collection_count = _chunk_counts.get_or_set(collection.name, collection.count)
         if collection_count == 0:
             return {
                 "decision": "no_data",
@@ -63,15 +81,39 @@ async def query_insurance(query: str, db: Session = Depends(get_db)):
             }
 
         # Generate query embedding
-        query_embedding = llm_service.get_embeddings([query])[0]
+        # Blocking Gemini and vector store calls run off the event loop so
+        # queued and concurrent requests keep being scheduled meanwhile
+        # Same question, same documents: reuse the analysis (still logged as a new query)
+        answer_key = (query, insurer)
+        cached = _answers.get(answer_key)
+        if cached is not None:
+            response, context, raw_resp = cached
+            note(answer_cache="hit")
+            query_log_writer.submit(query, copy.deepcopy(response), raw_context=context, raw_response=raw_resp)
+            return copy.deepcopy(response)
+        answer_stamp = _answers.stamp()
+
+        with stage("embedding"):
+            query_embedding = _query_embeddings.get(query)
+            if query_embedding is None:
+                query_embedding = (await asyncio.to_thread(llm_service.get_embeddings, [query]))[0]
+                _query_embeddings.put(query, query_embedding)
 
-        # Search for relevant documents with broader context
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=8,
-            # 'ids' is always returned and is not a valid include option
-            include=["documents", "metadatas"]
-        )
+        # Search for relevant documents with broader context: route to candidate
+        # documents via their summaries first, then search chunks within them.
+        # On a sharded index an insurer filter only searches that insurer's shard
+        with stage("retrieval"):
+            results = await asyncio.to_thread(
+                two_stage_query,
+                db,
+                collection,
+                query_embedding,
+                n_results=8,
+                where={"insurer": insurer} if insurer else None,
+                # 'ids' is always returned and is not a valid include option
+                include=["documents", "metadatas"]
+            )
+        note(chunk_ids=(results.get("ids") or [[]])[0])
 
         if not results["documents"] or not results["documents"][0]:
             return {
@@ -82,11 +124,15 @@ async def query_insurance(query: str, db: Session = Depends(get_db)):
             }
 
         # Build stitched context and references (plus rich details)
-        context, references, ref_details = build_context_and_refs(results, collection)
+        with stage("stitching"):
+            context, references, ref_details = build_context_and_refs(results, collection)
+        note(context_chars=len(context))
 
         # Analyze claim using LLM with optimized prompt
+        raw_resp = None
         try:
-            response = llm_service.analyze_claim(query, context, references)
+            with stage("llm"):
+                response, raw_resp = await asyncio.to_thread(llm_service.analyze_claim, query, context, references)
         except Exception as e:
             print(f"LLM analysis error: {e}")
             response = {
@@ -114,9 +160,10 @@ async def query_insurance(query: str, db: Session = Depends(get_db)):
             merged_details.append({"label": lbl, "snippet": d.get("snippet")})
         response["reference_details"] = merged_details
 
-        # Log the query and response
-        raw_resp = getattr(llm_service, "last_raw_output", None)
-        log_query(db, query, response, raw_context=context, raw_response=raw_resp)
+        # Log the query and response (write-behind; flushed in batches off the request path)
+        query_log_writer.submit(query, response, raw_context=context, raw_response=raw_resp)
+        if response.get("decision") != "error":
+            _answers.put(answer_key, (copy.deepcopy(response), context, raw_resp), stamp=answer_stamp)
 
         return response
 
@@ -1,97 +1,128 @@
-from fastapi import APIRouter, Depends, Response
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
-import json
 from datetime import datetime
-from services.db_service import get_db, get_recent_queries
-import os
+from services.db_service import get_db
+from services.report_service import (
+    ReportParams,
+    REPORT_DEFAULT_LIMIT,
+    REPORT_SYNC_MAX_ROWS,
+    build_report_file,
+    count_report_rows,
+    find_cached,
+    iter_json,
+    iter_ndjson,
+    iter_report_rows,
+    report_cache_key,
+    report_jobs,
+    media_type_for,
+)
 
 router = APIRouter()
 
+
+def parse_report_params(format: str, start: datetime | None, end: datetime | None,
+                        document_id: int | None, limit: int | None) -> ReportParams:
+    if start and end and start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    try:
+        return ReportParams(format=format, start=start, end=end, document_id=document_id, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def report_filename(params: ReportParams) -> str:
+    return f"claim_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{params.extension}"
+
+
+def job_payload(job: dict) -> dict:
+    job_id = job["job_id"]
+    return {
+        **job,
+        "status_url": f"/api/report/jobs/{job_id}",
+        "download_url": f"/api/report/jobs/{job_id}/download",
+    }
+
+
+def job_accepted(job: dict) -> JSONResponse:
+    payload = job_payload(job)
+    return JSONResponse(status_code=202, content=payload, headers={"Location": payload["status_url"]})
+
+
 @router.get("/report")
-async def generate_report(format: str = "pdf", db: Session = Depends(get_db)):
-    # Get recent queries
-    queries = get_recent_queries(db)
-    
-    if format.lower() == "json":
-        # Return JSON report
-        report_data = [{
-            "query": q.query,
-            "decision": q.decision,
-            "amount": q.amount,
-            "justification": q.justification,
-            "reference_clauses": q.reference_clauses,
-            "timestamp": q.timestamp.isoformat()
-        } for q in queries]
-        
-        return report_data
-    
-    else:  # PDF report
-        # Create reports directory if it doesn't exist
-        os.makedirs("reports", exist_ok=True)
-        
-        # Generate PDF file
-        filename = f"reports/claim_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        doc = SimpleDocTemplate(filename, pagesize=letter)
-        styles = getSampleStyleSheet()
-        
-        # Prepare content
-        content = []
-        
-        # Add title
-        content.append(Paragraph("Insurance Claims Analysis Report", styles['Title']))
-        content.append(Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal']))
-        
-        # Prepare table data
-        table_data = [["Query", "Decision", "Amount", "Justification", "Reference Clauses"]]
-        for query in queries:
-            table_data.append([
-                query.query,
-                query.decision,
-                query.amount or "N/A",
-                query.justification,
-                ", ".join(query.reference_clauses)
-            ])
-        
-        # Create table
-        table = Table(table_data, repeatRows=1)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 10),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 6),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-        ]))
-        
-        content.append(table)
-        
-        # Build PDF
-        doc.build(content)
-        
-        # Read the generated PDF
-        with open(filename, "rb") as pdf_file:
-            pdf_content = pdf_file.read()
-        
-        # Clean up file
-        os.remove(filename)
-        
-        # Return PDF
-        return Response(
-            content=pdf_content,
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename=claim_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-            }
-        )
\ No newline at end of file
+def generate_report(
+    format: str = "pdf",
+    start: datetime | None = None,
+    end: datetime | None = None,
+    document_id: int | None = None,
+    limit: int | None = Query(None, ge=1),
+    full: bool = False,
+    background: bool = False,
+    db: Session = Depends(get_db),
+):
+    """Report over queries in [start, end), newest first.
+    Without a range or limit it covers the REPORT_DEFAULT_LIMIT most recent
+    queries, as it always has; `full=true` drops that default. JSON/NDJSON
+    stream page by page. PDFs are rendered to a cache file keyed by the request
+    and the matching rows; PDFs past REPORT_SYNC_MAX_ROWS rows need
+    `background=true` (202 + job links) or POST /api/report/jobs.
+    """
+    if limit is None and start is None and end is None and not full:
+        limit = REPORT_DEFAULT_LIMIT
+    params = parse_report_params(format, start, end, document_id, limit)
+    headers = {"Content-Disposition": f"attachment; filename={report_filename(params)}"}
+
+    if params.format in ("json", "ndjson") and not background:
+        render = iter_json if params.format == "json" else iter_ndjson
+        return StreamingResponse(render(iter_report_rows(db, params)), media_type=params.media_type)
+
+    key = report_cache_key(db, params)
+    if background:
+        return job_accepted(report_jobs.submit(params, key))
+
+    cached = find_cached(key)
+    if cached:
+        return FileResponse(cached, media_type=params.media_type, headers=headers)
+
+    if count_report_rows(db, params) > REPORT_SYNC_MAX_ROWS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Report covers more than {REPORT_SYNC_MAX_ROWS} queries; narrow it or pass background=true",
+        )
+
+    path = build_report_file(db, params, key)
+    return FileResponse(path, media_type=params.media_type, headers=headers)
+
+
+@router.post("/report/jobs")
+def create_report_job(
+    format: str = "pdf",
+    start: datetime | None = None,
+    end: datetime | None = None,
+    document_id: int | None = None,
+    limit: int | None = Query(None, ge=1),
+    db: Session = Depends(get_db),
+):
+    """Build a report in the background; identical requests share one job"""
+    params = parse_report_params(format, start, end, document_id, limit)
+    return job_accepted(report_jobs.submit(params, report_cache_key(db, params)))
+
+
+@router.get("/report/jobs/{job_id}")
+def get_report_job(job_id: str):
+    job = report_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    return job_payload(job)
+
+
+@router.get("/report/jobs/{job_id}/download")
+def download_report_job(job_id: str):
+    path = find_cached(job_id)
+    if not path:
+        job = report_jobs.get(job_id)
+        if job and job["status"] in ("queued", "running"):
+            raise HTTPException(status_code=409, detail="Report is not ready yet")
+        raise HTTPException(status_code=404, detail="Report not found or expired")
+    extension = path.rsplit(".", 1)[-1]
+    return FileResponse(path, media_type=media_type_for(path), filename=f"claim_report_{job_id}.{extension}")
@@ -1,30 +1,31 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from services.retrieval_service import build_text_splitter, guess_section_name
-import chromadb
+import asyncio
+from typing import List
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+from fastapi.responses import JSONResponse
+from services.retrieval_service import process_pdf_into_chromadb
+from services.resources import get_llm_service, get_collection
+from services.index_service import get_active_index
+from services.routing_service import schedule_document_summary
+from services.bulk_ingest import (
+    BULK_MAX_FILES, create_documents, extract_zip_pdfs, ingest_jobs, is_pdf_name, upload_path,
+)
 import os
 import shutil
-from services.llm_service import LLMService
-from chromadb.config import Settings
+import zipfile
 from services.db_service import create_document, update_document, get_db
 from sqlalchemy.orm import Session
 from datetime import datetime, timezone
 import aiofiles
 
 router = APIRouter()
-llm_service = LLMService()
-
-# Initialize ChromaDB (disable anonymized telemetry to avoid PostHog atexit issues)
-client = chromadb.PersistentClient(path="./vector_db/chroma", settings=Settings(anonymized_telemetry=False))
-collection = client.get_or_create_collection(name="insurance_policies")
 
 @router.post("/process-pdf")
-async def process_pdf(file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def process_pdf(file: UploadFile = File(...), insurer: str | None = Form(None), db: Session = Depends(get_db)):
     # Validate file type
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
 
+    processed = False
     try:
         # Save uploaded file
         os.makedirs('uploads', exist_ok=True)
@@ -35,43 +36,25 @@ async def process_pdf(file: UploadFile = File(...), db: Session = Depends(get_db
             await out_file.write(content)
 
         # Create document record in DB (status=processing)
-        doc = create_document(db, name=file.filename, file_path=file_path, file_size=None, status='processing')
-
-        # Load and process PDF
-        loader = PyPDFLoader(file_path)
-        pages = loader.load()
-
-        # Split text into chunks (updated overlap)
-        text_splitter = build_text_splitter()
-        chunks = text_splitter.split_documents(pages)
-
-        # Process chunks and store in ChromaDB with metadata
-        texts = [chunk.page_content for chunk in chunks]
-        embeddings = llm_service.get_embeddings(texts)
-
-        # Add to ChromaDB with unique IDs to avoid duplicate insert errors on re-uploads
-        unique_prefix = f"doc{doc.id}_{int(datetime.now(timezone.utc).timestamp())}"
-        for i, (text, embedding, chunk) in enumerate(zip(texts, embeddings, chunks)):
-            # Build metadata without None values (Chroma rejects None in metadatas)
-            meta = {
-                "doc_id": doc.id,
-                "chunk_index": i,
-            }
-            page_num = chunk.metadata.get("page")
-            if page_num is not None:
-                meta["page_number"] = page_num
-            section = guess_section_name(text)
-            if section:
-                meta["section_name"] = section
-            collection.add(
-                documents=[text],
-                embeddings=[embedding],
-                metadatas=[meta],
-                ids=[f"{unique_prefix}_chunk_{i}"]
-            )
+        doc = create_document(db, name=file.filename, file_path=file_path, file_size=None, status='processing',
+                              insurer=(insurer or "").strip() or None)
+
+        llm_service = get_llm_service()
+        # Chunk with the active index's config so its chunks stay uniform
+        index = get_active_index(db)
+        collection = get_collection(index.collection_name, index.sharding)
+
+        # Load, split, embed and store in the vector store with metadata (in a
+        # worker thread, so queries on this worker are not blocked meanwhile)
+        await asyncio.to_thread(process_pdf_into_chromadb, file_path, doc.id, llm_service, collection,
+                                chunking=index.chunking, extra_metadata={"insurer": doc.insurer})
 
         # Update document status and processed_at
         update_document(db, doc.id, {"status": "completed", "processed_at": datetime.now(timezone.utc)})
+        # Keep the PDF: index rebuilds re-chunk from the original file
+        processed = True
+        # Summary and section centroids for two-stage retrieval are built in the background
+        schedule_document_summary(doc.id)
 
         return {"message": "File processed and embeddings stored successfully", "document": {"id": doc.id, "name": doc.name, "file_size": doc.file_size, "status": "completed", "uploaded_at": doc.uploaded_at.isoformat(), "processed_at": datetime.now(timezone.utc).isoformat()}}
 
@@ -82,8 +65,69 @@ async def process_pdf(file: UploadFile = File(...), db: Session = Depends(get_db
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         # Clean up uploaded file only if processing failed
-        if 'file_path' in locals() and os.path.exists(file_path):
+        if not processed and 'file_path' in locals() and os.path.exists(file_path):
             try:
                 os.remove(file_path)
             except Exception:
-                pass  # Ignore cleanup errors
\ No newline at end of file
+                pass  # Ignore cleanup errors
+
+
+def _save_upload(file: UploadFile) -> str:
+    path = upload_path(file.filename)
+    with open(path, "wb") as out:
+        shutil.copyfileobj(file.file, out)
+    return path
+
+
+def _remove_files(files: list):
+    for f in files:
+        try:
+            os.remove(f["path"])
+        except OSError:
+            pass
+
+
+def ingest_job_payload(job: dict) -> dict:
+    return {**job, "status_url": f"/api/ingest/jobs/{job['job_id']}"}
+
+
+@router.post("/process-pdfs")
+async def process_pdfs(files: List[UploadFile] = File(...), insurer: str | None = Form(None),
+                       db: Session = Depends(get_db)):
+    """Ingest many PDFs and/or ZIPs of PDFs in the background (202 + job link).
+    Each PDF gets its own document row; poll the job for per-file status and throughput.
+    """
+    bad = [f.filename or "(unnamed)" for f in files
+           if not (is_pdf_name(f.filename) or (f.filename or "").lower().endswith(".zip"))]
+    if bad:
+        raise HTTPException(status_code=400, detail=f"Only PDF and ZIP files are allowed: {', '.join(bad)}")
+
+    saved: list = []
+    try:
+        for f in files:
+            if is_pdf_name(f.filename):
+                path = await asyncio.to_thread(_save_upload, f)
+                saved.append({"name": os.path.basename(f.filename), "path": path})
+            else:
+                saved += await asyncio.to_thread(extract_zip_pdfs, f.file)
+            if len(saved) > BULK_MAX_FILES:
+                raise ValueError(f"At most {BULK_MAX_FILES} PDFs are allowed per batch")
+        if not saved:
+            raise ValueError("No PDF files found in the upload")
+    except (ValueError, zipfile.BadZipFile) as e:
+        _remove_files(saved)
+        raise HTTPException(status_code=400, detail=str(e))
+
+    insurer = (insurer or "").strip() or None
+    create_documents(db, saved, insurer)
+    # The job's embedding calls take ingest slots from this worker's admission scheduler
+    payload = ingest_job_payload(ingest_jobs.submit(saved, insurer, loop=asyncio.get_running_loop()))
+    return JSONResponse(status_code=202, content=payload, headers={"Location": payload["status_url"]})
+
+
+@router.get("/ingest/jobs/{job_id}")
+def get_ingest_job(job_id: str):
+    job = ingest_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingest job not found (job status is kept by the worker that accepted the upload)")
+    return ingest_job_payload(job)
@@ -0,0 +1,36 @@
+from datetime import datetime
+from typing import Any, List
+
+from pydantic import AliasChoices, BaseModel, ConfigDict, Field
+
+# ---------------------------
+# ✅ API Response Models
+# ---------------------------
+# Built straight from ORM rows (from_attributes) and serialised by
+# pydantic-core, then written out with orjson (the app's default response class).
+
+
+class DocumentOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str | None = None
+    file_size: int | None = None
+    status: str | None = None
+    uploaded_at: datetime | None = None
+    processed_at: datetime | None = None
+
+
+class QueryOut(BaseModel):
+    # document_id and amount are TEXT columns that may hold numbers
+    model_config = ConfigDict(from_attributes=True, coerce_numbers_to_str=True)
+
+    id: int
+    document_id: str | None = None
+    # Stored as QueryLog.query
+    query_text: str | None = Field(None, validation_alias=AliasChoices("query_text", "query"))
+    decision: str | None = None
+    amount: str | None = None
+    justification: str | None = None
+    reference_clauses: List[Any] | None = None
+    timestamp: datetime | None = None
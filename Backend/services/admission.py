@@ -0,0 +1,259 @@
+"""Admission control: per-workload concurrency pools with priority scheduling.
+
+Interactive queries, PDF ingestion and report generation share one worker's
+capacity (and one Gemini quota). Each request is mapped to a workload class
+with its own concurrency limit and queue depth; all classes also share
+ADMISSION_CAPACITY slots. When a slot frees up it goes to the highest-priority
+class with a waiter, so a bulk upload queues behind adjuster queries instead
+of delaying them. A request is shed with 429 when its class queue is full and
+with 503 when it waited longer than the class timeout; both carry a
+Retry-After estimated from recent service times. Background work started by
+a request (bulk ingestion) takes slots of its class from its worker thread
+through hold_slot, queueing without a limit or timeout instead of being shed.
+"""
+import asyncio
+import math
+import os
+import re
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+from fastapi.responses import ORJSONResponse
+
+from services.request_trace import current_trace
+
+# Slots shared by every workload class on this worker
+ADMISSION_CAPACITY = int(os.getenv("ADMISSION_CAPACITY", "8"))
+# Wait/service time samples kept per class for stats and Retry-After
+ADMISSION_SAMPLES = int(os.getenv("ADMISSION_SAMPLES", "500"))
+
+
+def _pool_setting(name: str, setting: str, default):
+    return type(default)(os.getenv(f"POOL_{name.upper()}_{setting}", str(default)))
+
+
+class WorkloadClass:
+    """One concurrency pool. Lower priority numbers are scheduled first."""
+
+    def __init__(self, name: str, priority: int, concurrency: int, queue_depth: int, timeout: float):
+        self.name = name
+        self.priority = priority
+        self.concurrency = _pool_setting(name, "CONCURRENCY", concurrency)
+        self.queue_depth = _pool_setting(name, "QUEUE", queue_depth)
+        self.timeout = _pool_setting(name, "TIMEOUT", timeout)
+        self.in_flight = 0
+        self.waiters: deque = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_ms: deque = deque(maxlen=ADMISSION_SAMPLES)
+        self.service_s: deque = deque(maxlen=ADMISSION_SAMPLES)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free: the queue ahead, drained at the recent service rate."""
+        if not self.service_s:
+            return 1
+        per_request = sum(self.service_s) / len(self.service_s)
+        return max(1, math.ceil(per_request * (len(self.waiters) + 1) / max(1, self.concurrency)))
+
+    def stats(self) -> Dict:
+        waits = sorted(self.wait_ms)
+        return {
+            "priority": self.priority,
+            "concurrency": self.concurrency,
+            "queue_depth": self.queue_depth,
+            "timeout_s": self.timeout,
+            "in_flight": self.in_flight,
+            "queued": len(self.waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_ms_p50": round(waits[len(waits) // 2], 2) if waits else 0.0,
+            "wait_ms_p95": round(waits[int(len(waits) * 0.95)], 2) if waits else 0.0,
+            "wait_ms_max": round(waits[-1], 2) if waits else 0.0,
+            "service_s_avg": round(sum(self.service_s) / len(self.service_s), 3) if self.service_s else 0.0,
+        }
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, workload: WorkloadClass, status_code: int, reason: str):
+        super().__init__(reason)
+        self.workload = workload
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = workload.retry_after()
+
+
+class AdmissionScheduler:
+    """Grants slots across workload classes; lives on the worker's event loop (no locking)."""
+
+    def __init__(self, classes: List[WorkloadClass], capacity: int = ADMISSION_CAPACITY):
+        self.classes = {c.name: c for c in classes}
+        self.capacity = capacity
+        self.in_flight = 0
+
+    def _can_run(self, workload: WorkloadClass) -> bool:
+        return self.in_flight < self.capacity and workload.in_flight < workload.concurrency
+
+    def _grant(self, workload: WorkloadClass):
+        self.in_flight += 1
+        workload.in_flight += 1
+        workload.admitted += 1
+
+    def _dispatch(self):
+        """Hand free slots to waiters, highest priority first."""
+        for workload in sorted(self.classes.values(), key=lambda c: c.priority):
+            while workload.waiters and self._can_run(workload):
+                waiter = workload.waiters.popleft()
+                if not waiter.done():
+                    self._grant(workload)
+                    waiter.set_result(None)
+
+    def _higher_priority_waiting(self, workload: WorkloadClass) -> bool:
+        """Someone at the same or higher priority is queued for a shared slot (not just for their own pool)."""
+        return any(c.waiters and c.in_flight < c.concurrency
+                   for c in self.classes.values() if c.priority <= workload.priority)
+
+    async def acquire(self, name: str, background: bool = False) -> float:
+        """Wait for a slot in `name`; returns the queue wait in seconds or raises AdmissionRejected.
+        Background waiters are never shed: they ignore the queue depth and timeout.
+        """
+        workload = self.classes[name]
+        if self._can_run(workload) and not self._higher_priority_waiting(workload):
+            self._grant(workload)
+            workload.wait_ms.append(0.0)
+            return 0.0
+        if not background and len(workload.waiters) >= workload.queue_depth:
+            workload.rejected += 1
+            raise AdmissionRejected(workload, 429, f"Too many queued {name} requests")
+
+        waiter = asyncio.get_running_loop().create_future()
+        workload.waiters.append(waiter)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=None if background else workload.timeout)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # Granted right as the timeout fired: keep the slot
+                pass
+            else:
+                waiter.cancel()
+                workload.waiters.remove(waiter)
+                workload.timed_out += 1
+                raise AdmissionRejected(workload, 503, f"Timed out waiting for a {name} slot")
+        except asyncio.CancelledError:
+            # Client went away while queued
+            if waiter.done() and not waiter.cancelled():
+                self.release(name, 0.0)
+            elif waiter in workload.waiters:
+                waiter.cancel()
+                workload.waiters.remove(waiter)
+            raise
+        waited = time.perf_counter() - started
+        workload.wait_ms.append(waited * 1000)
+        return waited
+
+    def release(self, name: str, service_s: float):
+        workload = self.classes[name]
+        self.in_flight -= 1
+        workload.in_flight -= 1
+        if service_s:
+            workload.service_s.append(service_s)
+        self._dispatch()
+
+    def stats(self) -> Dict:
+        return {
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "classes": {name: c.stats() for name, c in self.classes.items()},
+        }
+
+
+# ---------------------------
+# ✅ Workload Classes
+# ---------------------------
+def default_classes() -> List[WorkloadClass]:
+    return [
+        WorkloadClass("interactive", priority=0, concurrency=8, queue_depth=32, timeout=15.0),
+        WorkloadClass("report", priority=1, concurrency=2, queue_depth=8, timeout=30.0),
+        WorkloadClass("ingest", priority=2, concurrency=2, queue_depth=16, timeout=60.0),
+    ]
+
+
+# (method, path pattern, class); anything unmatched is not admission controlled
+ROUTES: List[Tuple[str, re.Pattern, str]] = [
+    ("GET", re.compile(r"^/api/query$"), "interactive"),
+    ("GET", re.compile(r"^/api/report$"), "report"),
+    ("POST", re.compile(r"^/api/process-pdfs?$"), "ingest"),
+]
+
+scheduler = AdmissionScheduler(default_classes())
+
+
+@contextmanager
+def hold_slot(name: str, loop: asyncio.AbstractEventLoop | None):
+    """Hold a `name` slot from a worker thread while the block runs.
+
+    The scheduler lives on `loop` (the event loop of the request that started
+    the work); without a running loop, e.g. from manage.py, this does nothing.
+    """
+    if loop is None or not loop.is_running():
+        yield
+        return
+    asyncio.run_coroutine_threadsafe(scheduler.acquire(name, background=True), loop).result()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        loop.call_soon_threadsafe(scheduler.release, name, time.perf_counter() - started)
+
+
+def classify(method: str, path: str) -> str | None:
+    for route_method, pattern, name in ROUTES:
+        if method == route_method and pattern.match(path):
+            return name
+    return None
+
+
+class AdmissionMiddleware:
+    """Queue or shed requests per workload class before they reach a route."""
+
+    def __init__(self, app, scheduler: AdmissionScheduler = scheduler):
+        self.app = app
+        self.scheduler = scheduler
+
+    async def __call__(self, scope, receive, send):
+        name = classify(scope.get("method", ""), scope.get("path", "")) if scope["type"] == "http" else None
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            waited = await self.scheduler.acquire(name)
+        except AdmissionRejected as e:
+            response = ORJSONResponse(
+                status_code=e.status_code,
+                content={"detail": e.reason, "workload": name, "retry_after": e.retry_after},
+                headers={"Retry-After": str(e.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        trace = current_trace()
+        if trace is not None:
+            trace.add("queue", waited)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-queue-wait-ms", f"{waited * 1000:.1f}".encode()),
+                ]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.scheduler.release(name, time.perf_counter() - started)
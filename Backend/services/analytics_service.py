@@ -0,0 +1,147 @@
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List
+
+from sqlalchemy import func
+
+from services.db_service import QueryLog, QueryRollup, ANALYTICS_ROLLUPS_ENABLED, amount_sql, parse_amount
+from services.query_archive import has_archives, iter_archived_rows
+
+GROUP_DIMENSIONS = ("decision", "document", "day")
+
+
+def _rollup_columns(dim: str):
+    return {
+        "decision": QueryRollup.decision,
+        "document": QueryRollup.document_id,
+        "day": QueryRollup.day,
+    }[dim]
+
+
+def _live_columns(dim: str):
+    return {
+        "decision": func.coalesce(QueryLog.decision, ""),
+        "document": func.coalesce(QueryLog.document_id, ""),
+        "day": func.date(QueryLog.timestamp),
+    }[dim]
+
+
+def _archived_dimension(dim: str, row):
+    if dim == "decision":
+        return row.decision or ""
+    if dim == "document":
+        return row.document_id or ""
+    return row.timestamp.date().isoformat() if row.timestamp else None
+
+
+def aggregate_archived(db, group_by: List[str], start: datetime | None, end: datetime | None,
+                       document_id: int | None) -> Dict[tuple, List]:
+    """{dims: [count, amount_total, amount_count]} over archived query rows in [start, end)."""
+    groups: Dict[tuple, List] = {}
+    for row in iter_archived_rows(db, start, end, document_id):
+        entry = groups.setdefault(tuple(_archived_dimension(d, row) for d in group_by), [0, 0.0, 0])
+        entry[0] += 1
+        amount = parse_amount(row.amount)
+        if amount is not None:
+            entry[1] += amount
+            entry[2] += 1
+    return groups
+
+
+def aggregate_queries(
+    db,
+    group_by: List[str],
+    start: date | None = None,
+    end: date | None = None,
+    document_id: int | None = None,
+    source: str = "auto",
+) -> Dict:
+    """Count queries and sum amounts over [start, end] (inclusive days), grouped by
+    any of decision/document/day. Reads the incremental rollup table unless
+    `source` is "live" or rollups are disabled; live aggregates also scan the
+    archived days in range.
+    """
+    unknown = [d for d in group_by if d not in GROUP_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown group_by dimension(s): {', '.join(unknown)}")
+    if source not in ("auto", "rollup", "live"):
+        raise ValueError(f"Unknown source: {source}")
+    use_rollup = source == "rollup" or (source == "auto" and ANALYTICS_ROLLUPS_ENABLED)
+
+    start_ts = datetime.combine(start, time.min) if start else None
+    end_ts = datetime.combine(end + timedelta(days=1), time.min) if end else None
+    if use_rollup:
+        dims = [_rollup_columns(d).label(d) for d in group_by]
+        q = db.query(
+            *dims,
+            func.sum(QueryRollup.query_count).label("count"),
+            func.sum(QueryRollup.amount_total).label("amount_total"),
+            func.sum(QueryRollup.amount_count).label("amount_count"),
+        )
+        if start:
+            q = q.filter(QueryRollup.day >= start.isoformat())
+        if end:
+            q = q.filter(QueryRollup.day <= end.isoformat())
+        if document_id is not None:
+            q = q.filter(QueryRollup.document_id == str(document_id))
+    else:
+        dims = [_live_columns(d).label(d) for d in group_by]
+        amount = amount_sql(QueryLog.amount)
+        q = db.query(
+            *dims,
+            func.count(QueryLog.id).label("count"),
+            func.coalesce(func.sum(amount), 0.0).label("amount_total"),
+            func.count(amount).label("amount_count"),
+        )
+        if start:
+            q = q.filter(QueryLog.timestamp >= start_ts)
+        if end:
+            q = q.filter(QueryLog.timestamp < end_ts)
+        if document_id is not None:
+            q = q.filter(QueryLog.document_id == str(document_id))
+
+    if dims:
+        q = q.group_by(*dims).order_by(*dims)
+
+    merged: Dict[tuple, List] = {}
+    for row in q.all():
+        data = row._asdict()
+        merged[tuple(data[d] for d in group_by)] = [
+            int(data["count"] or 0), float(data["amount_total"] or 0.0), int(data["amount_count"] or 0),
+        ]
+    # Rollups keep archived days; the live table does not
+    if not use_rollup and has_archives(db, start_ts, end_ts):
+        for key, (count, amount_total, amount_count) in aggregate_archived(db, group_by, start_ts, end_ts, document_id).items():
+            entry = merged.setdefault(key, [0, 0.0, 0])
+            entry[0] += count
+            entry[1] += amount_total
+            entry[2] += amount_count
+        merged = dict(sorted(merged.items(), key=lambda item: tuple(v or "" for v in item[0])))
+
+    groups = []
+    totals = {"count": 0, "amount_total": 0.0, "amount_count": 0}
+    for key, (count, amount_total, amount_count) in merged.items():
+        if count == 0:
+            continue
+        totals["count"] += count
+        totals["amount_total"] += amount_total
+        totals["amount_count"] += amount_count
+        data = dict(zip(group_by, key))
+        for dim in ("decision", "document"):
+            if dim in data and data[dim] == "":
+                data[dim] = None
+        data.update({
+            "count": count,
+            "amount_total": round(amount_total, 2),
+            "amount_avg": round(amount_total / amount_count, 2) if amount_count else None,
+        })
+        groups.append(data)
+    totals["amount_total"] = round(totals["amount_total"], 2)
+
+    return {
+        "source": "rollup" if use_rollup else "live",
+        "start": start.isoformat() if start else None,
+        "end": end.isoformat() if end else None,
+        "group_by": group_by,
+        "totals": totals,
+        "groups": groups,
+    }
@@ -0,0 +1,48 @@
+import hashlib
+import zlib
+
+# zstd is optional: it compresses context text faster and smaller than zlib,
+# but zlib from the standard library is always available as a fallback.
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depends on environment
+    zstandard = None
+
+ZSTD_LEVEL = 10
+ZLIB_LEVEL = 6
+
+
+def content_hash(value: str) -> str:
+    """Stable content address (sha256 hex) for a text value."""
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def default_codec() -> str:
+    return "zstd" if zstandard is not None else "zlib"
+
+
+def compress_text(value: str, codec: str | None = None) -> tuple[str, bytes]:
+    """Compress text and return (codec, payload)."""
+    codec = codec or default_codec()
+    raw = value.encode("utf-8")
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed")
+        return codec, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    if codec == "zlib":
+        return codec, zlib.compress(raw, ZLIB_LEVEL)
+    if codec == "none":
+        return codec, raw
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def decompress_text(codec: str, payload: bytes) -> str:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed blobs")
+        return zstandard.ZstdDecompressor().decompress(payload).decode("utf-8")
+    if codec == "zlib":
+        return zlib.decompress(payload).decode("utf-8")
+    if codec == "none":
+        return payload.decode("utf-8")
+    raise ValueError(f"Unknown codec: {codec}")
@@ -0,0 +1,310 @@
+"""Bulk PDF ingestion as a three-stage pipeline.
+
+Parsing (PDF load + chunking), embedding and indexing (vector store add +
+document status) each run in their own thread, connected by bounded queues of
+BULK_QUEUE_DEPTH documents. While document N is being embedded, document N+1
+is parsed and document N-1 is written to the index, so the embedding API is
+not idle while PDFs parse. The bounded queues keep at most a few parsed
+documents in memory. Every file gets its own Document row. A file that fails
+in any stage is marked failed and the rest of the batch carries on. When the
+pipeline is started from a request, each embedding batch holds an `ingest`
+admission slot, so bulk embedding queues behind interactive queries instead
+of competing with them.
+
+Uploads through POST /api/process-pdfs run as background jobs on the worker
+that accepted them (one job at a time per worker, like report jobs); job
+status lives in that worker's memory, while document rows show each file's
+status to every worker. `manage.py ingest` runs the same pipeline in the
+foreground.
+"""
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from services.admission import hold_slot
+from services.db_service import SessionLocal, Document, update_document
+from services.retrieval_service import chunk_pages, load_pdf_pages, store_chunks
+
+# Parsed/embedded documents allowed to wait between two stages
+BULK_QUEUE_DEPTH = int(os.getenv("BULK_QUEUE_DEPTH", "2"))
+# Chunk texts per embedding API call
+BULK_EMBED_BATCH = int(os.getenv("BULK_EMBED_BATCH", "100"))
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "500"))
+# Total uncompressed size of the PDFs taken from one ZIP
+BULK_MAX_ZIP_BYTES = int(os.getenv("BULK_MAX_ZIP_BYTES", str(2 * 1024 ** 3)))
+BULK_JOB_WORKERS = int(os.getenv("BULK_JOB_WORKERS", "1"))
+UPLOAD_DIR = "uploads"
+
+_DONE = object()
+
+
+# ---------------------------
+# ✅ Input Files
+# ---------------------------
+def is_pdf_name(name: str | None) -> bool:
+    return (name or "").lower().endswith(".pdf")
+
+
+def upload_path(filename: str) -> str:
+    """Where an uploaded PDF is kept; the random part keeps same-named files of concurrent batches apart."""
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    stamp = int(datetime.now(timezone.utc).timestamp())
+    return os.path.join(UPLOAD_DIR, f"{stamp}_{uuid.uuid4().hex[:12]}_{os.path.basename(filename)}")
+
+
+def extract_zip_pdfs(source) -> List[Dict]:
+    """Copy the PDFs in a ZIP (path or seekable file) into the upload directory.
+
+    Only the member's base name is used on disk, so paths inside the archive
+    cannot escape it. Returns [{"name", "path"}].
+    """
+    with zipfile.ZipFile(source) as zf:
+        members = [
+            m for m in zf.infolist()
+            if not m.is_dir() and is_pdf_name(m.filename)
+            and "__MACOSX/" not in m.filename and not os.path.basename(m.filename).startswith("._")
+        ]
+        if len(members) > BULK_MAX_FILES:
+            raise ValueError(f"ZIP holds {len(members)} PDFs; at most {BULK_MAX_FILES} are allowed per batch")
+        if sum(m.file_size for m in members) > BULK_MAX_ZIP_BYTES:
+            raise ValueError(f"ZIP expands to more than {BULK_MAX_ZIP_BYTES} bytes of PDFs")
+        files = []
+        for member in members:
+            name = os.path.basename(member.filename)
+            path = upload_path(name)
+            with zf.open(member) as src, open(path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            files.append({"name": name, "path": path})
+        return files
+
+
+def create_documents(db, files: List[Dict], insurer: str | None = None) -> List[Dict]:
+    """One `processing` Document row per file, in a single transaction; adds "doc_id" to each file."""
+    docs = [
+        Document(name=f["name"], file_path=f["path"], file_size=os.path.getsize(f["path"]), status="processing",
+                 insurer=insurer)
+        for f in files
+    ]
+    db.add_all(docs)
+    db.commit()
+    for f, doc in zip(files, docs):
+        f["doc_id"] = doc.id
+    return files
+
+
+# ---------------------------
+# ✅ Pipeline
+# ---------------------------
+def _stage(name: str, inbox: queue.Queue, outbox: queue.Queue, work: Callable[[Dict], None], busy: Dict):
+    """Run `work` on each item until the end marker; failed items pass through with their error."""
+    while True:
+        item = inbox.get()
+        if item is _DONE:
+            outbox.put(_DONE)
+            return
+        if item.get("error") is None:
+            started = time.perf_counter()
+            try:
+                work(item)
+            except Exception as e:
+                item["error"] = f"{name}: {e}"
+            busy[name] += time.perf_counter() - started
+        outbox.put(item)
+
+
+def run_ingest_pipeline(files: List[Dict], collection, llm_service, chunking: Dict | None = None,
+                        insurer: str | None = None, on_result: Callable[[Dict], None] | None = None,
+                        queue_depth: int = BULK_QUEUE_DEPTH, embed_batch: int = BULK_EMBED_BATCH,
+                        loop=None) -> Dict:
+    """Parse, embed and index `files` (dicts with name, path and doc_id) with overlapping stages.
+
+    Returns per-file results and throughput; `on_result` is called as each file finishes.
+    With `loop` (the event loop whose admission scheduler to use), every
+    embedding call holds an `ingest` slot.
+    """
+    from services.routing_service import schedule_document_summary
+
+    busy = {"parse": 0.0, "embed": 0.0, "index": 0.0}
+    to_embed: queue.Queue = queue.Queue(maxsize=max(1, queue_depth))
+    to_index: queue.Queue = queue.Queue(maxsize=max(1, queue_depth))
+
+    def parse(item):
+        pages = load_pdf_pages(item["path"])
+        item["pages"] = len(pages)
+        item["texts"], item["metadatas"] = chunk_pages(pages, item["doc_id"], chunking, {"insurer": insurer})
+        if not item["texts"]:
+            raise ValueError("no extractable text")
+
+    def embed(item):
+        texts = item["texts"]
+        embeddings = None
+        for start in range(0, len(texts), embed_batch):
+            with hold_slot("ingest", loop):
+                batch = llm_service.get_embeddings(texts[start:start + embed_batch])
+            if embeddings is None:
+                embeddings = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+            embeddings[start:start + len(batch)] = batch
+        item["embeddings"] = embeddings
+
+    inbox: queue.Queue = queue.Queue()
+    for f in files:
+        inbox.put({**f, "pages": 0, "error": None})
+    inbox.put(_DONE)
+
+    started = time.perf_counter()
+    threads = [
+        threading.Thread(target=_stage, args=("parse", inbox, to_embed, parse, busy), name="ingest-parse",
+                         daemon=True),
+        threading.Thread(target=_stage, args=("embed", to_embed, to_index, embed, busy), name="ingest-embed",
+                         daemon=True),
+    ]
+    for t in threads:
+        t.start()
+
+    results = []
+    totals = {"files": len(files), "completed": 0, "failed": 0, "pages": 0, "chunks": 0}
+    db = SessionLocal()
+    try:
+        while True:
+            item = to_index.get()
+            if item is _DONE:
+                break
+            if item["error"] is None:
+                began = time.perf_counter()
+                try:
+                    store_chunks(collection, item["doc_id"], item["texts"], item["embeddings"], item["metadatas"])
+                    update_document(db, item["doc_id"], {"status": "completed", "processed_at": datetime.now(timezone.utc)})
+                except Exception as e:
+                    db.rollback()
+                    item["error"] = f"index: {e}"
+                busy["index"] += time.perf_counter() - began
+            result = {"name": item["name"], "doc_id": item["doc_id"], "pages": item["pages"],
+                      "chunks": len(item.get("texts") or []), "status": "completed", "error": item["error"]}
+            if item["error"] is None:
+                # Summary and section centroids for two-stage retrieval are built in the background
+                schedule_document_summary(item["doc_id"])
+                totals["completed"] += 1
+                totals["pages"] += result["pages"]
+                totals["chunks"] += result["chunks"]
+            else:
+                result["status"] = "failed"
+                result["chunks"] = 0
+                totals["failed"] += 1
+                update_document(db, item["doc_id"], {"status": "failed"})
+                # Same as a failed single upload: keep nothing but the failed row
+                if os.path.exists(item["path"]):
+                    os.remove(item["path"])
+            results.append(result)
+            if on_result:
+                on_result(result)
+    finally:
+        db.close()
+    for t in threads:
+        t.join()
+
+    elapsed = time.perf_counter() - started
+    return {
+        **totals,
+        "elapsed_s": round(elapsed, 3),
+        "files_per_min": round(totals["completed"] / elapsed * 60, 2) if elapsed else None,
+        "pages_per_s": round(totals["pages"] / elapsed, 2) if elapsed else None,
+        "chunks_per_s": round(totals["chunks"] / elapsed, 2) if elapsed else None,
+        # Time each stage spent working; their sum over elapsed_s shows how much they overlapped
+        "stage_busy_s": {k: round(v, 3) for k, v in busy.items()},
+        "overlap": round(sum(busy.values()) / elapsed, 2) if elapsed else None,
+        "results": results,
+    }
+
+
+def ingest_files(db, files: List[Dict], insurer: str | None = None,
+                 on_result: Callable[[Dict], None] | None = None, loop=None) -> Dict:
+    """Run the pipeline into the active index (files must already have Document rows)."""
+    from services.index_service import get_active_index
+    from services.resources import get_collection, get_llm_service
+
+    # Chunk with the active index's config so its chunks stay uniform
+    index = get_active_index(db)
+    collection = get_collection(index.collection_name, index.sharding)
+    return run_ingest_pipeline(files, collection, get_llm_service(), chunking=index.chunking, insurer=insurer,
+                               on_result=on_result, loop=loop)
+
+
+# ---------------------------
+# ✅ Background Jobs
+# ---------------------------
+class IngestJobs:
+    """Bulk uploads run off the request path; job state lives in this worker's memory."""
+
+    def __init__(self, max_workers: int = BULK_JOB_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest-job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict] = {}
+
+    def submit(self, files: List[Dict], insurer: str | None = None, loop=None) -> Dict:
+        """Queue a job; pass the request's event loop so its embedding calls go through admission."""
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "submitted_at": datetime.utcnow().isoformat(),
+            "files": [{"name": f["name"], "doc_id": f["doc_id"], "status": "processing"} for f in files],
+            "done": 0,
+            "stats": None,
+            "error": None,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+        self._executor.submit(self._run, job_id, files, insurer, loop)
+        return self.get(job_id)
+
+    def _run(self, job_id: str, files: List[Dict], insurer: str | None, loop=None):
+        self._update(job_id, status="running", started_at=datetime.utcnow().isoformat())
+        db = SessionLocal()
+        try:
+            stats = ingest_files(db, files, insurer, on_result=lambda r: self._file_done(job_id, r), loop=loop)
+            stats.pop("results")
+            self._update(job_id, status="completed", stats=stats, finished_at=datetime.utcnow().isoformat())
+        except Exception as e:
+            print(f"[ERROR] Ingest job {job_id} failed: {e}")
+            # Nothing will pick the unfinished files up again
+            for f in files:
+                if self._file_status(job_id, f["doc_id"]) == "processing":
+                    update_document(db, f["doc_id"], {"status": "failed"})
+            self._update(job_id, status="failed", error=str(e))
+        finally:
+            db.close()
+
+    def _file_done(self, job_id: str, result: Dict):
+        with self._lock:
+            job = self._jobs[job_id]
+            for f in job["files"]:
+                if f["doc_id"] == result["doc_id"]:
+                    f.update(result)
+            job["done"] += 1
+
+    def _file_status(self, job_id: str, doc_id: int) -> str | None:
+        with self._lock:
+            return next((f["status"] for f in self._jobs[job_id]["files"] if f["doc_id"] == doc_id), None)
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def get(self, job_id: str) -> Dict | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {**job, "files": [dict(f) for f in job["files"]]}
+
+
+ingest_jobs = IngestJobs()
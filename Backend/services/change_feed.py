@@ -0,0 +1,141 @@
+"""Cross-worker cache invalidation through the table_versions counters.
+
+Every transaction that changes documents or queries bumps that table's row in
+table_versions (see db_service), and swapping the active index bumps an
+"index" row. Each worker re-reads the whole (tiny) table at most once per
+CHANGE_CHECK_INTERVAL seconds, and right after any commit of its own. A
+VersionedCache drops its entries as soon as one of the counters it depends
+on moves, so workers can cache aggressively and still see uploads, deletions
+and index swaps made by other workers within CHANGE_CHECK_INTERVAL.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Tuple
+
+from sqlalchemy import event, text
+
+from services.db_service import SessionLocal, engine
+
+# Upper bound on how long another worker's change can go unnoticed
+CHANGE_CHECK_INTERVAL = float(os.getenv("CHANGE_CHECK_INTERVAL", "1.0"))
+# Counter bumped whenever the active index (or its shard layout) changes
+INDEX_COUNTER = "index"
+
+
+class ChangeFeed:
+    def __init__(self, interval: float = CHANGE_CHECK_INTERVAL):
+        self.interval = interval
+        self._versions: Dict[str, Tuple[int, datetime | None]] = {}
+        self._checked = float("-inf")
+        self._lock = threading.Lock()
+        self.reads = 0
+
+    def versions(self) -> Dict[str, Tuple[int, datetime | None]]:
+        """{name: (version, updated_at)}, at most `interval` seconds old."""
+        if time.monotonic() - self._checked > self.interval:
+            with self._lock:
+                if time.monotonic() - self._checked > self.interval:
+                    with engine.connect() as conn:
+                        rows = conn.execute(text("SELECT name, version, updated_at FROM table_versions")).fetchall()
+                    self._versions = {
+                        name: (version, datetime.fromisoformat(updated) if isinstance(updated, str) else updated)
+                        for name, version, updated in rows
+                    }
+                    self._checked = time.monotonic()
+                    self.reads += 1
+        return self._versions
+
+    def get(self, name: str) -> Tuple[int, datetime | None]:
+        return self.versions().get(name, (0, None))
+
+    def stamp(self, names: Iterable[str]) -> Tuple[int, ...]:
+        versions = self.versions()
+        return tuple(versions.get(name, (0, None))[0] for name in names)
+
+    def mark_stale(self):
+        """Re-read the counters on next use (this worker just changed something)."""
+        self._checked = float("-inf")
+
+
+change_feed = ChangeFeed()
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _mark_stale_after_commit(session):
+    # Read-your-writes on this worker without waiting for the next interval
+    change_feed.mark_stale()
+
+
+_MISSING = object()
+
+
+class VersionedCache:
+    """Bounded LRU cache emptied whenever one of its tables' change counters moves."""
+
+    def __init__(self, tables: Iterable[str], max_entries: int = 256, feed: ChangeFeed = change_feed):
+        self.tables = tuple(tables)
+        self.max_entries = max_entries
+        self.feed = feed
+        self._entries: OrderedDict = OrderedDict()
+        self._stamp: Tuple[int, ...] | None = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def stamp(self) -> Tuple[int, ...]:
+        """Current versions of this cache's tables; empties the cache if they moved."""
+        stamp = self.feed.stamp(self.tables)
+        if stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    if self._entries:
+                        self.invalidations += 1
+                    self._entries.clear()
+                    self._stamp = stamp
+        return stamp
+
+    def get(self, key, default=None):
+        self.stamp()
+        with self._lock:
+            value = self._entries.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, stamp: Tuple[int, ...] | None = None):
+        """Store a value; pass the stamp taken before computing it so a stale result is not kept."""
+        if self.max_entries <= 0:
+            return
+        current = self.stamp()
+        if stamp is not None and stamp != current:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_set(self, key, compute: Callable[[], object]):
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        stamp = self.stamp()
+        value = compute()
+        self.put(key, value, stamp)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "invalidations": self.invalidations}
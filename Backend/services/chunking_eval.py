@@ -0,0 +1,178 @@
+import json
+import math
+import os
+import random
+import re
+from typing import Dict, List
+
+import numpy as np
+
+from services.db_service import Document
+from services.hnsw_eval import exact_neighbors
+from services.retrieval_service import (
+    chunk_pages, chunking_label, default_chunking, ends_mid_sentence, load_pdf_pages, text_hash,
+)
+
+# Configs compared when none are given on the command line
+DEFAULT_CONFIGS = [
+    {"chunk_size": 1000, "chunk_overlap": 150},
+    {"strategy": "structure", "chunk_size": 1000, "chunk_overlap": 0},
+]
+
+# Pseudo-queries are sentences of this length taken from the documents themselves
+QUERY_MIN_CHARS = 40
+QUERY_MAX_CHARS = 300
+# A hit means a retrieved chunk contains the start of the query sentence
+MATCH_PREFIX_CHARS = 60
+
+
+def parse_config(spec: str) -> Dict:
+    """Parse "strategy=structure,chunk_size=800,chunk_overlap=0"."""
+    config: Dict = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        key, _, value = part.partition("=")
+        key = key.strip()
+        if key not in ("strategy", "chunk_size", "chunk_overlap"):
+            raise ValueError(f"Unknown chunking parameter: {key}")
+        config[key] = value.strip().lower() if key == "strategy" else int(value)
+    return config
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip().lower()
+
+
+def load_document_pages(doc: Document, store, source_overlap: int) -> List:
+    """A document's pages from its PDF, or rebuilt from the active index when the file is gone."""
+    from services.index_service import reconstruct_pages
+
+    if doc.file_path and os.path.exists(doc.file_path):
+        return load_pdf_pages(doc.file_path)
+    chunks = store.get(where={"doc_id": doc.id}, include=["documents", "metadatas"])
+    return reconstruct_pages(chunks, source_overlap) if chunks.get("ids") else []
+
+
+def sample_sentences(pages_by_doc: Dict[int, List], count: int, seed: int = 0) -> List[Dict]:
+    """Random sentences from the documents, used as queries with a known answer location."""
+    candidates = []
+    for doc_id, pages in pages_by_doc.items():
+        text = re.sub(r"\s+", " ", " ".join(p.page_content for p in pages))
+        for sentence in re.split(r"(?<=[\.!?])\s+", text):
+            if QUERY_MIN_CHARS <= len(sentence) <= QUERY_MAX_CHARS:
+                candidates.append({"doc_id": doc_id, "text": sentence})
+    rng = random.Random(seed)
+    return rng.sample(candidates, min(count, len(candidates)))
+
+
+def evaluate_config(config: Dict, pages_by_doc: Dict[int, List], queries: List[Dict], query_vectors: np.ndarray,
+                    embed, k: int, batch_size: int) -> Dict:
+    """Chunk every sampled document with `config`, embed, and score the pseudo-queries."""
+    texts: List[str] = []
+    metadatas: List[Dict] = []
+    batches = 0
+    for doc_id, pages in pages_by_doc.items():
+        doc_texts, doc_metas = chunk_pages(pages, doc_id, config)
+        texts += doc_texts
+        metadatas += doc_metas
+        batches += math.ceil(len(doc_texts) / batch_size)
+    if not texts:
+        raise ValueError("No text could be chunked from the sampled documents")
+
+    vectors = np.asarray(embed(texts), dtype=np.float32)
+    chars = sum(len(t) for t in texts)
+    meta_bytes = sum(len(json.dumps(m)) for m in metadatas)
+    stored_bytes = chars + meta_bytes + vectors.nbytes
+
+    row = {
+        "label": chunking_label(config),
+        "chunks": len(texts),
+        "embedding_batches": batches,
+        "embedded_chars": chars,
+        "avg_chunk_chars": round(chars / len(texts)),
+        "index_mb": round(stored_bytes / 1e6, 3),
+        # Each of these costs an extra vector store read at query time (stitch_with_next_if_needed)
+        "mid_sentence_ends": round(sum(ends_mid_sentence(t) for t in texts) / len(texts), 4),
+    }
+    if len(queries):
+        normalized = [_normalize(t) for t in texts]
+        top = exact_neighbors(vectors, query_vectors, k, "cosine")
+        hits = 0
+        reciprocal = 0.0
+        context_chars = 0
+        for q, neighbors in zip(queries, top):
+            needle = _normalize(q["text"])[:MATCH_PREFIX_CHARS]
+            context_chars += sum(len(texts[i]) for i in neighbors)
+            for rank, i in enumerate(neighbors, start=1):
+                if metadatas[i]["doc_id"] == q["doc_id"] and needle in normalized[i]:
+                    hits += 1
+                    reciprocal += 1 / rank
+                    break
+        row[f"recall@{k}"] = round(hits / len(queries), 4)
+        row["mrr"] = round(reciprocal / len(queries), 4)
+        # Prompt size the LLM would see for k retrieved chunks, before stitching
+        row[f"context_chars@{k}"] = round(context_chars / len(queries))
+    return row
+
+
+def run_chunking_report(db, store, llm_service, configs: List[Dict], docs: int = 20, queries: int = 100,
+                        k: int = 8, seed: int = 0) -> Dict:
+    """Compare chunking configs on the most recent completed documents.
+
+    Retrieval quality is scored with sentences sampled from the documents as
+    queries: a hit is a top-k chunk from the right document that contains the
+    sentence. Embeddings already in the active index (or computed for an
+    earlier config) are reused by chunk text, so only new chunk texts are
+    embedded.
+    """
+    from services.index_service import LEGACY_CHUNKING, REBUILD_BATCH_SIZE, get_active_index
+
+    version = get_active_index(db)
+    source_overlap = (version.chunking or LEGACY_CHUNKING)["chunk_overlap"]
+    rows = (
+        db.query(Document)
+        .filter(Document.status == "completed")
+        .order_by(Document.id.desc())
+        .limit(docs)
+        .all()
+    )
+    pages_by_doc: Dict[int, List] = {}
+    for doc in rows:
+        pages = load_document_pages(doc, store, source_overlap)
+        if pages:
+            pages_by_doc[doc.id] = pages
+    if not pages_by_doc:
+        raise ValueError("No completed documents with a source PDF or indexed chunks; upload documents first.")
+
+    cache: Dict[str, List[float]] = {}
+    existing = store.get(where={"doc_id": {"$in": list(pages_by_doc)}}, include=["documents", "embeddings"])
+    if existing.get("embeddings") is not None:
+        cache = {text_hash(t): e for t, e in zip(existing.get("documents") or [], existing["embeddings"]) if t}
+    computed = {"texts": 0}
+
+    def embed(texts: List[str]) -> List:
+        missing = list(dict.fromkeys(t for t in texts if text_hash(t) not in cache))
+        for start in range(0, len(missing), REBUILD_BATCH_SIZE):
+            batch = missing[start:start + REBUILD_BATCH_SIZE]
+            for text, vector in zip(batch, llm_service.get_embeddings(batch)):
+                cache[text_hash(text)] = vector
+        computed["texts"] += len(missing)
+        return [cache[text_hash(t)] for t in texts]
+
+    sampled = sample_sentences(pages_by_doc, queries, seed)
+    query_vectors = np.zeros((0, 0), dtype=np.float32)
+    if sampled:
+        query_vectors = np.asarray(llm_service.get_embeddings([q["text"] for q in sampled]), dtype=np.float32)
+
+    results = []
+    for config in configs:
+        config = {**default_chunking(config.get("strategy", "recursive")), **config}
+        results.append(evaluate_config(config, pages_by_doc, sampled, query_vectors, embed, k, REBUILD_BATCH_SIZE))
+    return {
+        "documents": len(pages_by_doc),
+        "queries": len(sampled),
+        "k": k,
+        "embeddings_computed": computed["texts"],
+        "results": results,
+    }
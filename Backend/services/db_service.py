@@ -1,10 +1,19 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, JSON, Text, text
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import (
+    create_engine, event, Column, Integer, Float, String, DateTime, JSON, Text, LargeBinary, Index, text, and_, or_,
+    case, cast, func, not_,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
+import base64
+import math
 import os
+import re
+import threading
 from dotenv import load_dotenv
+from services.blob_store import compress_text, decompress_text, content_hash
 
 # Load environment variables
 load_dotenv()
@@ -24,6 +33,9 @@ os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 # SQLite connection URL - use forward slashes for SQLite
 DATABASE_URL = f"sqlite:///{DB_PATH.replace(os.sep, '/')}"
 
+# Maintain the query_rollups table on every logged query (used by /api/analytics)
+ANALYTICS_ROLLUPS_ENABLED = os.getenv("ANALYTICS_ROLLUPS", "1") != "0"
+
 # Base model declaration
 Base = declarative_base()
 # ---------------------------
@@ -31,6 +43,11 @@ Base = declarative_base()
 # ---------------------------
 class QueryLog(Base):
     __tablename__ = "queries"
+    __table_args__ = (
+        # Keyset pagination walks (timestamp, id) newest-first
+        Index("ix_queries_timestamp_id", "timestamp", "id"),
+        Index("ix_queries_document_timestamp_id", "document_id", "timestamp", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     document_id = Column(String, nullable=True)
@@ -39,23 +56,157 @@ class QueryLog(Base):
     amount = Column(String, nullable=True)
     justification = Column(String)
     reference_clauses = Column(JSON)
-    raw_context = Column(Text, nullable=True)
-    raw_response = Column(Text, nullable=True)
+    # Legacy inline copies; new rows reference compressed blobs by hash instead
+    raw_context_legacy = Column("raw_context", Text, nullable=True)
+    raw_response_legacy = Column("raw_response", Text, nullable=True)
+    raw_context_hash = Column(String, nullable=True)
+    raw_response_hash = Column(String, nullable=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+    context_blob = relationship(
+        "TextBlob",
+        primaryjoin="foreign(QueryLog.raw_context_hash) == TextBlob.hash",
+        viewonly=True,
+        lazy="select",
+    )
+    response_blob = relationship(
+        "TextBlob",
+        primaryjoin="foreign(QueryLog.raw_response_hash) == TextBlob.hash",
+        viewonly=True,
+        lazy="select",
+    )
+
+    @property
+    def raw_context(self) -> str | None:
+        if self.context_blob is not None:
+            return self.context_blob.text
+        return self.raw_context_legacy
+
+    @property
+    def raw_response(self) -> str | None:
+        if self.response_blob is not None:
+            return self.response_blob.text
+        return self.raw_response_legacy
+
+
+class TextBlob(Base):
+    """Compressed, content-addressed storage for large query log texts."""
+    __tablename__ = "text_blobs"
+
+    hash = Column(String, primary_key=True)
+    codec = Column(String)
+    data = Column(LargeBinary)
+    raw_size = Column(Integer)
+    stored_size = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    @property
+    def text(self) -> str:
+        return decompress_text(self.codec, self.data)
+
+
+class QueryRollup(Base):
+    """Per-day query counts and amounts, maintained incrementally as queries are logged."""
+    __tablename__ = "query_rollups"
+
+    day = Column(String, primary_key=True)
+    # '' stands in for "no document" so it can be part of the primary key
+    document_id = Column(String, primary_key=True, default="")
+    decision = Column(String, primary_key=True, default="")
+    query_count = Column(Integer, default=0)
+    amount_total = Column(Float, default=0.0)
+    amount_count = Column(Integer, default=0)
+
 
 class Document(Base):
     __tablename__ = "documents"
+    __table_args__ = (
+        Index("ix_documents_uploaded_at_id", "uploaded_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
     file_path = Column(String, nullable=True)
     file_size = Column(Integer, nullable=True)
     status = Column(String, default='processing')
+    insurer = Column(String, nullable=True)
     summary = Column(String, nullable=True)
     uploaded_at = Column(DateTime, default=datetime.utcnow)
     processed_at = Column(DateTime, nullable=True)
 
+
+class IndexVersion(Base):
+    """One vector collection built with a given chunking config.
+
+    Exactly one row is `active` and serves queries; a rebuild writes a new
+    `building` row and flips the two in a single transaction when done.
+    """
+    __tablename__ = "index_versions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    collection_name = Column(String, unique=True, nullable=True)
+    label = Column(String)
+    chunking = Column(JSON)
+    # None = one collection; else {"by": "hash"|"insurer", "shards": N, "generations": {shard: n}}
+    sharding = Column(JSON, nullable=True)
+    status = Column(String, default="building")  # building | active | retired | failed
+    docs_total = Column(Integer, default=0)
+    docs_done = Column(Integer, default=0)
+    chunks_total = Column(Integer, default=0)
+    embeddings_reused = Column(Integer, default=0)
+    embeddings_computed = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    activated_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class SnapshotRecord(Base):
+    """A snapshot this node exported or imported (see services/snapshot_service.py)."""
+    __tablename__ = "snapshots"
+
+    id = Column(Integer, primary_key=True, index=True)
+    snapshot_id = Column(String, index=True)
+    kind = Column(String)  # full | incremental
+    base_id = Column(String, nullable=True)
+    direction = Column(String)  # export | import
+    path = Column(String)
+    index_version_id = Column(Integer)
+    chunks_added = Column(Integer, default=0)
+    chunks_deleted = Column(Integer, default=0)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+
+class QueryArchive(Base):
+    """One compressed file of query log rows rolled out of the hot table (see query_archive)."""
+    __tablename__ = "query_archives"
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(String, index=True)  # YYYY-MM-DD partition
+    path = Column(String)  # relative to QUERY_ARCHIVE_DIR
+    rows = Column(Integer, default=0)
+    min_id = Column(Integer)
+    max_id = Column(Integer)
+    bytes = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class TableVersion(Base):
+    """Change counter per table, bumped inside every transaction that writes it.
+
+    Read endpoints derive ETag/Last-Modified from this single row instead of
+    scanning the table they list.
+    """
+    __tablename__ = "table_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, nullable=True)
+
+
+# Tables whose list endpoints are served with ETags
+VERSIONED_TABLES = {"documents", "queries"}
+
 # ---------------------------
 # ✅ Engine & Session
 # ---------------------------
@@ -65,6 +216,30 @@ engine = create_engine(
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def bump_table_versions(conn, tables) -> None:
+    """Increment the change counters for `tables` on the caller's connection/transaction."""
+    now = datetime.utcnow()
+    for name in tables:
+        stmt = sqlite_insert(TableVersion).values(name=name, version=1, updated_at=now)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=["name"],
+            set_={"version": TableVersion.__table__.c.version + 1, "updated_at": now},
+        ))
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _bump_versions_on_flush(session, flush_context):
+    # new/dirty/deleted still hold the pre-flush state here
+    tables = {
+        obj.__table__.name
+        for obj in (*session.new, *session.dirty, *session.deleted)
+        if getattr(obj, "__table__", None) is not None
+    } & VERSIONED_TABLES
+    if tables:
+        bump_table_versions(session.connection(), tables)
+
+
 # ---------------------------
 # ✅ Helper Functions
 # ---------------------------
@@ -78,12 +253,46 @@ def init_db():
                 conn.execute(text("ALTER TABLE queries ADD COLUMN raw_context TEXT"))
             if "raw_response" not in cols:
                 conn.execute(text("ALTER TABLE queries ADD COLUMN raw_response TEXT"))
+            if "raw_context_hash" not in cols:
+                conn.execute(text("ALTER TABLE queries ADD COLUMN raw_context_hash VARCHAR"))
+            if "raw_response_hash" not in cols:
+                conn.execute(text("ALTER TABLE queries ADD COLUMN raw_response_hash VARCHAR"))
+            doc_cols = [row[1] for row in conn.execute(text("PRAGMA table_info(documents)")).fetchall()]
+            if "insurer" not in doc_cols:
+                conn.execute(text("ALTER TABLE documents ADD COLUMN insurer VARCHAR"))
+            index_cols = [row[1] for row in conn.execute(text("PRAGMA table_info(index_versions)")).fetchall()]
+            if "sharding" not in index_cols:
+                conn.execute(text("ALTER TABLE index_versions ADD COLUMN sharding JSON"))
+            conn.commit()
     except Exception:
         # If PRAGMA/ALTER fails, proceed; inserts will fallback in helpers
         pass
+    # create_all() skips indexes on tables that already exist
+    for table in (QueryLog.__table__, Document.__table__):
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except SQLAlchemyError as e:
+                print(f"[WARN] Could not create index {index.name}: {e}")
+
+
+_db_ready = False
+_db_lock = threading.Lock()
+
+
+def ensure_db():
+    """Run init_db() once per process (from the app lifespan or the first session)."""
+    global _db_ready
+    if _db_ready:
+        return
+    with _db_lock:
+        if not _db_ready:
+            init_db()
+            _db_ready = True
 
 
 def get_db():
+    ensure_db()
     db = SessionLocal()
     try:
         yield db
@@ -93,21 +302,26 @@ def get_db():
 
 def log_query(db, query: str, response: dict, raw_context: str | None = None, raw_response: str | None = None):
     try:
+        context_hash, response_hash = put_texts(db, [raw_context, raw_response])
         query_log = QueryLog(
             query=query,
             decision=response.get("decision"),
             amount=response.get("amount"),
             justification=response.get("justification"),
             reference_clauses=response.get("reference_clauses", []),
-            raw_context=raw_context,
-            raw_response=raw_response,
+            raw_context_hash=context_hash,
+            raw_response_hash=response_hash,
         )
         db.add(query_log)
+        _record_rollup(db, query_log)
         db.commit()
         db.refresh(query_log)
         return query_log
-    except SQLAlchemyError:
+    except OperationalError as e:
         # Fallback if schema is older (without new columns)
+        db.rollback()
+        if not is_missing_column_error(e):
+            raise
         query_log = QueryLog(
             query=query,
             decision=response.get("decision"),
@@ -116,24 +330,301 @@ def log_query(db, query: str, response: dict, raw_context: str | None = None, ra
             reference_clauses=response.get("reference_clauses", []),
         )
         db.add(query_log)
+        _record_rollup(db, query_log)
         db.commit()
         db.refresh(query_log)
         return query_log
 
 
+# An amount is an optionally signed plain decimal ("1500", "-2.5", ".5") with
+# surrounding whitespace allowed; no exponents, nan/inf, separators or currency.
+# parse_amount and amount_sql implement this one rule in Python and in SQL.
+_AMOUNT_RE = re.compile(r"[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)")
+_AMOUNT_SPACE = " \t\r\n"
+_MAX_FINITE = 1.7976931348623157e308
+
+
+def parse_amount(value) -> float | None:
+    if value is None:
+        return None
+    value = str(value).strip(_AMOUNT_SPACE)
+    if not _AMOUNT_RE.fullmatch(value):
+        return None
+    amount = float(value)
+    return amount if math.isfinite(amount) else None
+
+
+def amount_sql(column):
+    """SQL equivalent of parse_amount for a string column: REAL or NULL."""
+    trimmed = func.trim(column, _AMOUNT_SPACE)
+    digits = case((trimmed.op("GLOB")("[+-]*"), func.substr(trimmed, 2)), else_=trimmed)
+    value = cast(trimmed, Float)
+    return case(
+        (and_(
+            digits != "",
+            digits != ".",
+            not_(digits.op("GLOB")("*[^0-9.]*")),
+            func.length(digits) - func.length(func.replace(digits, ".", "")) <= 1,
+            value.between(-_MAX_FINITE, _MAX_FINITE),
+        ), value),
+        else_=None,
+    )
+
+
+def record_rollups(db, rows: list):
+    """Fold logged query rows (dicts with timestamp/document_id/decision/amount)
+    into query_rollups with an upsert. Does not commit.
+    """
+    if not ANALYTICS_ROLLUPS_ENABLED or not rows:
+        return
+    deltas: dict = {}
+    for r in rows:
+        ts = r.get("timestamp") or datetime.utcnow()
+        key = (ts.date().isoformat(), r.get("document_id") or "", r.get("decision") or "")
+        count, total, amount_count = deltas.get(key, (0, 0.0, 0))
+        amount = parse_amount(r.get("amount"))
+        if amount is not None:
+            total += amount
+            amount_count += 1
+        deltas[key] = (count + 1, total, amount_count)
+    for (day, document_id, decision), (count, total, amount_count) in deltas.items():
+        stmt = sqlite_insert(QueryRollup).values(
+            day=day, document_id=document_id, decision=decision,
+            query_count=count, amount_total=total, amount_count=amount_count,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["day", "document_id", "decision"],
+            set_={
+                "query_count": QueryRollup.query_count + count,
+                "amount_total": QueryRollup.amount_total + total,
+                "amount_count": QueryRollup.amount_count + amount_count,
+            },
+        )
+        db.execute(stmt)
+
+
+def _record_rollup(db, q):
+    db.flush()  # applies the timestamp default
+    record_rollups(db, [{"timestamp": q.timestamp, "document_id": q.document_id, "decision": q.decision, "amount": q.amount}])
+
+
+def rebuild_rollups(db) -> int:
+    """Recompute query_rollups from the queries table and the query log archives. Returns rows scanned.
+    A no-op when rollups are disabled (ANALYTICS_ROLLUPS=0), so their table is left as it was.
+    """
+    from services.query_archive import iter_archived_rows
+
+    if not ANALYTICS_ROLLUPS_ENABLED:
+        return 0
+    db.query(QueryRollup).delete()
+    scanned = 0
+    last_id = 0
+    while True:
+        rows = (
+            db.query(QueryLog.id, QueryLog.timestamp, QueryLog.document_id, QueryLog.decision, QueryLog.amount)
+            .filter(QueryLog.id > last_id)
+            .order_by(QueryLog.id)
+            .limit(5000)
+            .all()
+        )
+        if not rows:
+            break
+        record_rollups(db, [r._asdict() for r in rows])
+        scanned += len(rows)
+        last_id = rows[-1].id
+    batch = []
+    for row in iter_archived_rows(db):
+        batch.append(vars(row))
+        if len(batch) >= 5000:
+            record_rollups(db, batch)
+            scanned += len(batch)
+            batch = []
+    record_rollups(db, batch)
+    scanned += len(batch)
+    db.commit()
+    return scanned
+
+
 def get_recent_queries(db, limit: int = 10):
     return db.query(QueryLog).order_by(QueryLog.timestamp.desc()).limit(limit).all()
 
 
+# ---------------------------
+# ✅ Keyset Pagination
+# ---------------------------
+# Columns needed by list views; never pulls the raw context/response
+QUERY_LIST_COLUMNS = (
+    QueryLog.id,
+    QueryLog.document_id,
+    QueryLog.query,
+    QueryLog.decision,
+    QueryLog.amount,
+    QueryLog.justification,
+    QueryLog.reference_clauses,
+    QueryLog.timestamp,
+)
+
+
+def encode_cursor(ts: datetime, row_id: int) -> str:
+    raw = f"{ts.isoformat()}|{row_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError on malformed input."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ts_str, id_str = base64.urlsafe_b64decode(padded).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(ts_str), int(id_str)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def _keyset_page(query, ts_col, id_col, limit: int, after: str | None):
+    """Apply newest-first keyset pagination; returns (rows, next_cursor)."""
+    if after:
+        ts, row_id = decode_cursor(after)
+        query = query.filter(or_(ts_col < ts, and_(ts_col == ts, id_col < row_id)))
+    rows = query.order_by(ts_col.desc(), id_col.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, ts_col.key), getattr(last, id_col.key))
+    return rows, next_cursor
+
+
+def filter_queries(q, document_id: int | None = None, start: datetime | None = None, end: datetime | None = None):
+    """Apply the common document / [start, end) time filters to a QueryLog query."""
+    if document_id is not None:
+        q = q.filter(QueryLog.document_id == str(document_id))
+    if start is not None:
+        q = q.filter(QueryLog.timestamp >= start)
+    if end is not None:
+        q = q.filter(QueryLog.timestamp < end)
+    return q
+
+
+def list_queries_page(db, limit: int = 100, after: str | None = None, document_id: int | None = None,
+                      start: datetime | None = None, end: datetime | None = None):
+    q = filter_queries(db.query(*QUERY_LIST_COLUMNS), document_id, start, end)
+    return _keyset_page(q, QueryLog.timestamp, QueryLog.id, limit, after)
+
+
+def list_documents_page(db, limit: int = 100, after: str | None = None):
+    return _keyset_page(db.query(Document), Document.uploaded_at, Document.id, limit, after)
+
+
+# ---------------------------
+# ✅ Text Blob Helpers
+# ---------------------------
+def put_texts(db, values: list) -> list:
+    """Store texts as compressed, content-addressed blobs and return their hashes.
+    Identical texts share one blob; None values map to None. Does not commit.
+
+    Every blob is written with INSERT OR IGNORE, even one that already exists,
+    so a concurrent writer storing the same text cannot raise an IntegrityError,
+    and the blob is (re)written inside the caller's transaction: an orphan-blob
+    cleanup that ran since it was last seen cannot leave the new row dangling.
+    """
+    hashes = [content_hash(v) if v is not None else None for v in values]
+    wanted = {h: v for h, v in zip(hashes, values) if h is not None}
+    if not wanted:
+        return hashes
+    now = datetime.utcnow()
+    rows = []
+    for h, v in wanted.items():
+        codec, payload = compress_text(v)
+        rows.append({"hash": h, "codec": codec, "data": payload, "raw_size": len(v.encode("utf-8")),
+                     "stored_size": len(payload), "created_at": now})
+    db.execute(sqlite_insert(TextBlob).on_conflict_do_nothing(index_elements=["hash"]), rows)
+    return hashes
+
+
+def is_missing_column_error(e: Exception) -> bool:
+    """True for the errors an older schema (no blob hash columns / text_blobs table) raises."""
+    message = str(getattr(e, "orig", e))
+    return isinstance(e, OperationalError) and (
+        "no such column" in message or "has no column named" in message or "no such table: text_blobs" in message
+    )
+
+
+def get_text(db, blob_hash: str | None) -> str | None:
+    if blob_hash is None:
+        return None
+    blob = db.query(TextBlob).filter(TextBlob.hash == blob_hash).first()
+    return blob.text if blob else None
+
+
+def migrate_raw_columns(db, batch_size: int = 500) -> int:
+    """Move legacy inline raw_context/raw_response values into text blobs.
+    Safe to re-run; returns the number of rows migrated.
+    """
+    migrated = 0
+    while True:
+        rows = (
+            db.query(QueryLog)
+            .filter((QueryLog.raw_context_legacy.isnot(None)) | (QueryLog.raw_response_legacy.isnot(None)))
+            .order_by(QueryLog.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return migrated
+        values = []
+        for r in rows:
+            values.extend([r.raw_context_legacy, r.raw_response_legacy])
+        hashes = put_texts(db, values)
+        for i, r in enumerate(rows):
+            r.raw_context_hash = r.raw_context_hash or hashes[2 * i]
+            r.raw_response_hash = r.raw_response_hash or hashes[2 * i + 1]
+            r.raw_context_legacy = None
+            r.raw_response_legacy = None
+        db.commit()
+        migrated += len(rows)
+
+
+def get_blob_stats(db) -> dict:
+    """Report how much space compression and deduplication save."""
+    blob_count, raw_bytes, stored_bytes = db.execute(text(
+        "SELECT COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(stored_size), 0) FROM text_blobs"
+    )).one()
+    # Bytes the same texts would take if every query row held its own copy
+    logical_bytes = db.execute(text(
+        "SELECT COALESCE(SUM(c.raw_size), 0) + COALESCE(SUM(r.raw_size), 0) FROM queries q "
+        "LEFT JOIN text_blobs c ON c.hash = q.raw_context_hash "
+        "LEFT JOIN text_blobs r ON r.hash = q.raw_response_hash"
+    )).scalar()
+    references = db.execute(text(
+        "SELECT COUNT(raw_context_hash) + COUNT(raw_response_hash) FROM queries"
+    )).scalar()
+    legacy_rows = db.execute(text(
+        "SELECT COUNT(*) FROM queries WHERE raw_context IS NOT NULL OR raw_response IS NOT NULL"
+    )).scalar()
+    return {
+        "blobs": blob_count,
+        "references": references,
+        "legacy_rows": legacy_rows,
+        "logical_bytes": logical_bytes,
+        "unique_bytes": raw_bytes,
+        "stored_bytes": stored_bytes,
+        "bytes_saved": logical_bytes - stored_bytes,
+        "compression_ratio": round(raw_bytes / stored_bytes, 2) if stored_bytes else None,
+        "dedup_ratio": round(logical_bytes / raw_bytes, 2) if raw_bytes else None,
+    }
+
+
 # ---------------------------
 # ✅ Document Helpers
 # ---------------------------
-def create_document(db, name: str, file_path: str = None, file_size: int = None, status: str = 'processing'):
+def create_document(db, name: str, file_path: str = None, file_size: int = None, status: str = 'processing',
+                    insurer: str | None = None):
     doc = Document(
         name=name,
         file_path=file_path,
         file_size=file_size,
         status=status,
+        insurer=insurer,
     )
     db.add(doc)
     db.commit()
@@ -175,6 +666,7 @@ def delete_document(db, doc_id: int):
 # ---------------------------
 def create_query(db, document_id: int | None, query_text: str, response: dict, raw_context: str | None = None, raw_response: str | None = None):
     try:
+        context_hash, response_hash = put_texts(db, [raw_context, raw_response])
         q = QueryLog(
             document_id=str(document_id) if document_id is not None else None,
             query=query_text,
@@ -182,14 +674,18 @@ def create_query(db, document_id: int | None, query_text: str, response: dict, r
             amount=response.get('amount'),
             justification=response.get('justification'),
             reference_clauses=response.get('reference_clauses', []),
-            raw_context=raw_context,
-            raw_response=raw_response,
+            raw_context_hash=context_hash,
+            raw_response_hash=response_hash,
         )
         db.add(q)
+        _record_rollup(db, q)
         db.commit()
         db.refresh(q)
         return q
-    except SQLAlchemyError:
+    except OperationalError as e:
+        db.rollback()
+        if not is_missing_column_error(e):
+            raise
         q = QueryLog(
             document_id=str(document_id) if document_id is not None else None,
             query=query_text,
@@ -199,10 +695,11 @@ def create_query(db, document_id: int | None, query_text: str, response: dict, r
             reference_clauses=response.get('reference_clauses', []),
         )
         db.add(q)
+        _record_rollup(db, q)
         db.commit()
         db.refresh(q)
         return q
 
 
 def get_queries_by_document(db, document_id: int):
-    return db.query(QueryLog).filter(QueryLog.document_id == str(document_id)).order_by(QueryLog.timestamp.desc()).all()
+    return db.query(*QUERY_LIST_COLUMNS).filter(QueryLog.document_id == str(document_id)).order_by(QueryLog.timestamp.desc(), QueryLog.id.desc()).all()
@@ -0,0 +1,132 @@
+import shutil
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+from sqlalchemy import func
+
+from services.db_service import QueryLog
+
+# Parameter sets tried when none are given on the command line
+DEFAULT_PARAM_SETS = [
+    {"max_neighbors": 16, "ef_construction": 100, "ef_search": 10},
+    {"max_neighbors": 16, "ef_construction": 100, "ef_search": 50},
+    {"max_neighbors": 16, "ef_construction": 100, "ef_search": 100},
+    {"max_neighbors": 32, "ef_construction": 200, "ef_search": 100},
+    {"max_neighbors": 32, "ef_construction": 200, "ef_search": 200},
+]
+
+PARAM_ALIASES = {"m": "max_neighbors", "M": "max_neighbors", "efc": "ef_construction", "ef": "ef_search"}
+
+
+def parse_param_set(spec: str) -> Dict:
+    """Parse "space=cosine,M=16,ef_construction=200,ef_search=50"."""
+    params: Dict = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        key, _, value = part.partition("=")
+        key = PARAM_ALIASES.get(key.strip(), key.strip())
+        if key not in ("space", "max_neighbors", "ef_construction", "ef_search"):
+            raise ValueError(f"Unknown HNSW parameter: {key}")
+        params[key] = value.strip() if key == "space" else int(value)
+    return params
+
+
+def sample_logged_queries(db, limit: int) -> List[str]:
+    """Most recent distinct query texts from the query log."""
+    rows = (
+        db.query(QueryLog.query)
+        .filter(QueryLog.query.isnot(None))
+        .group_by(QueryLog.query)
+        .order_by(func.max(QueryLog.id).desc())
+        .limit(limit)
+        .all()
+    )
+    return [r[0] for r in rows if r[0] and r[0].strip()]
+
+
+def exact_neighbors(corpus: np.ndarray, queries: np.ndarray, k: int, space: str) -> np.ndarray:
+    """Brute-force ground truth under the given HNSW distance."""
+    corpus = corpus.astype(np.float32)
+    queries = queries.astype(np.float32)
+    if space == "cosine":
+        corpus = corpus / np.maximum(np.linalg.norm(corpus, axis=1, keepdims=True), 1e-12)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scores = queries @ corpus.T
+    elif space == "ip":
+        scores = queries @ corpus.T
+    else:
+        # Ranking by -||q - c||^2 == 2 q.c - ||c||^2 (||q||^2 is constant per query)
+        scores = 2 * (queries @ corpus.T) - (corpus * corpus).sum(axis=1)[None, :]
+    k = min(k, corpus.shape[0])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def evaluate_param_set(ids: List[str], corpus: np.ndarray, queries: np.ndarray, params: Dict, k: int,
+                       batch_size: int = 1000) -> Dict:
+    """Build a throwaway Chroma collection with `params` and measure recall@k and latency."""
+    import chromadb
+    from chromadb.config import Settings
+
+    space = params.get("space", "l2")
+    truth = exact_neighbors(corpus, queries, k, space)
+    truth_ids = [{ids[i] for i in row} for row in truth]
+
+    work_dir = tempfile.mkdtemp(prefix="hnsw_eval_")
+    try:
+        client = chromadb.PersistentClient(path=work_dir, settings=Settings(anonymized_telemetry=False))
+        collection = client.create_collection(name="hnsw_eval", configuration={"hnsw": params}, embedding_function=None)
+        started = time.perf_counter()
+        for start in range(0, len(ids), batch_size):
+            collection.add(ids=ids[start:start + batch_size], embeddings=corpus[start:start + batch_size])
+        build_s = time.perf_counter() - started
+
+        collection.query(query_embeddings=queries[:1], n_results=k, include=[])  # warm-up
+        latencies = []
+        hits = 0
+        for i, q in enumerate(queries):
+            t0 = time.perf_counter()
+            result = collection.query(query_embeddings=q[None, :], n_results=k, include=[])
+            latencies.append(time.perf_counter() - t0)
+            hits += len(set(result["ids"][0]) & truth_ids[i])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    lat_ms = np.array(latencies) * 1000
+    return {
+        "space": space, **params,
+        "build_s": round(build_s, 3),
+        "p50_ms": round(float(np.percentile(lat_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(lat_ms, 95)), 3),
+        f"recall@{k}": round(hits / sum(len(t) for t in truth_ids), 4),
+    }
+
+
+def run_hnsw_eval(db, store, llm_service, param_sets: List[Dict], sample: int = 200, k: int = 8,
+                  seed: int = 0) -> Dict:
+    """Evaluate HNSW parameter sets against the current corpus and logged queries."""
+    data = store.get(include=["embeddings"])
+    ids = list(data["ids"])
+    if not ids:
+        raise ValueError("The vector store is empty; upload documents first.")
+    corpus = np.asarray(data["embeddings"], dtype=np.float32)
+
+    texts = sample_logged_queries(db, sample)
+    query_source = "query_log"
+    if texts:
+        queries = np.asarray(llm_service.get_embeddings(texts), dtype=np.float32)
+    else:
+        # No logged queries yet: perturbed stored chunks stand in for real queries
+        print("[WARN] No logged queries found; using perturbed stored chunk vectors as queries.")
+        rng = np.random.default_rng(seed)
+        picks = rng.choice(len(corpus), size=min(sample, len(corpus)), replace=False)
+        scale = float(np.std(corpus)) * 0.3
+        queries = corpus[picks] + rng.normal(scale=scale, size=(len(picks), corpus.shape[1])).astype(np.float32)
+        query_source = "synthetic"
+
+    results = [evaluate_param_set(ids, corpus, queries, params, k) for params in param_sets]
+    return {"corpus_size": len(ids), "queries": len(queries), "query_source": query_source, "k": k, "results": results}
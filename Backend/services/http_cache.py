@@ -0,0 +1,45 @@
+import hashlib
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response
+
+from services.change_feed import change_feed
+
+
+def cache_headers(request: Request, table: str) -> dict:
+    """ETag/Last-Modified for a read endpoint, from the table's change counter.
+    The counters come from this worker's change feed, so other workers' writes
+    show up within CHANGE_CHECK_INTERVAL and most requests skip the lookup.
+    """
+    version, updated_at = change_feed.get(table)
+    # The URL is part of the tag: each page/filter of a list is its own representation
+    digest = hashlib.sha1(f"{request.url.path}?{request.url.query}".encode()).hexdigest()[:12]
+    headers = {"ETag": f'W/"{table}-{version}-{digest}"', "Cache-Control": "no-cache"}
+    if updated_at is not None:
+        headers["Last-Modified"] = format_datetime(updated_at.replace(tzinfo=timezone.utc), usegmt=True)
+    return headers
+
+
+def is_not_modified(request: Request, headers: dict) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison: W/"x" and "x" match
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return "*" in tags or headers["ETag"].removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and "Last-Modified" in headers:
+        try:
+            return parsedate_to_datetime(headers["Last-Modified"]) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def conditional_get(request: Request, response: Response, table: str) -> Response | None:
+    """Set caching headers; return a 304 response when the client's copy is current."""
+    headers = cache_headers(request, table)
+    if is_not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
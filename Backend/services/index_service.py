@@ -0,0 +1,383 @@
+"""Versioned vector indexes with blue/green rebuilds.
+
+Every chunking config lives in its own collection, tracked by an
+IndexVersion row. A rebuild re-chunks all completed documents into a fresh
+collection while queries keep hitting the active one, then flips the two
+rows in one transaction. Uploads already running at the swap may still write
+to the old collection, so syncing carries on until every one of them has
+finished. Chunks whose text did not change keep their
+embedding from the old collection; only new text is embedded, in small
+throttled batches so live traffic still gets the embedding API and CPU.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from services.change_feed import CHANGE_CHECK_INTERVAL, INDEX_COUNTER
+from services.db_service import SessionLocal, Document, IndexVersion, bump_table_versions
+from services.retrieval_service import (
+    SECTION_HEURISTIC_VERSION, chunk_pages, chunking_label, default_chunking, load_pdf_pages, text_hash,
+)
+from services.routing_service import routing_collection_name, summarize_document
+from services.sharded_vector_store import sharding_config, shard_collection_name, shard_key_for
+
+# Chunks embedded per API call during a rebuild, and the pause between calls
+REBUILD_BATCH_SIZE = int(os.getenv("REBUILD_BATCH_SIZE", "64"))
+REBUILD_PAUSE = float(os.getenv("REBUILD_PAUSE", "0.1"))
+# Longest wait after a swap for uploads that started on the old index (rows stuck in `processing` are given up on)
+REBUILD_CATCHUP_TIMEOUT = float(os.getenv("REBUILD_CATCHUP_TIMEOUT", "1800"))
+
+# How the original collection was built, before index versions existed
+LEGACY_CHUNKING = {"chunk_size": 1000, "chunk_overlap": 150, "section_heuristic": SECTION_HEURISTIC_VERSION}
+
+
+def get_active_index(db) -> IndexVersion:
+    """The index version serving queries (the legacy collection on first use)."""
+    version = db.query(IndexVersion).filter(IndexVersion.status == "active").order_by(IndexVersion.id.desc()).first()
+    if version is not None:
+        return version
+    from services.resources import COLLECTION_NAME
+    version = IndexVersion(
+        collection_name=COLLECTION_NAME,
+        label=chunking_label(LEGACY_CHUNKING),
+        chunking=LEGACY_CHUNKING,
+        status="active",
+        activated_at=datetime.utcnow(),
+    )
+    db.add(version)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another worker bootstrapped it first
+        db.rollback()
+        return db.query(IndexVersion).filter(IndexVersion.status == "active").order_by(IndexVersion.id.desc()).first()
+    db.refresh(version)
+    return version
+
+
+def version_to_dict(version: IndexVersion) -> Dict:
+    return {
+        "id": version.id,
+        "collection_name": version.collection_name,
+        "label": version.label,
+        "chunking": version.chunking,
+        "sharding": version.sharding,
+        "status": version.status,
+        "progress": {
+            "docs_total": version.docs_total or 0,
+            "docs_done": version.docs_done or 0,
+            "chunks_total": version.chunks_total or 0,
+            "embeddings_reused": version.embeddings_reused or 0,
+            "embeddings_computed": version.embeddings_computed or 0,
+        },
+        "error": version.error,
+        "created_at": version.created_at.isoformat() if version.created_at else None,
+        "activated_at": version.activated_at.isoformat() if version.activated_at else None,
+        "finished_at": version.finished_at.isoformat() if version.finished_at else None,
+    }
+
+
+def list_index_versions(db) -> List[IndexVersion]:
+    get_active_index(db)
+    return db.query(IndexVersion).order_by(IndexVersion.id.desc()).all()
+
+
+def create_index_version(db, chunking: Dict | None = None) -> IndexVersion:
+    """Register a new `building` version; only one rebuild may run at a time."""
+    get_active_index(db)
+    if db.query(IndexVersion).filter(IndexVersion.status == "building").first():
+        raise ValueError("An index rebuild is already running (drop it with `manage.py drop-index` if it crashed)")
+    chunking = {k: v for k, v in (chunking or {}).items() if v is not None}
+    chunking = {**default_chunking(chunking.get("strategy")), **chunking}
+    if chunking.get("strategy") == "recursive":
+        del chunking["strategy"]
+    if chunking["chunk_overlap"] >= chunking["chunk_size"]:
+        raise ValueError("chunk_overlap must be smaller than chunk_size")
+    from services.resources import COLLECTION_NAME
+    version = IndexVersion(label=chunking_label(chunking), chunking=chunking, sharding=sharding_config(),
+                           status="building")
+    db.add(version)
+    db.flush()
+    version.collection_name = f"{COLLECTION_NAME}_v{version.id}"
+    db.commit()
+    db.refresh(version)
+    return version
+
+
+def start_rebuild(db, chunking: Dict | None = None) -> IndexVersion:
+    """Create a version and build it on a background thread."""
+    version = create_index_version(db, chunking)
+    threading.Thread(target=run_rebuild, args=(version.id,), name=f"index-rebuild-{version.id}", daemon=True).start()
+    return version
+
+
+def reconstruct_pages(chunks: Dict, max_overlap: int) -> List:
+    """Rebuild page text from stored chunks when the source PDF is gone.
+
+    Consecutive chunks of a page are joined, dropping the text they overlap by.
+    """
+    from langchain_core.documents import Document as PageDocument
+
+    rows = sorted(
+        zip(chunks.get("documents") or [], chunks.get("metadatas") or []),
+        key=lambda r: ((r[1] or {}).get("page_number", -1), (r[1] or {}).get("chunk_index", 0)),
+    )
+    pages: Dict = {}
+    for text, meta in rows:
+        page = (meta or {}).get("page_number")
+        if page not in pages:
+            pages[page] = text or ""
+            continue
+        merged = pages[page]
+        for k in range(min(len(merged), len(text or ""), max_overlap), 0, -1):
+            if merged.endswith(text[:k]):
+                merged += text[k:]
+                break
+        else:
+            merged += "\n" + (text or "")
+        pages[page] = merged
+    return [PageDocument(page_content=text, metadata={} if page is None else {"page": page})
+            for page, text in pages.items()]
+
+
+def rebuild_document(doc: Document, source, target, llm_service, version: IndexVersion,
+                     source_overlap: int = LEGACY_CHUNKING["chunk_overlap"]) -> Dict:
+    """Re-chunk one document into `target`, reusing `source` embeddings by chunk text."""
+    old = source.get(where={"doc_id": doc.id}, include=["documents", "metadatas", "embeddings"])
+    old_embeddings = old.get("embeddings")
+    cache = {}
+    if old_embeddings is not None:
+        cache = {text_hash(t): e for t, e in zip(old.get("documents") or [], old_embeddings) if t is not None}
+
+    if doc.file_path and os.path.exists(doc.file_path):
+        pages = load_pdf_pages(doc.file_path)
+    elif old.get("ids"):
+        pages = reconstruct_pages(old, source_overlap)
+    else:
+        print(f"[WARN] Document {doc.id} has neither a source PDF nor indexed chunks; skipping")
+        return {"chunks": 0, "reused": 0, "computed": 0}
+
+    texts, metadatas = chunk_pages(pages, doc.id, version.chunking, {"insurer": doc.insurer})
+    if not texts:
+        return {"chunks": 0, "reused": 0, "computed": 0}
+
+    embeddings: List = [cache.get(text_hash(t)) for t in texts]
+    missing = [i for i, e in enumerate(embeddings) if e is None]
+    for start in range(0, len(missing), REBUILD_BATCH_SIZE):
+        batch = missing[start:start + REBUILD_BATCH_SIZE]
+        for i, vector in zip(batch, llm_service.get_embeddings([texts[i] for i in batch])):
+            embeddings[i] = vector
+        # Leave room for live queries between embedding calls
+        time.sleep(REBUILD_PAUSE)
+
+    target.add(
+        ids=[f"doc{doc.id}_v{version.id}_chunk_{i}" for i in range(len(texts))],
+        embeddings=np.asarray(embeddings, dtype=np.float32),
+        documents=texts,
+        metadatas=metadatas,
+    )
+    return {"chunks": len(texts), "reused": len(texts) - len(missing), "computed": len(missing)}
+
+
+def _index_missing(docs: List[Document], source, target, version: IndexVersion, source_overlap: int,
+                   routing=None, on_progress=None) -> Dict:
+    """Rebuild each of `docs` not yet present in `target`; returns summed stats.
+    With a routing store, each rebuilt document's summary and section centroids are refreshed too.
+    """
+    from services.resources import get_llm_service
+
+    llm_service = get_llm_service()
+    totals = {"docs": 0, "chunks": 0, "reused": 0, "computed": 0}
+    for done, doc in enumerate(docs, start=1):
+        stats = None
+        # Uploads after the swap may already have written this document here
+        if not target.get(where={"doc_id": doc.id}, include=[], limit=1).get("ids"):
+            stats = rebuild_document(doc, source, target, llm_service, version, source_overlap)
+            if routing is not None and stats["chunks"]:
+                doc.summary = summarize_document(doc, target, routing)
+            totals["docs"] += 1 if stats["chunks"] else 0
+            for key in ("chunks", "reused", "computed"):
+                totals[key] += stats[key]
+        if on_progress:
+            on_progress(done, stats)
+    return totals
+
+
+def sync_documents(db, version: IndexVersion, source_version: IndexVersion) -> int:
+    """Index every completed document missing from `version`; returns how many were added."""
+    from services.resources import get_collection
+
+    source = get_collection(source_version.collection_name, source_version.sharding)
+    source_overlap = (source_version.chunking or LEGACY_CHUNKING)["chunk_overlap"]
+    target = get_collection(version.collection_name, version.sharding)
+    docs = db.query(Document).filter(Document.status == "completed").order_by(Document.id).all()
+    version.docs_total = len(docs)
+    db.commit()
+
+    def on_progress(done, stats):
+        if stats:
+            version.chunks_total = (version.chunks_total or 0) + stats["chunks"]
+            version.embeddings_reused = (version.embeddings_reused or 0) + stats["reused"]
+            version.embeddings_computed = (version.embeddings_computed or 0) + stats["computed"]
+        version.docs_done = done
+        db.commit()
+
+    routing = get_collection(routing_collection_name(version.collection_name))
+    return _index_missing(docs, source, target, version, source_overlap, routing, on_progress)["docs"]
+
+
+def _catch_up(db, sync: Callable[[], None], in_scope: Callable[[Document], bool] = lambda doc: True) -> None:
+    """After a swap, re-run `sync` until no upload that may have used the old collection is still processing.
+
+    Workers notice the swap within CHANGE_CHECK_INTERVAL, so only documents
+    created by then can be writing to the old collection. Each round checks for
+    them before syncing, so the last sync sees all of them finished.
+    """
+    time.sleep(CHANGE_CHECK_INTERVAL + 1)
+    cutoff = db.query(func.max(Document.id)).scalar() or 0
+    deadline = time.monotonic() + REBUILD_CATCHUP_TIMEOUT
+    while True:
+        pending = [doc.id for doc in db.query(Document).filter(Document.status == "processing", Document.id <= cutoff)
+                   if in_scope(doc)]
+        sync()
+        if not pending:
+            return
+        if time.monotonic() > deadline:
+            print(f"[WARN] Gave up waiting for uploads still processing after an index swap: {pending}")
+            return
+        time.sleep(CHANGE_CHECK_INTERVAL)
+
+
+def rebuild_shard(db, shard_key: str) -> Dict:
+    """Rebuild one shard of the active index into a new generation and swap it in.
+
+    The other shards keep serving and taking uploads untouched, so one hot
+    insurer can be re-indexed without rebuilding everything.
+    """
+    from services.resources import forget_collection, get_chroma_client, get_collection, invalidate_active_index
+    from services.vector_store import VECTOR_STORE_BACKEND, drop_vector_store
+
+    version = get_active_index(db)
+    sharding = version.sharding
+    if not sharding:
+        raise ValueError("The active index is not sharded (set SHARD_BY and run rebuild-index)")
+    if sharding["by"] == "hash" and shard_key not in {f"s{i}" for i in range(sharding["shards"])}:
+        raise ValueError(f"Unknown shard {shard_key}; expected s0..s{sharding['shards'] - 1}")
+
+    generation = (sharding.get("generations") or {}).get(shard_key, 0) + 1
+    next_sharding = {**sharding, "generations": {**(sharding.get("generations") or {}), shard_key: generation}}
+    old_name = shard_collection_name(version.collection_name, sharding, shard_key)
+    source = get_collection(old_name)
+    target = get_collection(shard_collection_name(version.collection_name, next_sharding, shard_key))
+    overlap = (version.chunking or LEGACY_CHUNKING)["chunk_overlap"]
+    routing = get_collection(routing_collection_name(version.collection_name))
+
+    def in_shard(doc):
+        return shard_key_for(sharding, doc_id=doc.id, insurer=doc.insurer) == shard_key
+
+    def shard_docs():
+        docs = db.query(Document).filter(Document.status == "completed").order_by(Document.id).all()
+        return [d for d in docs if in_shard(d)]
+
+    started = time.perf_counter()
+    totals = _index_missing(shard_docs(), source, target, version, overlap, routing)
+    # Swap in the new generation; re-read first so concurrent shard swaps are kept
+    db.refresh(version)
+    version.sharding = {**version.sharding,
+                        "generations": {**(version.sharding.get("generations") or {}), shard_key: generation}}
+    bump_table_versions(db.connection(), {INDEX_COUNTER})
+    db.commit()
+    invalidate_active_index()
+
+    def sync():
+        late = _index_missing(shard_docs(), source, target, version, overlap, routing)
+        for key in totals:
+            totals[key] += late[key]
+
+    # Uploads still embedding into the old generation must land before it is dropped
+    _catch_up(db, sync, in_shard)
+    client = get_chroma_client() if VECTOR_STORE_BACKEND == "chroma" else None
+    drop_vector_store(old_name, client=client)
+    forget_collection(old_name)
+    return {"shard": shard_key, "generation": generation, "seconds": round(time.perf_counter() - started, 2), **totals}
+
+
+def activate_index(db, version_id: int) -> IndexVersion:
+    """Make `version_id` the active index and retire the previous one, atomically."""
+    from services.resources import invalidate_active_index
+
+    version = db.get(IndexVersion, version_id)
+    if version is None:
+        raise ValueError(f"Unknown index version {version_id}")
+    if version.status == "failed":
+        raise ValueError(f"Index version {version_id} failed to build and cannot be activated")
+    now = datetime.utcnow()
+    db.query(IndexVersion).filter(IndexVersion.status == "active", IndexVersion.id != version_id).update(
+        {"status": "retired"}, synchronize_session=False
+    )
+    version.status = "active"
+    version.activated_at = now
+    version.finished_at = version.finished_at or now
+    # Tells every worker to re-read the active index (services/change_feed.py)
+    bump_table_versions(db.connection(), {INDEX_COUNTER})
+    db.commit()
+    invalidate_active_index()
+    return version
+
+
+def run_rebuild(version_id: int) -> None:
+    """Build `version_id` from the active index, swap it in, then catch up uploads that used the old one."""
+    db = SessionLocal()
+    try:
+        version = db.get(IndexVersion, version_id)
+        source = get_active_index(db)
+        started = time.perf_counter()
+        # Repeat until a pass finds nothing new, so uploads made during the build are included
+        while sync_documents(db, version, source):
+            pass
+        activate_index(db, version.id)
+        # Uploads that picked the old index before the swap finish into it
+        _catch_up(db, lambda: sync_documents(db, version, source))
+        print(f"[INFO] Index {version.label} (v{version.id}) active after {time.perf_counter() - started:.1f}s: "
+              f"{version.chunks_total} chunks, {version.embeddings_reused} embeddings reused, "
+              f"{version.embeddings_computed} computed")
+    except Exception as e:
+        db.rollback()
+        version = db.get(IndexVersion, version_id)
+        if version is not None and version.status == "building":
+            version.status = "failed"
+            version.error = str(e)
+            version.finished_at = datetime.utcnow()
+            db.commit()
+        print(f"[ERROR] Index rebuild v{version_id} failed: {e}")
+    finally:
+        db.close()
+
+
+def drop_index_version(db, version_id: int) -> None:
+    """Delete a retired/failed/stalled version and its collection."""
+    from services.resources import get_chroma_client, get_collection, forget_collection
+    from services.vector_store import VECTOR_STORE_BACKEND, drop_vector_store
+
+    version = db.get(IndexVersion, version_id)
+    if version is None:
+        raise ValueError(f"Unknown index version {version_id}")
+    if version.status == "active":
+        raise ValueError("Cannot drop the active index; activate another version first")
+    names = [version.collection_name]
+    if version.sharding:
+        names = get_collection(version.collection_name, version.sharding).collection_names()
+    names.append(routing_collection_name(version.collection_name))
+    client = get_chroma_client() if VECTOR_STORE_BACKEND == "chroma" else None
+    for name in names:
+        drop_vector_store(name, client=client)
+        forget_collection(name)
+    forget_collection(version.collection_name)
+    db.delete(version)
+    db.commit()
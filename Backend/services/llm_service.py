@@ -1,14 +1,13 @@
 import os
 import json
 import re
-import random
+import numpy as np
 from dotenv import load_dotenv
-from typing import List, Dict
+from typing import List, Dict, Tuple
+from services.request_trace import note
 
-# Gemini and LangChain imports
-import google.generativeai as genai
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_google_genai.embeddings import GoogleGenerativeAIEmbeddings
+# Gemini and LangChain clients are imported lazily (see configure_gemini and
+# LLMService.__init__): they add seconds to import time and are not needed in mock mode.
 
 # --------------------------
 # ENVIRONMENT SETUP
@@ -20,15 +19,42 @@ if not GEMINI_API_KEY or GEMINI_API_KEY == "your_gemini_api_key_here":
     print("[WARN] GEMINI_API_KEY not found or not configured. Using mock mode.")
     GEMINI_API_KEY = "mock_key"
 
-try:
-    if GEMINI_API_KEY != "mock_key":
-        genai.configure(api_key=GEMINI_API_KEY)
-        print("[INFO] Gemini API configured successfully.")
-    else:
-        print("[INFO] Running in mock mode (no real Gemini API calls).")
-except Exception as e:
-    print(f"[ERROR] Failed to configure Gemini API: {e}")
-    GEMINI_API_KEY = "mock_key"
+_gemini_configured = False
+
+EMBEDDING_DIM = 768
+# Texts per embed_documents call: bounds how many Python float lists exist at once
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+
+
+def mock_embeddings(count: int) -> np.ndarray:
+    return np.random.default_rng().random((count, EMBEDDING_DIM), dtype=np.float32)
+
+
+def configure_gemini():
+    """Configure the google.generativeai SDK once, on first LLMService creation."""
+    global GEMINI_API_KEY, _gemini_configured
+    if _gemini_configured:
+        return
+    _gemini_configured = True
+    try:
+        if GEMINI_API_KEY != "mock_key":
+            import google.generativeai as genai
+            genai.configure(api_key=GEMINI_API_KEY)
+            print("[INFO] Gemini API configured successfully.")
+        else:
+            print("[INFO] Running in mock mode (no real Gemini API calls).")
+    except Exception as e:
+        print(f"[ERROR] Failed to configure Gemini API: {e}")
+        GEMINI_API_KEY = "mock_key"
+
+
+def build_chat_model():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(
+        model="gemini-pro-latest",
+        google_api_key=GEMINI_API_KEY,
+        temperature=0.2,
+    )
 
 
 # --------------------------
@@ -37,18 +63,15 @@ except Exception as e:
 class LLMService:
     def __init__(self):
         """Initialize the LLM and embedding model with fallback to mock mode."""
+        configure_gemini()
         self.is_mock = GEMINI_API_KEY == "mock_key"
-        self.last_raw_output = None
 
         if not self.is_mock:
             try:
                 print("[INFO] Initializing Gemini LLM and Embedding models...")
+                from langchain_google_genai.embeddings import GoogleGenerativeAIEmbeddings
                 # ✅ Use ChatGoogleGenerativeAI instead of GoogleGenerativeAI
-                self.llm = ChatGoogleGenerativeAI(
-                    model="gemini-pro-latest",
-                    google_api_key=GEMINI_API_KEY,
-                    temperature=0.2,
-                )
+                self.llm = build_chat_model()
                 self.embedding_model = GoogleGenerativeAIEmbeddings(
                     model="models/embedding-001",
                     google_api_key=GEMINI_API_KEY,
@@ -68,39 +91,46 @@ class LLMService:
     # --------------------------
     # EMBEDDING GENERATION
     # --------------------------
-    def get_embeddings(self, texts: List[str]):
-        """Generate embeddings for a list of texts."""
+    def get_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Generate embeddings for a list of texts as one (len(texts), dim) float32 array."""
         if self.is_mock:
             print("[MOCK] Returning random mock embeddings.")
-            return [[random.random() for _ in range(768)] for _ in texts]
+            return mock_embeddings(len(texts))
 
         try:
             print(f"[INFO] Generating embeddings for {len(texts)} texts...")
-            embeddings = self.embedding_model.embed_documents(texts)
+            embeddings = None
+            # The client returns lists of Python floats; copy each batch into the
+            # array right away so only one batch of them is alive at a time
+            for start in range(0, len(texts), EMBED_BATCH_SIZE):
+                batch = np.asarray(self.embedding_model.embed_documents(texts[start:start + EMBED_BATCH_SIZE]),
+                                   dtype=np.float32)
+                if embeddings is None:
+                    embeddings = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+                embeddings[start:start + len(batch)] = batch
             print("[INFO] Embeddings generated successfully.")
-            return embeddings
+            return embeddings if embeddings is not None else np.empty((0, EMBEDDING_DIM), dtype=np.float32)
         except Exception as e:
             print(f"[ERROR] Embedding failed: {e}")
             print("[WARN] Switching to mock mode for embeddings.")
             self.is_mock = True
-            return [[random.random() for _ in range(768)] for _ in texts]
+            return mock_embeddings(len(texts))
 
     # --------------------------
     # CLAIM ANALYSIS
     # --------------------------
-    def analyze_claim(self, query: str, retrieved_context: str, derived_references: List[str] | None = None) -> Dict:
+    def analyze_claim(self, query: str, retrieved_context: str,
+                      derived_references: List[str] | None = None) -> Tuple[Dict, str | None]:
         """Analyze the insurance claim using optimized RAG prompt.
         - retrieved_context: concatenated context from top retrieved chunks
         - derived_references: metadata-derived references (section/page)
+        Returns (result, raw model output or None). The raw text is returned rather
+        than kept on the shared service, since concurrent queries call this at once.
         """
         if self.llm is None and not self.is_mock:
             print("[WARN] LLM not initialized, attempting to reinitialize...")
             try:
-                self.llm = ChatGoogleGenerativeAI(
-                    model="gemini-pro-latest",
-                    google_api_key=GEMINI_API_KEY,
-                    temperature=0.2,
-                )
+                self.llm = build_chat_model()
             except Exception as e:
                 print(f"[ERROR] Failed to reinitialize LLM: {e}")
                 self.is_mock = True
@@ -112,7 +142,7 @@ class LLMService:
                 "amount": "1000.00",
                 "justification": "Mock analysis - external LLM unavailable; fallback response.",
                 "reference_clauses": ["clause_1", "clause_2"],
-            }
+            }, None
 
         if derived_references is None:
             derived_references = []
@@ -138,7 +168,9 @@ class LLMService:
         }}
         """
 
+        note(prompt_chars=len(prompt))
         print("[INFO] Sending claim analysis prompt to Gemini...")
+        raw_output = None
         try:
             response = self.llm.invoke(prompt)
             # Robustly extract text from LangChain AIMessage or raw strings
@@ -165,8 +197,8 @@ class LLMService:
                 response_text = response if isinstance(response, str) else str(response)
 
             print("[INFO] Raw response received from Gemini.")
-            # cache raw output for logging/debugging
-            self.last_raw_output = response_text
+            # raw output goes to the query log for debugging
+            raw_output = response_text
 
             # Extract JSON safely
             match = re.search(r"\{.*\}", response_text, re.DOTALL)
@@ -185,7 +217,7 @@ class LLMService:
 
         except json.JSONDecodeError as e:
             print(f"[ERROR] Failed to parse JSON: {e}")
-            self.last_raw_output = None
+            raw_output = None
             result = {
                 "decision": "rejected",
                 "amount": None,
@@ -197,7 +229,7 @@ class LLMService:
             print(f"[ERROR] Claim analysis failed: {e}")
             print("[WARN] Switching to mock mode for fallback.")
             self.is_mock = True
-            self.last_raw_output = None
+            raw_output = None
             result = {
                 "decision": "approved",
                 "amount": "1000.00",
@@ -221,4 +253,4 @@ class LLMService:
         result["amount"] = str(result.get("amount")) if result.get("amount") else None
 
         print(f"[INFO] Final decision: {result['decision']}")
-        return result
+        return result, raw_output
@@ -0,0 +1,529 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from services.vector_store import VectorStore, empty_query_result
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+# ---------------------------
+# ✅ Configuration
+# ---------------------------
+NUMPY_STORE_PATH = os.getenv("NUMPY_STORE_PATH", "./vector_db/numpy")
+# float16 halves memory vs float32 with negligible recall loss; int8 quarters it
+NUMPY_STORE_DTYPE = os.getenv("NUMPY_STORE_DTYPE", "float16")
+NUMPY_IVF_NPROBE = int(os.getenv("NUMPY_IVF_NPROBE", "8"))
+# Below this many rows exact search is fast enough, so IVF is neither built nor used.
+# Past it the IVF index is trained automatically and retrained when the row count doubles.
+NUMPY_IVF_MIN_ROWS = int(os.getenv("NUMPY_IVF_MIN_ROWS", "10000"))
+SEARCH_BLOCK_ROWS = 32768
+MIN_CAPACITY = 1024
+
+HEADER_FILE = "header.json"
+VECTORS_FILE = "vectors.bin"
+SCALES_FILE = "scales.bin"
+LISTS_FILE = "lists.bin"
+CENTROIDS_FILE = "centroids.npy"
+RECORDS_FILE = "records.jsonl"
+LOCK_FILE = ".lock"
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _match(value, condition) -> bool:
+    if isinstance(condition, dict):
+        for op, target in condition.items():
+            if op == "$eq" and not value == target:
+                return False
+            if op == "$ne" and not value != target:
+                return False
+            if op == "$in" and value not in target:
+                return False
+            if op == "$nin" and value in target:
+                return False
+            if op in ("$gt", "$gte", "$lt", "$lte"):
+                if value is None:
+                    return False
+                if op == "$gt" and not value > target:
+                    return False
+                if op == "$gte" and not value >= target:
+                    return False
+                if op == "$lt" and not value < target:
+                    return False
+                if op == "$lte" and not value <= target:
+                    return False
+        return True
+    return value == condition
+
+
+class MmapVectorStore(VectorStore):
+    """Exact/IVF cosine search over quantized vectors in a memory-mapped file.
+
+    Vectors are L2-normalised and stored as float16 (or int8 with a per-row
+    scale) in `vectors.bin`; ids, documents and metadatas live in an
+    append-only `records.jsonl` sidecar. The file is mapped MAP_SHARED, so
+    every worker process reads the same page-cache pages (zero copy), and
+    other processes' writes are picked up when `header.json` changes.
+    """
+
+    def __init__(self, path: str, name: str = "", dtype: str = NUMPY_STORE_DTYPE, dim: int | None = None):
+        if dtype not in ("float16", "int8", "float32"):
+            raise ValueError(f"Unsupported dtype: {dtype}")
+        self.path = path
+        self.name = name or os.path.basename(path)
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._header_stamp = None
+        self._records_offset = 0
+        self._vectors = None
+        self._scales = None
+        self._lists = None
+        self._centroids = None
+        self._mapped_ivf = None
+        self.ids: List[str] = []
+        self.documents: List[str | None] = []
+        self.metadatas: List[Dict] = []
+        self.id_to_row: Dict[str, int] = {}
+        self._deleted = np.zeros(0, dtype=bool)
+        self._columns: Dict[str, Tuple[np.ndarray, Dict]] = {}
+        self._ivf_cache = None
+        if not os.path.exists(self._file(HEADER_FILE)):
+            self.header = {"dim": dim, "dtype": dtype, "count": 0, "capacity": 0, "version": 0, "ivf": None,
+                           "records_bytes": 0}
+            self._write_header()
+        self._reload()
+
+    # ---------------------------
+    # ✅ Files & Locking
+    # ---------------------------
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @contextmanager
+    def _write_lock(self):
+        """Serialise writers across threads and processes."""
+        with self._lock:
+            handle = open(self._file(LOCK_FILE), "a+")
+            try:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_EX)
+                self._reload()
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+                handle.close()
+
+    def _append_records(self, lines: List[str]):
+        """Append sidecar records after dropping any uncommitted tail, then commit."""
+        with open(self._file(RECORDS_FILE), "ab") as f:
+            f.truncate(self.header.get("records_bytes", 0))
+            f.seek(0, os.SEEK_END)
+            f.write("".join(lines).encode("utf-8"))
+            f.flush()
+            self.header["records_bytes"] = f.tell()
+
+    def _write_header(self):
+        tmp = self._file(HEADER_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.header, f)
+        os.replace(tmp, self._file(HEADER_FILE))
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(self.header["dtype"])
+
+    def _map(self):
+        capacity, dim = self.header["capacity"], self.header["dim"]
+        if not capacity or not dim:
+            self._vectors = self._scales = self._lists = None
+            return
+        self._vectors = np.memmap(self._file(VECTORS_FILE), dtype=self.dtype, mode="r+", shape=(capacity, dim))
+        if self.dtype == np.int8:
+            self._scales = np.memmap(self._file(SCALES_FILE), dtype=np.float32, mode="r+", shape=(capacity,))
+        self._lists = np.memmap(self._file(LISTS_FILE), dtype=np.int32, mode="r+", shape=(capacity,))
+        centroids = self._file(CENTROIDS_FILE)
+        self._centroids = np.load(centroids) if self.header.get("ivf") and os.path.exists(centroids) else None
+        # A copy, so header changes made in place (build_ivf) still count as a change
+        self._mapped_ivf = dict(self.header["ivf"]) if self.header.get("ivf") else None
+
+    def _reload(self):
+        """Pick up changes made by this or another process since the last call."""
+        try:
+            st = os.stat(self._file(HEADER_FILE))
+        except FileNotFoundError:
+            return
+        stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if stamp == self._header_stamp:
+            return
+        with open(self._file(HEADER_FILE)) as f:
+            header = json.load(f)
+        previous = getattr(self, "header", None)
+        self.header = header
+        if self._vectors is None or previous is None or previous.get("capacity") != header["capacity"] \
+                or self._mapped_ivf != header.get("ivf"):
+            self._map()
+        self._read_records()
+        self._header_stamp = stamp
+
+    def _read_records(self):
+        records_path = self._file(RECORDS_FILE)
+        if not os.path.exists(records_path):
+            return
+        count = self.header["count"]
+        if len(self._deleted) < count:
+            self._deleted = np.concatenate([self._deleted, np.zeros(count - len(self._deleted), dtype=bool)])
+        # Only read what the header has committed; anything after it belongs to
+        # an in-flight (or crashed) writer
+        committed = self.header.get("records_bytes", 0)
+        with open(records_path, "rb") as f:
+            f.seek(self._records_offset)
+            for line in f:
+                if self._records_offset + len(line) > committed:
+                    break
+                self._records_offset += len(line)
+                record = json.loads(line)
+                if "deleted" in record:
+                    for row in record["deleted"]:
+                        self._deleted[row] = True
+                        self.id_to_row.pop(self.ids[row], None)
+                    continue
+                self.id_to_row[record["id"]] = len(self.ids)
+                self.ids.append(record["id"])
+                self.documents.append(record.get("document"))
+                self.metadatas.append(record.get("metadata") or {})
+
+    def _ensure_capacity(self, needed: int, dim: int):
+        if self.header["dim"] is None:
+            self.header["dim"] = dim
+        elif self.header["dim"] != dim:
+            raise ValueError(f"Embedding dimension {dim} does not match collection dimension {self.header['dim']}")
+        capacity = self.header["capacity"]
+        if needed <= capacity:
+            return
+        new_capacity = max(MIN_CAPACITY, capacity * 2, needed)
+        self._vectors = self._scales = self._lists = None
+        for name, itemsize in ((VECTORS_FILE, self.dtype.itemsize * dim), (SCALES_FILE, 4), (LISTS_FILE, 4)):
+            if name == SCALES_FILE and self.dtype != np.int8:
+                continue
+            with open(self._file(name), "ab") as f:
+                f.truncate(new_capacity * itemsize)
+        self.header["capacity"] = new_capacity
+        self._map()
+        if capacity < new_capacity:
+            self._lists[capacity:new_capacity] = -1
+
+    # ---------------------------
+    # ✅ Encoding
+    # ---------------------------
+    def _encode(self, unit: np.ndarray):
+        if self.dtype == np.int8:
+            scales = np.abs(unit).max(axis=1)
+            scales[scales == 0] = 1.0
+            return np.round(unit / scales[:, None] * 127).astype(np.int8), (scales / 127).astype(np.float32)
+        return unit.astype(self.dtype), None
+
+    def _decode(self, start: int, end: int) -> np.ndarray:
+        block = np.asarray(self._vectors[start:end], dtype=np.float32)
+        if self.dtype == np.int8:
+            block *= self._scales[start:end, None]
+        return block
+
+    def _decode_rows(self, rows: np.ndarray) -> np.ndarray:
+        block = np.asarray(self._vectors[rows], dtype=np.float32)
+        if self.dtype == np.int8:
+            block *= self._scales[rows, None]
+        return block
+
+    # ---------------------------
+    # ✅ Writes
+    # ---------------------------
+    def add(self, ids, embeddings, documents=None, metadatas=None):
+        ids = list(ids)
+        if not ids:
+            return
+        unit = normalize_rows(embeddings)
+        if len(unit) != len(ids):
+            raise ValueError("ids and embeddings must have the same length")
+        with self._write_lock():
+            keep = [i for i, cid in enumerate(ids) if cid not in self.id_to_row]
+            if len(keep) < len(ids):
+                print(f"[WARN] Skipping {len(ids) - len(keep)} ids that already exist in {self.name}.")
+            if not keep:
+                return
+            unit = unit[keep]
+            start = self.header["count"]
+            end = start + len(keep)
+            self._ensure_capacity(end, unit.shape[1])
+            encoded, scales = self._encode(unit)
+            self._vectors[start:end] = encoded
+            if scales is not None:
+                self._scales[start:end] = scales
+            if self._centroids is not None:
+                self._lists[start:end] = np.argmax(unit @ self._centroids.T, axis=1)
+            self._vectors.flush()
+            self._append_records([
+                json.dumps({
+                    "id": ids[i],
+                    "document": documents[i] if documents is not None else None,
+                    "metadata": metadatas[i] if metadatas is not None else {},
+                }) + "\n"
+                for i in keep
+            ])
+            self.header["count"] = end
+            self.header["version"] += 1
+            self._write_header()
+            self._header_stamp = None
+        self._reload()
+        ivf = self.header.get("ivf")
+        if end >= NUMPY_IVF_MIN_ROWS and (not ivf or end >= 2 * ivf.get("trained_rows", 0)):
+            self.build_ivf()
+
+    def delete(self, ids=None, where=None):
+        rows = self._select_rows(ids, where)
+        if len(rows) == 0:
+            return
+        with self._write_lock():
+            rows = [int(r) for r in rows if not self._deleted[r]]
+            if not rows:
+                return
+            self._append_records([json.dumps({"deleted": rows}) + "\n"])
+            self.header["version"] += 1
+            self._write_header()
+            self._header_stamp = None
+        self._reload()
+
+    def build_ivf(self, nlist: int | None = None, iterations: int = 10, sample_size: int = 50000, seed: int = 0):
+        """Train spherical k-means centroids and assign every row to its nearest list."""
+        with self._write_lock():
+            count = self.header["count"]
+            if count == 0:
+                return
+            nlist = nlist or max(1, int(4 * np.sqrt(count)))
+            rng = np.random.default_rng(seed)
+            sample_rows = np.sort(rng.choice(count, size=min(sample_size, count), replace=False))
+            sample = self._decode_rows(sample_rows)
+            nlist = min(nlist, len(sample))
+            centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+            for _ in range(iterations):
+                assign = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assign, sample)
+                empty = np.bincount(assign, minlength=nlist) == 0
+                sums[empty] = centroids[empty]
+                centroids = normalize_rows(sums)
+            for start in range(0, count, SEARCH_BLOCK_ROWS):
+                end = min(count, start + SEARCH_BLOCK_ROWS)
+                self._lists[start:end] = np.argmax(self._decode(start, end) @ centroids.T, axis=1)
+            self._lists.flush()
+            self._centroids = centroids.astype(np.float32)
+            np.save(self._file(CENTROIDS_FILE), self._centroids)
+            self.header["ivf"] = {"nlist": int(nlist), "trained_rows": int(count)}
+            self.header["version"] += 1
+            self._write_header()
+            self._header_stamp = None
+        self._reload()
+
+    # ---------------------------
+    # ✅ Reads
+    # ---------------------------
+    def count(self) -> int:
+        with self._lock:
+            self._reload()
+            return int(self.header["count"] - self._deleted[: self.header["count"]].sum())
+
+    def _column(self, key: str) -> Tuple[np.ndarray, Dict]:
+        """`key` for every row as int codes into a value -> code dict, so filters run as array ops.
+
+        Records are only ever appended, so a cached column is extended with the new rows.
+        """
+        codes, lookup = self._columns.get(key) or (np.zeros(0, dtype=np.int32), {})
+        if len(codes) < len(self.metadatas):
+            new = np.fromiter((lookup.setdefault(m.get(key), len(lookup)) for m in self.metadatas[len(codes):]),
+                              dtype=np.int32, count=len(self.metadatas) - len(codes))
+            codes = np.concatenate([codes, new])
+            self._columns[key] = (codes, lookup)
+        return codes, lookup
+
+    def _where_mask(self, where: Dict | None) -> np.ndarray:
+        count = self.header["count"]
+        mask = ~self._deleted[:count]
+        if not where:
+            return mask
+        return mask & self._eval_where(where, count)
+
+    def _eval_where(self, where: Dict, count: int) -> np.ndarray:
+        result = np.ones(count, dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for sub in condition:
+                    result &= self._eval_where(sub, count)
+            elif key == "$or":
+                any_mask = np.zeros(count, dtype=bool)
+                for sub in condition:
+                    any_mask |= self._eval_where(sub, count)
+                result &= any_mask
+            else:
+                codes, lookup = self._column(key)
+                codes = codes[:count]
+                if not isinstance(condition, dict) or set(condition) == {"$eq"}:
+                    target = condition["$eq"] if isinstance(condition, dict) else condition
+                    code = lookup.get(target)
+                    result &= (codes == code) if code is not None else False
+                elif set(condition) == {"$in"}:
+                    result &= np.isin(codes, [lookup[v] for v in condition["$in"] if v in lookup])
+                else:
+                    # Other operators are evaluated once per distinct value, then looked up per row
+                    matches = np.fromiter((_match(v, condition) for v in lookup), dtype=bool, count=len(lookup))
+                    result &= matches[codes]
+        return result
+
+    def _select_rows(self, ids=None, where=None) -> np.ndarray:
+        with self._lock:
+            self._reload()
+            mask = self._where_mask(where)
+            if ids is not None:
+                rows = np.array([self.id_to_row[i] for i in ids if i in self.id_to_row], dtype=np.int64)
+                return rows[mask[rows]] if len(rows) else rows
+            return np.nonzero(mask)[0]
+
+    def _result_rows(self, rows, include) -> Dict:
+        result = {"ids": [self.ids[r] for r in rows]}
+        if "documents" in include:
+            result["documents"] = [self.documents[r] for r in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self.metadatas[r] for r in rows]
+        if "embeddings" in include:
+            result["embeddings"] = self._decode_rows(np.asarray(rows, dtype=np.int64)) if len(rows) else np.zeros((0, self.header["dim"] or 0), np.float32)
+        return result
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None):
+        rows = self._select_rows(ids, where)
+        if limit is not None:
+            rows = rows[:limit]
+        with self._lock:
+            return self._result_rows([int(r) for r in rows], include)
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("documents", "metadatas", "distances")):
+        queries = normalize_rows(query_embeddings)
+        with self._lock:
+            self._reload()
+            count = self.header["count"]
+            if count == 0:
+                return empty_query_result(len(queries), include)
+            mask = self._where_mask(where)
+            k = min(n_results, int(mask.sum()))
+            if k == 0:
+                return empty_query_result(len(queries), include)
+            use_ivf = self._centroids is not None and count >= NUMPY_IVF_MIN_ROWS
+            if use_ivf and mask.sum() <= count * NUMPY_IVF_NPROBE / len(self._centroids):
+                # A filter this selective leaves fewer rows than the probed lists hold: scan them all
+                top_rows, top_scores = self._search_rows(queries, np.nonzero(mask)[0], k)
+            elif use_ivf:
+                top_rows, top_scores = self._search_ivf(queries, mask, k)
+            else:
+                top_rows, top_scores = self._search_exact(queries, mask, k)
+
+            result: Dict[str, List] = {"ids": []}
+            for key in include:
+                result[key] = []
+            for q in range(len(queries)):
+                valid = np.isfinite(top_scores[q])
+                rows = [int(r) for r in top_rows[q][valid]]
+                part = self._result_rows(rows, include)
+                result["ids"].append(part["ids"])
+                for key in ("documents", "metadatas", "embeddings"):
+                    if key in include:
+                        result[key].append(part[key])
+                if "distances" in include:
+                    result["distances"].append([float(1.0 - s) for s in top_scores[q][valid]])
+            return result
+
+    def _search_exact(self, queries: np.ndarray, mask: np.ndarray, k: int):
+        """Blocked brute-force search; keeps a running top-k per query."""
+        count = len(mask)
+        best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), k), dtype=np.int64)
+        for start in range(0, count, SEARCH_BLOCK_ROWS):
+            end = min(count, start + SEARCH_BLOCK_ROWS)
+            block_mask = mask[start:end]
+            if not block_mask.any():
+                continue
+            scores = queries @ self._decode(start, end).T
+            scores[:, ~block_mask] = -np.inf
+            best_scores, best_rows = self._merge_topk(best_scores, best_rows, scores, start, k)
+        return self._sorted(best_rows, best_scores)
+
+    def _search_rows(self, queries: np.ndarray, rows: np.ndarray, k: int):
+        """Exact search over just `rows`."""
+        scores = (self._decode_rows(rows) @ queries.T).T
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        return self._sorted(rows[idx], np.take_along_axis(scores, idx, axis=1))
+
+    def _inverted_lists(self):
+        """Rows grouped by IVF list (cached per header version)."""
+        version = self.header["version"]
+        if self._ivf_cache is None or self._ivf_cache[0] != version:
+            count = self.header["count"]
+            lists = np.asarray(self._lists[:count])
+            order = np.argsort(lists, kind="stable")
+            # bounds[j + 1]..bounds[j + 2] holds list j; bounds[0]..bounds[1] the unassigned (-1) rows
+            bounds = np.searchsorted(lists[order], np.arange(-1, len(self._centroids) + 1))
+            bounds = np.append(bounds, count)
+            self._ivf_cache = (version, order, bounds)
+        return self._ivf_cache[1], self._ivf_cache[2]
+
+    def _search_ivf(self, queries: np.ndarray, mask: np.ndarray, k: int):
+        nlist = len(self._centroids)
+        probes = np.argsort(-(queries @ self._centroids.T), axis=1)
+        order, bounds = self._inverted_lists()
+        best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), k), dtype=np.int64)
+        for q in range(len(queries)):
+            nprobe = min(NUMPY_IVF_NPROBE, nlist)
+            while True:
+                # Rows with no list yet (-1) are always scanned so nothing is lost
+                parts = [order[bounds[0]:bounds[1]]] + [order[bounds[j + 1]:bounds[j + 2]] for j in probes[q, :nprobe]]
+                candidates = np.sort(np.concatenate(parts))
+                candidates = candidates[mask[candidates]]
+                # A filter can leave fewer than k rows in the probed lists: probe more
+                if len(candidates) >= k or nprobe >= nlist:
+                    break
+                nprobe = min(2 * nprobe, nlist)
+            if len(candidates) == 0:
+                continue
+            scores = self._decode_rows(candidates) @ queries[q]
+            take = min(k, len(scores))
+            idx = np.argpartition(-scores, take - 1)[:take]
+            best_scores[q, :take] = scores[idx]
+            best_rows[q, :take] = candidates[idx]
+        return self._sorted(best_rows, best_scores)
+
+    @staticmethod
+    def _merge_topk(best_scores, best_rows, scores, offset, k):
+        take = min(k, scores.shape[1])
+        idx = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+        cand_scores = np.take_along_axis(scores, idx, axis=1)
+        all_scores = np.concatenate([best_scores, cand_scores], axis=1)
+        all_rows = np.concatenate([best_rows, idx + offset], axis=1)
+        keep = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+        return np.take_along_axis(all_scores, keep, axis=1), np.take_along_axis(all_rows, keep, axis=1)
+
+    @staticmethod
+    def _sorted(rows, scores):
+        order = np.argsort(-scores, axis=1)
+        return np.take_along_axis(rows, order, axis=1), np.take_along_axis(scores, order, axis=1)
@@ -0,0 +1,211 @@
+"""Opt-in request profiling and the slow-request log.
+
+Every /api request gets a RequestTrace (stage timings plus facts noted by the
+route). Requests slower than SLOW_REQUEST_MS land in a bounded in-memory ring
+buffer. An admin can also ask for a cProfile run of a single request with
+`X-Profile: 1` or `?profile=1` plus the `X-Admin-Token` header; the profile is
+saved under PROFILES_DIR and its id returned in the `X-Profile-Id` header.
+cProfile follows the event-loop thread, where async route bodies run. It
+therefore also records every other request that interleaves on the loop
+while the profiled one is awaiting (counted in `overlapping_requests`), and
+work handed to threads (sync routes, the Gemini and vector store calls of
+/api/query via asyncio.to_thread) shows up mostly as time spent waiting, so
+rely on their stage timings instead. Both caveats are returned with every
+stored profile.
+"""
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, List
+from urllib.parse import parse_qs
+
+from sqlalchemy import event
+
+from services.db_service import engine
+from services.request_trace import RequestTrace, current_trace, end_trace, start_trace
+
+# Unset ADMIN_TOKEN disables profiling and the admin endpoints entirely
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILES_DIR = os.getenv("PROFILES_DIR", "./profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "2000"))
+SLOW_REQUEST_BUFFER = int(os.getenv("SLOW_REQUEST_BUFFER", "200"))
+
+PROFILE_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+slow_requests: deque = deque(maxlen=SLOW_REQUEST_BUFFER)
+_slow_lock = threading.Lock()
+# cProfile hooks the whole thread, so only one request is profiled at a time
+_profile_lock = threading.Lock()
+PROFILE_CAVEAT = (
+    "cProfile ran on the event-loop thread: it includes other requests interleaved on the loop "
+    "(overlapping_requests) and leaves out work this request ran in threads (asyncio.to_thread, "
+    "sync routes); use the stage timings for those."
+)
+
+
+def is_admin_token(token: str | None) -> bool:
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+# ---------------------------
+# ✅ SQLite time per request
+# ---------------------------
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_trace() is not None:
+        conn.info.setdefault("trace_started", []).append(time.perf_counter())
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = current_trace()
+    started = conn.info.get("trace_started")
+    if trace is not None and started:
+        trace.add("sqlite", time.perf_counter() - started.pop())
+
+
+# ---------------------------
+# ✅ Stored Profiles
+# ---------------------------
+def profile_path(profile_id: str, ext: str = "prof") -> str | None:
+    if not PROFILE_ID_RE.match(profile_id or ""):
+        return None
+    return os.path.join(PROFILES_DIR, f"{profile_id}.{ext}")
+
+
+def save_profile(profile_id: str, profiler: cProfile.Profile, trace: RequestTrace, overlapping: int = 0):
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+    profiler.dump_stats(profile_path(profile_id))
+    with open(profile_path(profile_id, "json"), "w") as f:
+        json.dump({"id": profile_id, **trace.to_dict(), "overlapping_requests": overlapping,
+                   "caveat": PROFILE_CAVEAT}, f)
+    prune_profiles()
+
+
+def prune_profiles(keep: int = PROFILE_KEEP):
+    metas = sorted(
+        (os.path.join(PROFILES_DIR, name) for name in os.listdir(PROFILES_DIR) if name.endswith(".json")),
+        key=os.path.getmtime, reverse=True,
+    )
+    for meta in metas[keep:]:
+        for path in (meta, meta[:-len(".json")] + ".prof"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def list_profiles() -> List[Dict]:
+    if not os.path.isdir(PROFILES_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILES_DIR):
+        if name.endswith(".json"):
+            try:
+                with open(os.path.join(PROFILES_DIR, name)) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return sorted(profiles, key=lambda p: p.get("started_at", ""), reverse=True)
+
+
+def profile_text(profile_id: str, sort: str = "cumulative", limit: int = 40) -> str | None:
+    path = profile_path(profile_id)
+    if not path or not os.path.exists(path):
+        return None
+    out = io.StringIO()
+    try:
+        with open(profile_path(profile_id, "json")) as f:
+            overlapping = json.load(f).get("overlapping_requests")
+    except (OSError, ValueError):
+        overlapping = None
+    out.write(f"Note: {PROFILE_CAVEAT}\n")
+    if overlapping is not None:
+        out.write(f"Other requests in flight during this profile: {overlapping}\n")
+    pstats.Stats(path, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+def get_slow_requests(limit: int | None = None) -> List[Dict]:
+    with _slow_lock:
+        entries = list(slow_requests)
+    entries.reverse()
+    return entries[:limit] if limit else entries
+
+
+# ---------------------------
+# ✅ ASGI Middleware
+# ---------------------------
+def _wants_profile(scope, headers: Dict[bytes, bytes]) -> bool:
+    if headers.get(b"x-profile", b"").lower() in (b"1", b"true"):
+        return True
+    flags = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("profile", [])
+    return any(v.lower() in ("1", "true") for v in flags)
+
+
+class RequestProfilingMiddleware:
+    """Trace every /api request; cProfile it when an admin asks."""
+
+    def __init__(self, app):
+        self.app = app
+        # /api requests in flight and started so far on this worker's loop,
+        # to count how many interleaved with a profiled request
+        self.active = 0
+        self.started = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        trace = RequestTrace(scope["method"], scope["path"], scope.get("query_string", b"").decode("latin-1"))
+        token = start_trace(trace)
+        status = {"code": None}
+
+        profiler = None
+        profile_id = None
+        if _wants_profile(scope, headers) and is_admin_token(headers.get(b"x-admin-token", b"").decode("latin-1")):
+            if _profile_lock.acquire(blocking=False):
+                profile_id = uuid.uuid4().hex
+                profiler = cProfile.Profile()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if profile_id:
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        self.active += 1
+        self.started += 1
+        already_running, started_before = self.active - 1, self.started
+        try:
+            if profiler is not None:
+                profiler.enable()
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.active -= 1
+            if profiler is not None:
+                profiler.disable()
+                _profile_lock.release()
+            end_trace(token)
+            trace.finish(status["code"])
+            if profiler is not None:
+                try:
+                    save_profile(profile_id, profiler, trace, already_running + self.started - started_before)
+                except OSError as e:
+                    print(f"[WARN] Could not save profile {profile_id}: {e}")
+            if trace.total_ms >= SLOW_REQUEST_MS:
+                with _slow_lock:
+                    slow_requests.append(trace.to_dict())
@@ -0,0 +1,295 @@
+"""Query log retention: roll old `queries` rows out into compressed archive files.
+
+Rows older than QUERY_RETENTION_DAYS (whole UTC days) are written to
+QUERY_ARCHIVE_DIR/day=YYYY-MM-DD/queries-<first id>-<last id>.jsonl.gz with
+their raw context and response inlined, recorded in the query_archives table
+and deleted from the hot table in the same transaction; text blobs no longer
+referenced by any hot row go with them. Readers only trust recorded files, so
+a run that dies after writing a file but before committing leaves the rows in
+the hot table and the next run simply rewrites the file.
+
+Reports and live analytics read archived days through iter_archived_rows when
+their date range reaches back that far. The analytics rollups keep counting
+archived days (rebuild_rollups folds the archives back in). Snapshots carry
+the catalog and the files, so replicas keep the archived history too.
+"""
+import gzip
+import json
+import os
+import re
+import tempfile
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from types import SimpleNamespace
+from typing import Dict, Iterator, List
+
+from sqlalchemy import func, text
+
+from services.db_service import QueryArchive, QueryLog, TextBlob, bump_table_versions
+
+QUERY_ARCHIVE_DIR = os.getenv("QUERY_ARCHIVE_DIR", "./archives/queries")
+# Query log rows older than this many days leave the hot table
+QUERY_RETENTION_DAYS = int(os.getenv("QUERY_RETENTION_DAYS", "90"))
+# Rows read (and blob texts resolved) per SELECT while writing a day file
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+ARCHIVE_COMPRESSLEVEL = int(os.getenv("ARCHIVE_COMPRESSLEVEL", "6"))
+
+# Everything an archived row needs; blob texts are looked up per batch
+_SOURCE_COLUMNS = (
+    QueryLog.id, QueryLog.document_id, QueryLog.query, QueryLog.decision, QueryLog.amount,
+    QueryLog.justification, QueryLog.reference_clauses, QueryLog.raw_context_legacy, QueryLog.raw_response_legacy,
+    QueryLog.raw_context_hash, QueryLog.raw_response_hash, QueryLog.timestamp,
+)
+# SQLite's default limit on bound parameters is 999
+_DELETE_BATCH = 500
+# Relative file paths this module writes (and accepts from a snapshot)
+ARCHIVE_PATH_RE = re.compile(r"^day=\d{4}-\d{2}-\d{2}/queries-\d+-\d+\.jsonl\.gz$")
+
+
+def archive_cutoff(days: int = QUERY_RETENTION_DAYS, now: datetime | None = None) -> datetime:
+    """Midnight (UTC) `days` days ago; rows before it are archived a whole day at a time."""
+    today = (now or datetime.utcnow()).date()
+    return datetime.combine(today - timedelta(days=days), time.min)
+
+
+def archive_path(record: QueryArchive) -> str:
+    return os.path.join(QUERY_ARCHIVE_DIR, record.path)
+
+
+# ---------------------------
+# ✅ Writing
+# ---------------------------
+def _archive_rows(db, rows) -> List[Dict]:
+    """Archive records for QueryLog rows, with blob texts resolved in one query per batch."""
+    hashes = {h for r in rows for h in (r.raw_context_hash, r.raw_response_hash) if h}
+    blobs = {}
+    if hashes:
+        blobs = {b.hash: b.text for b in db.query(TextBlob).filter(TextBlob.hash.in_(list(hashes))).all()}
+    records = []
+    for r in rows:
+        records.append({
+            "id": r.id,
+            "document_id": r.document_id,
+            "query": r.query,
+            "decision": r.decision,
+            "amount": r.amount,
+            "justification": r.justification,
+            "reference_clauses": r.reference_clauses,
+            "raw_context": blobs.get(r.raw_context_hash, r.raw_context_legacy),
+            "raw_response": blobs.get(r.raw_response_hash, r.raw_response_legacy),
+            "timestamp": r.timestamp.isoformat() if r.timestamp else None,
+        })
+    return records
+
+
+def _write_day(db, day: str, batch_size: int) -> tuple[str | None, List[int]]:
+    """Write every hot row of `day` to a new archive file; returns (relative path, ids)."""
+    start = datetime.fromisoformat(day)
+    end = start + timedelta(days=1)
+    partition = os.path.join(QUERY_ARCHIVE_DIR, f"day={day}")
+    os.makedirs(partition, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=partition, suffix=".part")
+    ids: List[int] = []
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb",
+                                                       compresslevel=ARCHIVE_COMPRESSLEVEL) as out:
+            last_id = 0
+            while True:
+                rows = (
+                    db.query(*_SOURCE_COLUMNS)
+                    .filter(QueryLog.timestamp >= start, QueryLog.timestamp < end, QueryLog.id > last_id)
+                    .order_by(QueryLog.id)
+                    .limit(batch_size)
+                    .all()
+                )
+                if not rows:
+                    break
+                for record in _archive_rows(db, rows):
+                    out.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+                ids += [r.id for r in rows]
+                last_id = rows[-1].id
+            raw.flush()
+            os.fsync(raw.fileno())
+        if not ids:
+            os.remove(tmp_path)
+            return None, ids
+        name = f"queries-{ids[0]}-{ids[-1]}.jsonl.gz"
+        os.replace(tmp_path, os.path.join(partition, name))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return f"day={day}/{name}", ids
+
+
+def delete_orphan_blobs(db) -> int:
+    """Delete text blobs no hot query row references. Does not commit.
+
+    Safe next to live query logging only because put_texts writes every blob
+    with INSERT OR IGNORE in the same transaction as the query row that uses
+    it: a blob deleted here after a writer last saw it is written again
+    before that row commits.
+    """
+    return db.execute(text(
+        "DELETE FROM text_blobs WHERE hash NOT IN ("
+        "SELECT raw_context_hash FROM queries WHERE raw_context_hash IS NOT NULL "
+        "UNION SELECT raw_response_hash FROM queries WHERE raw_response_hash IS NOT NULL)"
+    )).rowcount
+
+
+def archive_queries(db, days: int = QUERY_RETENTION_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE,
+                    dry_run: bool = False) -> Dict:
+    """Move query log rows older than `days` days into archive files, one transaction per day."""
+    cutoff = archive_cutoff(days)
+    day_col = func.date(QueryLog.timestamp)
+    pending = (
+        db.query(day_col, func.count(QueryLog.id))
+        .filter(QueryLog.timestamp < cutoff)
+        .group_by(day_col)
+        .order_by(day_col)
+        .all()
+    )
+    summary = {"cutoff": cutoff.isoformat(), "days": len(pending), "rows": sum(c for _, c in pending),
+               "files": [], "blobs_deleted": 0, "dry_run": dry_run}
+    if dry_run:
+        return summary
+
+    archived = 0
+    for day, _ in pending:
+        path, ids = _write_day(db, day, batch_size)
+        if not ids:
+            continue
+        size = os.path.getsize(os.path.join(QUERY_ARCHIVE_DIR, path))
+        db.add(QueryArchive(day=day, path=path, rows=len(ids), min_id=ids[0], max_id=ids[-1], bytes=size))
+        for i in range(0, len(ids), _DELETE_BATCH):
+            db.query(QueryLog).filter(QueryLog.id.in_(ids[i:i + _DELETE_BATCH])).delete(synchronize_session=False)
+        # Bulk deletes bypass the session's change tracking, so bump the ETag counter here
+        bump_table_versions(db.connection(), {"queries"})
+        db.commit()
+        archived += len(ids)
+        summary["files"].append({"day": day, "path": path, "rows": len(ids), "bytes": size})
+
+    summary["rows"] = archived
+    summary["blobs_deleted"] = delete_orphan_blobs(db)
+    db.commit()
+    return summary
+
+
+def restore_archive_file(rel_path: str, payload: bytes) -> None:
+    """Write an archive file shipped in a snapshot (atomically) under QUERY_ARCHIVE_DIR."""
+    if not ARCHIVE_PATH_RE.match(rel_path or ""):
+        raise ValueError(f"Invalid query archive path: {rel_path!r}")
+    path = os.path.join(QUERY_ARCHIVE_DIR, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def remove_archive_file(rel_path: str) -> None:
+    if not ARCHIVE_PATH_RE.match(rel_path or ""):
+        return
+    try:
+        os.remove(os.path.join(QUERY_ARCHIVE_DIR, rel_path))
+    except OSError:
+        pass
+
+
+# ---------------------------
+# ✅ Reading
+# ---------------------------
+def _archive_records(db, start: datetime | None = None, end: datetime | None = None):
+    """Archive files that may hold rows in [start, end)."""
+    q = db.query(QueryArchive)
+    if start is not None:
+        q = q.filter(QueryArchive.day >= start.date().isoformat())
+    if end is not None:
+        q = q.filter(QueryArchive.day <= end.date().isoformat())
+    return q.order_by(QueryArchive.day.desc(), QueryArchive.max_id.desc()).all()
+
+
+def has_archives(db, start: datetime | None = None, end: datetime | None = None) -> bool:
+    return bool(_archive_records(db, start, end))
+
+
+def read_archive_file(path: str) -> Iterator[SimpleNamespace]:
+    """Rows of one archive file, attribute-accessible like QueryLog rows."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get("timestamp"):
+                record["timestamp"] = datetime.fromisoformat(record["timestamp"])
+            yield SimpleNamespace(**record)
+
+
+def _matches(row, start: datetime | None, end: datetime | None, document_id: int | None) -> bool:
+    if document_id is not None and row.document_id != str(document_id):
+        return False
+    if start is not None and (row.timestamp is None or row.timestamp < start):
+        return False
+    if end is not None and (row.timestamp is None or row.timestamp >= end):
+        return False
+    return True
+
+
+def iter_archived_rows(db, start: datetime | None = None, end: datetime | None = None,
+                       document_id: int | None = None) -> Iterator[SimpleNamespace]:
+    """Archived rows in [start, end), newest first (timestamp, id). Holds one day in memory."""
+    by_day: Dict[str, List[QueryArchive]] = defaultdict(list)
+    for record in _archive_records(db, start, end):
+        by_day[record.day].append(record)
+    for day in sorted(by_day, reverse=True):
+        rows = [
+            row
+            for record in by_day[day]
+            for row in read_archive_file(archive_path(record))
+            if _matches(row, start, end, document_id)
+        ]
+        rows.sort(key=lambda r: (r.timestamp or datetime.min, r.id), reverse=True)
+        yield from rows
+
+
+def count_archived_rows(db, start: datetime | None = None, end: datetime | None = None,
+                        document_id: int | None = None) -> int:
+    """Rows in range; whole days come from the catalog, partial days and document filters scan their files."""
+    count = 0
+    for record in _archive_records(db, start, end):
+        day_start = datetime.fromisoformat(record.day)
+        whole_day = ((start is None or start <= day_start)
+                     and (end is None or end >= day_start + timedelta(days=1)))
+        if whole_day and document_id is None:
+            count += record.rows
+        else:
+            count += sum(1 for row in read_archive_file(archive_path(record)) if _matches(row, start, end, document_id))
+    return count
+
+
+def archive_fingerprint(db, start: datetime | None = None, end: datetime | None = None) -> str:
+    """Cheap signature of the archive files a date range touches (for report cache keys)."""
+    records = _archive_records(db, start, end)
+    return f"{len(records)}:{sum(r.rows for r in records)}:{max((r.max_id for r in records), default=None)}"
+
+
+def get_archive_stats(db) -> Dict:
+    files, rows, size, oldest, newest = db.query(
+        func.count(QueryArchive.id), func.coalesce(func.sum(QueryArchive.rows), 0),
+        func.coalesce(func.sum(QueryArchive.bytes), 0), func.min(QueryArchive.day), func.max(QueryArchive.day),
+    ).one()
+    hot_rows, hot_oldest = db.query(func.count(QueryLog.id), func.min(QueryLog.timestamp)).one()
+    return {
+        "retention_days": QUERY_RETENTION_DAYS,
+        "cutoff": archive_cutoff().isoformat(),
+        "hot_rows": hot_rows,
+        "hot_oldest": hot_oldest.isoformat() if hot_oldest else None,
+        "archive_dir": QUERY_ARCHIVE_DIR,
+        "archived_files": files,
+        "archived_rows": rows,
+        "archived_bytes": size,
+        "archived_days": {"oldest": oldest, "newest": newest},
+    }
@@ -0,0 +1,205 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+
+from services.db_service import (
+    SessionLocal, QueryLog, ensure_db, put_texts, record_rollups, bump_table_versions, is_missing_column_error,
+)
+
+# ---------------------------
+# ✅ Write-behind Configuration
+# ---------------------------
+QUERY_LOG_QUEUE_SIZE = int(os.getenv("QUERY_LOG_QUEUE_SIZE", "10000"))
+QUERY_LOG_BATCH_SIZE = int(os.getenv("QUERY_LOG_BATCH_SIZE", "100"))
+QUERY_LOG_FLUSH_INTERVAL = float(os.getenv("QUERY_LOG_FLUSH_INTERVAL", "1.0"))
+
+
+class QueryLogWriter:
+    """Queue query log records in memory and insert them in batched transactions.
+
+    A background thread flushes whenever `batch_size` records are pending or
+    `flush_interval` seconds have passed. The queue is bounded: when it is full
+    `submit` drops the record at once, since it is called from the event loop
+    and must never block.
+    """
+
+    def __init__(
+        self,
+        max_queue_size: int = QUERY_LOG_QUEUE_SIZE,
+        batch_size: int = QUERY_LOG_BATCH_SIZE,
+        flush_interval: float = QUERY_LOG_FLUSH_INTERVAL,
+        session_factory=SessionLocal,
+    ):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.session_factory = session_factory
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.submitted = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    # ---------------------------
+    # ✅ Lifecycle
+    # ---------------------------
+    def start(self):
+        ensure_db()
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="query-log-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the background thread and flush everything still queued."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._stop_event.set()
+            thread.join(timeout=timeout)
+        # Drain anything submitted after the thread exited
+        self.flush()
+
+    # ---------------------------
+    # ✅ Producer Side
+    # ---------------------------
+    def submit(self, query: str, response: dict, raw_context: str | None = None,
+               raw_response: str | None = None, document_id: int | None = None) -> bool:
+        """Queue a query log record. Returns False if the record was dropped."""
+        if self._thread is None:
+            self.start()
+        record = {
+            "document_id": str(document_id) if document_id is not None else None,
+            "query": query,
+            "decision": response.get("decision"),
+            "amount": response.get("amount"),
+            "justification": response.get("justification"),
+            "reference_clauses": response.get("reference_clauses", []),
+            "raw_context": raw_context,
+            "raw_response": raw_response,
+            # Capture the time of the query, not the time of the flush
+            "timestamp": datetime.utcnow(),
+        }
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            print("[WARN] Query log queue full; dropping record.")
+            return False
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    # ---------------------------
+    # ✅ Consumer Side
+    # ---------------------------
+    def _drain(self, limit: int) -> List[Dict]:
+        batch: List[Dict] = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch: List[Dict]):
+        db = self.session_factory()
+        try:
+            try:
+                texts = []
+                for r in batch:
+                    texts.extend([r["raw_context"], r["raw_response"]])
+                hashes = put_texts(db, texts)
+                rows = []
+                for i, r in enumerate(batch):
+                    row = {k: v for k, v in r.items() if k not in ("raw_context", "raw_response")}
+                    row["raw_context_hash"] = hashes[2 * i]
+                    row["raw_response_hash"] = hashes[2 * i + 1]
+                    rows.append(row)
+                db.execute(insert(QueryLog), rows)
+                record_rollups(db, rows)
+                # Bulk inserts skip the ORM flush hook, so bump the list version here
+                bump_table_versions(db.connection(), {"queries"})
+                db.commit()
+            except OperationalError as e:
+                # Fallback if schema is older (without blob hash columns)
+                db.rollback()
+                if not is_missing_column_error(e):
+                    raise
+                stripped = [
+                    {k: v for k, v in r.items() if k not in ("raw_context", "raw_response")}
+                    for r in batch
+                ]
+                db.execute(insert(QueryLog), stripped)
+                record_rollups(db, stripped)
+                bump_table_versions(db.connection(), {"queries"})
+                db.commit()
+            with self._lock:
+                self.flushed += len(batch)
+                self.batches += 1
+        except Exception as e:
+            db.rollback()
+            with self._lock:
+                self.failed += len(batch)
+            print(f"[ERROR] Failed to flush {len(batch)} query log records: {e}")
+        finally:
+            db.close()
+
+    def flush(self) -> int:
+        """Synchronously write every queued record. Returns the number written."""
+        written = 0
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                return written
+            self._write_batch(batch)
+            written += len(batch)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            deadline = time.monotonic() + self.flush_interval
+            batch: List[Dict] = []
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stop_event.is_set():
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write_batch(batch)
+
+    # ---------------------------
+    # ✅ Stats
+    # ---------------------------
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "submitted": self.submitted,
+                "flushed": self.flushed,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "batches": self.batches,
+            }
+
+
+# Shared process-wide writer used by the routes
+query_log_writer = QueryLogWriter()
+# Also flush when the app runs without its lifespan (e.g. TestClient scripts)
+atexit.register(query_log_writer.stop)
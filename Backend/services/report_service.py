@@ -0,0 +1,351 @@
+import hashlib
+import heapq
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterator
+
+from sqlalchemy import func
+
+from services.db_service import SessionLocal, QueryLog, list_queries_page, filter_queries
+from services.query_archive import archive_fingerprint, count_archived_rows, has_archives, iter_archived_rows
+
+# ---------------------------
+# ✅ Report Configuration
+# ---------------------------
+REPORTS_DIR = os.getenv("REPORTS_DIR", "reports")
+REPORT_CACHE_DIR = os.path.join(REPORTS_DIR, "cache")
+REPORT_CACHE_TTL = int(os.getenv("REPORT_CACHE_TTL", "3600"))
+# GET /api/report without a range or limit covers this many recent queries
+REPORT_DEFAULT_LIMIT = 10
+# Larger PDFs must be requested as background jobs
+REPORT_SYNC_MAX_ROWS = int(os.getenv("REPORT_SYNC_MAX_ROWS", "2000"))
+REPORT_JOB_WORKERS = int(os.getenv("REPORT_JOB_WORKERS", "1"))
+REPORT_PAGE_SIZE = 500
+# Rows per ReportLab table, about one printed page; tables are created as the
+# layout reaches them, so a PDF never holds more than a page or two of them
+REPORT_PDF_TABLE_ROWS = 40
+
+FORMATS = {
+    "pdf": ("application/pdf", "pdf"),
+    "json": ("application/json", "json"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+
+class ReportParams:
+    def __init__(self, format: str = "pdf", start: datetime | None = None, end: datetime | None = None,
+                 document_id: int | None = None, limit: int | None = None):
+        self.format = format.lower()
+        if self.format not in FORMATS:
+            raise ValueError(f"Unsupported report format: {format}")
+        self.start = start
+        self.end = end
+        self.document_id = document_id
+        self.limit = limit
+
+    @property
+    def media_type(self) -> str:
+        return FORMATS[self.format][0]
+
+    @property
+    def extension(self) -> str:
+        return FORMATS[self.format][1]
+
+    def as_dict(self) -> Dict:
+        return {
+            "format": self.format,
+            "start": self.start.isoformat() if self.start else None,
+            "end": self.end.isoformat() if self.end else None,
+            "document_id": self.document_id,
+            "limit": self.limit,
+        }
+
+
+# ---------------------------
+# ✅ Row Iteration
+# ---------------------------
+def report_row(q) -> Dict:
+    return {
+        "id": q.id,
+        "document_id": q.document_id,
+        "query": q.query,
+        "decision": q.decision,
+        "amount": q.amount,
+        "justification": q.justification,
+        "reference_clauses": q.reference_clauses or [],
+        "timestamp": q.timestamp.isoformat() if q.timestamp else None,
+    }
+
+
+def iter_hot_rows(db, params: ReportParams, page_size: int = REPORT_PAGE_SIZE) -> Iterator[Dict]:
+    """Yield report rows from the queries table newest-first, one keyset page at a time."""
+    after = None
+    while True:
+        rows, after = list_queries_page(
+            db, limit=page_size, after=after, document_id=params.document_id, start=params.start, end=params.end,
+        )
+        for q in rows:
+            yield report_row(q)
+        if not after:
+            return
+
+
+def iter_report_rows(db, params: ReportParams, page_size: int = REPORT_PAGE_SIZE) -> Iterator[Dict]:
+    """Yield report rows newest-first, merging in archived days when the range reaches them."""
+    if params.limit is not None:
+        page_size = min(page_size, params.limit)
+    rows = iter_hot_rows(db, params, page_size)
+    if has_archives(db, params.start, params.end):
+        archived = (report_row(q) for q in iter_archived_rows(db, params.start, params.end, params.document_id))
+        rows = heapq.merge(rows, archived, key=lambda r: (r["timestamp"] or "", r["id"]), reverse=True)
+    if params.limit is not None:
+        rows = islice(rows, params.limit)
+    yield from rows
+
+
+def count_report_rows(db, params: ReportParams) -> int:
+    q = filter_queries(db.query(func.count(QueryLog.id)), params.document_id, params.start, params.end)
+    count = q.scalar() or 0
+    if params.limit is not None and count >= params.limit:
+        return params.limit
+    count += count_archived_rows(db, params.start, params.end, params.document_id)
+    return min(count, params.limit) if params.limit is not None else count
+
+
+def data_fingerprint(db, params: ReportParams) -> str:
+    """Cheap (count, max id) signature of the rows a report would cover, plus its archive files."""
+    q = filter_queries(db.query(func.count(QueryLog.id), func.max(QueryLog.id)), params.document_id, params.start, params.end)
+    count, max_id = q.one()
+    return f"{count}:{max_id}:{archive_fingerprint(db, params.start, params.end)}"
+
+
+# ---------------------------
+# ✅ Renderers
+# ---------------------------
+def iter_json(rows: Iterator[Dict]) -> Iterator[bytes]:
+    """Stream a JSON array without materialising it."""
+    yield b"["
+    first = True
+    for row in rows:
+        yield (b"" if first else b",") + json.dumps(row).encode("utf-8")
+        first = False
+    yield b"]"
+
+
+def iter_ndjson(rows: Iterator[Dict]) -> Iterator[bytes]:
+    for row in rows:
+        yield json.dumps(row).encode("utf-8") + b"\n"
+
+
+class _LazyFlowables(list):
+    """Flowable list for doc.build that pulls the next flowable from `source`
+    only when ReportLab is about to run out, so finished pages are not kept
+    around as Table objects.
+    """
+
+    def __init__(self, head, source: Iterator):
+        super().__init__(head)
+        self._source = source
+
+    def __len__(self):
+        if super().__len__() < 2 and self._source is not None:
+            flowable = next(self._source, None)
+            if flowable is None:
+                self._source = None
+            else:
+                self.append(flowable)
+        return super().__len__()
+
+
+def write_pdf(rows: Iterator[Dict], fileobj, params: ReportParams):
+    # ReportLab is only needed for PDFs; keep it off the startup import path
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+    from reportlab.lib.styles import getSampleStyleSheet
+
+    doc = SimpleDocTemplate(fileobj, pagesize=letter)
+    styles = getSampleStyleSheet()
+
+    content = []
+    content.append(Paragraph("Insurance Claims Analysis Report", styles['Title']))
+    content.append(Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal']))
+    scope = []
+    if params.start or params.end:
+        start = params.start.strftime('%Y-%m-%d %H:%M') if params.start else "beginning"
+        end = params.end.strftime('%Y-%m-%d %H:%M') if params.end else "now"
+        scope.append(f"Period: {start} to {end}")
+    if params.document_id is not None:
+        scope.append(f"Document: {params.document_id}")
+    if scope:
+        content.append(Paragraph(" | ".join(scope), styles['Normal']))
+
+    table_style = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 14),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 10),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 6),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+    ])
+    header = ["Query", "Decision", "Amount", "Justification", "Reference Clauses"]
+
+    def tables():
+        table_data = [header]
+        empty = True
+        for row in rows:
+            table_data.append([
+                row["query"],
+                row["decision"],
+                row["amount"] or "N/A",
+                row["justification"],
+                ", ".join(row["reference_clauses"]),
+            ])
+            if len(table_data) > REPORT_PDF_TABLE_ROWS:
+                yield Table(table_data, repeatRows=1, style=table_style)
+                empty = False
+                table_data = [header]
+        if len(table_data) > 1 or empty:
+            yield Table(table_data, repeatRows=1, style=table_style)
+
+    doc.build(_LazyFlowables(content, tables()))
+
+
+# ---------------------------
+# ✅ Cache
+# ---------------------------
+def report_cache_key(db, params: ReportParams) -> str:
+    payload = json.dumps({"params": params.as_dict(), "data": data_fingerprint(db, params)}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def cache_path(key: str, extension: str) -> str:
+    return os.path.join(REPORT_CACHE_DIR, f"{key}.{extension}")
+
+
+def find_cached(key: str) -> str | None:
+    if not re.fullmatch(r"[0-9a-f]{32}", key or ""):
+        return None
+    for _, extension in FORMATS.values():
+        path = cache_path(key, extension)
+        if os.path.exists(path):
+            if time.time() - os.path.getmtime(path) <= REPORT_CACHE_TTL:
+                return path
+    return None
+
+
+def media_type_for(path: str) -> str:
+    extension = path.rsplit(".", 1)[-1]
+    for media_type, ext in FORMATS.values():
+        if ext == extension:
+            return media_type
+    return "application/octet-stream"
+
+
+def prune_cache():
+    if not os.path.isdir(REPORT_CACHE_DIR):
+        return
+    now = time.time()
+    for name in os.listdir(REPORT_CACHE_DIR):
+        path = os.path.join(REPORT_CACHE_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > REPORT_CACHE_TTL:
+                os.remove(path)
+        except OSError:
+            pass  # Another worker may have removed it already
+
+
+def build_report_file(db, params: ReportParams, key: str) -> str:
+    """Render a report into the cache directory atomically and return its path."""
+    os.makedirs(REPORT_CACHE_DIR, exist_ok=True)
+    prune_cache()
+    final_path = cache_path(key, params.extension)
+    fd, tmp_path = tempfile.mkstemp(dir=REPORT_CACHE_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            rows = iter_report_rows(db, params)
+            if params.format == "pdf":
+                write_pdf(rows, out, params)
+            else:
+                chunks = iter_json(rows) if params.format == "json" else iter_ndjson(rows)
+                for chunk in chunks:
+                    out.write(chunk)
+        os.replace(tmp_path, final_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return final_path
+
+
+# ---------------------------
+# ✅ Background Jobs
+# ---------------------------
+class ReportJobs:
+    """Runs large reports off the request path. Job ids are the report cache keys,
+    so identical requests share one job and a finished file can be served by any
+    worker that sees the reports directory.
+    """
+
+    def __init__(self, max_workers: int = REPORT_JOB_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report-job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict] = {}
+
+    def submit(self, params: ReportParams, key: str) -> Dict:
+        with self._lock:
+            job = self._jobs.get(key)
+            if job and job["status"] in ("queued", "running"):
+                return dict(job)
+            if find_cached(key):
+                job = {"job_id": key, "status": "completed", "format": params.format, "error": None}
+                self._jobs[key] = job
+                return dict(job)
+            job = {"job_id": key, "status": "queued", "format": params.format, "error": None,
+                   "submitted_at": datetime.utcnow().isoformat()}
+            self._jobs[key] = job
+        self._executor.submit(self._run, params, key)
+        return dict(job)
+
+    def _run(self, params: ReportParams, key: str):
+        self._update(key, status="running")
+        db = SessionLocal()
+        try:
+            build_report_file(db, params, key)
+            self._update(key, status="completed", finished_at=datetime.utcnow().isoformat())
+        except Exception as e:
+            print(f"[ERROR] Report job {key} failed: {e}")
+            self._update(key, status="failed", error=str(e))
+        finally:
+            db.close()
+
+    def _update(self, key: str, **fields):
+        with self._lock:
+            self._jobs.setdefault(key, {"job_id": key}).update(fields)
+
+    def get(self, key: str) -> Dict | None:
+        with self._lock:
+            job = self._jobs.get(key)
+            if job:
+                return dict(job)
+        if find_cached(key):
+            return {"job_id": key, "status": "completed", "error": None}
+        return None
+
+
+report_jobs = ReportJobs()
@@ -0,0 +1,81 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict
+
+# ---------------------------
+# ✅ Per-request stage timings
+# ---------------------------
+# The profiling middleware opens a trace per API request; code on the request
+# path records stage timings and facts (chunk ids, prompt size) into it.
+# Without an active trace both helpers are no-ops, so scripts and background
+# threads can call instrumented code freely.
+
+
+class RequestTrace:
+    def __init__(self, method: str, path: str, query_string: str = ""):
+        self.method = method
+        self.path = path
+        self.query_string = query_string
+        self.started_at = datetime.utcnow()
+        self._started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.info: Dict = {}
+        self.status: int | None = None
+        self.total_ms: float | None = None
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds * 1000
+
+    def finish(self, status: int | None):
+        self.status = status
+        self.total_ms = (time.perf_counter() - self._started) * 1000
+
+    def to_dict(self) -> Dict:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "query_string": self.query_string,
+            "started_at": self.started_at.isoformat(),
+            "status": self.status,
+            "total_ms": round(self.total_ms or 0.0, 2),
+            "stages_ms": {k: round(v, 2) for k, v in self.stages.items()},
+            **self.info,
+        }
+
+
+_current: ContextVar[RequestTrace | None] = ContextVar("request_trace", default=None)
+
+
+def start_trace(trace: RequestTrace):
+    return _current.set(trace)
+
+
+def end_trace(token):
+    _current.reset(token)
+
+
+def current_trace() -> RequestTrace | None:
+    return _current.get()
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as `name` in the current request's trace."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - started)
+
+
+def note(**info):
+    """Attach facts (chunk ids, context size...) to the current request's trace."""
+    trace = _current.get()
+    if trace is not None:
+        trace.info.update(info)
@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+import time
+
+# ---------------------------
+# ✅ Shared, lazily created resources
+# ---------------------------
+# Heavy clients (Chroma, Gemini) are built on first use instead of at import
+# time, and shared by every router instead of one copy per route module.
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./vector_db/chroma")
+COLLECTION_NAME = "insurance_policies"
+
+_llm_lock = threading.Lock()
+_chroma_lock = threading.Lock()
+_llm_service = None
+_chroma_client = None
+_collections = {}
+_active_target = None
+_active_stamp = None
+
+
+def get_llm_service():
+    global _llm_service
+    if _llm_service is None:
+        with _llm_lock:
+            if _llm_service is None:
+                from services.llm_service import LLMService
+                _llm_service = LLMService()
+    return _llm_service
+
+
+def get_chroma_client():
+    global _chroma_client
+    if _chroma_client is None:
+        with _chroma_lock:
+            if _chroma_client is None:
+                import chromadb
+                from chromadb.config import Settings
+                # Disable anonymized telemetry to avoid PostHog atexit issues
+                _chroma_client = chromadb.PersistentClient(path=CHROMA_PATH, settings=Settings(anonymized_telemetry=False))
+    return _chroma_client
+
+
+def get_active_index_target() -> tuple:
+    """(collection name, sharding) of the active index version.
+
+    Cached until the "index" change counter moves, which every worker notices
+    within CHANGE_CHECK_INTERVAL of a swap (see services/change_feed.py).
+    """
+    global _active_target, _active_stamp
+    from services.db_service import SessionLocal, ensure_db
+    from services.change_feed import INDEX_COUNTER, change_feed
+    ensure_db()
+    stamp = change_feed.stamp([INDEX_COUNTER])
+    if _active_target is None or stamp != _active_stamp:
+        from services.index_service import get_active_index
+        db = SessionLocal()
+        try:
+            version = get_active_index(db)
+            _active_target = (version.collection_name, version.sharding)
+        finally:
+            db.close()
+        _active_stamp = stamp
+    return _active_target
+
+
+def invalidate_active_index():
+    """Force the next get_collection() to re-check the active index (after a swap)."""
+    global _active_stamp
+    from services.change_feed import change_feed
+    change_feed.mark_stale()
+    _active_stamp = None
+
+
+_shard_keys_cache = None
+
+
+def _insurer_shard_keys():
+    global _shard_keys_cache
+    from services.change_feed import VersionedCache
+    from services.db_service import SessionLocal, Document
+    from services.sharded_vector_store import insurer_slug
+
+    if _shard_keys_cache is None:
+        _shard_keys_cache = VersionedCache(["documents"], max_entries=1)
+
+    def load():
+        db = SessionLocal()
+        try:
+            return {insurer_slug(row[0]) for row in db.query(Document.insurer).distinct()}
+        finally:
+            db.close()
+    return _shard_keys_cache.get_or_set("insurers", load)
+
+
+def get_collection(name: str | None = None, sharding: dict | None = None):
+    """The policy chunk collection on the configured vector store backend.
+
+    Without a name this is the active index version's collection. Callers
+    should fetch it once per request so a swap never splits a request across
+    two indexes. A sharding layout returns a fan-out store over its shards,
+    each opened (and cached) on first use.
+    """
+    if name is None:
+        name, sharding = get_active_index_target()
+    key = name if not sharding else f"{name}#{json.dumps(sharding, sort_keys=True)}"
+    store = _collections.get(key)
+    if store is None:
+        from services.vector_store import open_vector_store, VECTOR_STORE_BACKEND
+        client = get_chroma_client() if VECTOR_STORE_BACKEND == "chroma" else None
+        with _chroma_lock:
+            store = _collections.get(key)
+            if store is None:
+                if sharding:
+                    from services.sharded_vector_store import ShardedVectorStore
+                    store = ShardedVectorStore(name, sharding, opener=get_collection, list_keys=_insurer_shard_keys)
+                else:
+                    store = open_vector_store(name, client=client)
+                _collections[key] = store
+    return store
+
+
+def forget_collection(name: str):
+    """Drop cached store handles for a collection (after it was deleted)."""
+    with _chroma_lock:
+        for key in [k for k in _collections if k == name or k.startswith(name + "#")]:
+            _collections.pop(key, None)
+
+
+def timed(name: str, fn) -> float:
+    """Run fn() and return how long it took in seconds (used for warm-up logging)."""
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print(f"[INFO] Warm-up: {name} ready in {elapsed:.2f}s")
+    return elapsed
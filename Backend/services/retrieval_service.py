@@ -1,19 +1,67 @@
 from typing import List, Tuple, Dict
+import bisect
+import hashlib
+import os
 import re
 from datetime import datetime, timezone
 
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+# Default chunking for new index versions (see services/index_service.py)
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "150"))
+# Bump whenever guess_section_name() changes so rebuilt indexes get a new label
+SECTION_HEURISTIC_VERSION = 1
+# "recursive" splits on characters; "structure" packs whole clauses (see structure_chunks)
+CHUNK_STRATEGY = os.getenv("CHUNK_STRATEGY", "recursive").lower()
+CHUNK_STRATEGIES = ("recursive", "structure")
+# Clause-aligned chunks rarely cut a sentence, so they need far less overlap
+STRUCTURE_CHUNK_OVERLAP = int(os.getenv("STRUCTURE_CHUNK_OVERLAP", "0"))
 
+# Numbered clauses and list items: "4.", "4.2", "4.2.1)", "(a)", "b)", "(iv)", "Clause 12", "Section 3:"
+CLAUSE_START = re.compile(
+    r"^(?:(?:clause|section|article|part)\s+[\dIVXivx]+[\.:]?|\d{1,3}(?:\.\d{1,3})*[\.\)]|\d{1,3}(?:\.\d{1,3})+"
+    r"|\(?[a-z]\)|\(?[ivx]{1,4}\))\s+\S",
+    re.IGNORECASE,
+)
+SECTION_HEADING = re.compile(r"^(?:section|part|article|chapter)\s+[\dIVX]+\b[^.!?]{0,60}$", re.IGNORECASE)
+SENTENCE_END = re.compile(r"[\.!?;](?=\s)|\n\s*\n")
 
-def build_text_splitter() -> RecursiveCharacterTextSplitter:
+
+def load_pdf_pages(file_path: str):
+    # Imported lazily: langchain_community is slow to import
+    from langchain_community.document_loaders import PyPDFLoader
+    return PyPDFLoader(file_path).load()
+
+
+def default_chunking(strategy: str | None = None) -> Dict:
+    strategy = (strategy or CHUNK_STRATEGY).lower()
+    if strategy not in CHUNK_STRATEGIES:
+        raise ValueError(f"Unknown chunking strategy: {strategy}")
+    if strategy == "recursive":
+        # No strategy key: identical to the configs stored before strategies existed
+        return {"chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP, "section_heuristic": SECTION_HEURISTIC_VERSION}
+    return {"strategy": strategy, "chunk_size": CHUNK_SIZE, "chunk_overlap": STRUCTURE_CHUNK_OVERLAP,
+            "section_heuristic": SECTION_HEURISTIC_VERSION}
+
+
+def chunking_label(chunking: Dict) -> str:
+    """Short human-readable name for a chunking config, e.g. "c1000-o150-s1" or "st-c1000-o0-s1"."""
+    prefix = "st-" if chunking.get("strategy") == "structure" else ""
+    return f"{prefix}c{chunking['chunk_size']}-o{chunking['chunk_overlap']}-s{chunking.get('section_heuristic', SECTION_HEURISTIC_VERSION)}"
+
+
+def build_text_splitter(chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
     return RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=150,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
         separators=["\n\n", "\n", " ", ""]
     )
 
 
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
 def guess_section_name(text: str) -> str | None:
     """Heuristic to extract a likely section heading from text.
     - Look for titlecase/uppercase line near the start
@@ -21,13 +69,21 @@ def guess_section_name(text: str) -> str | None:
     """
     lines = [l.strip() for l in text.splitlines()[:10] if l.strip()]
     for line in lines:
-        if len(line) <= 80:
-            # Heading with colon
-            if line.endswith(":") and len(line.split()) >= 2:
-                return line[:-1].strip()
-            # Mostly uppercase or Title Case
-            if re.match(r"^[A-Z][A-Za-z ]+$", line) or line.isupper():
-                return line.strip()
+        heading = heading_text(line)
+        if heading:
+            return heading
+    return None
+
+
+def heading_text(line: str) -> str | None:
+    """The heading a single stripped line spells out, if it looks like one."""
+    if len(line) <= 80:
+        # Heading with colon
+        if line.endswith(":") and len(line.split()) >= 2:
+            return line[:-1].strip()
+        # Mostly uppercase or Title Case
+        if re.match(r"^[A-Z][A-Za-z ]+$", line) or line.isupper():
+            return line.strip()
     return None
 
 
@@ -58,21 +114,153 @@ def stitch_with_next_if_needed(text: str, chunk_id: str, collection) -> str:
     return text
 
 
-def process_pdf_into_chromadb(file_path: str, doc_id: int, llm_service, collection) -> Tuple[int, List[Dict]]:
-    """Load PDF, split, embed, and add to Chroma with metadata.
-    Returns number of chunks and the metadatas list for inspection.
+# ---------------------------
+# ✅ Structure-aware chunking
+# ---------------------------
+def structure_units(text: str) -> List[Tuple[int, str | None, bool]]:
+    """Split points of clause-level units: (start offset, section in force, starts a section).
+
+    A unit starts at a heading or a numbered clause. PDF text wraps long
+    sentences onto lines that can look like Title Case headings, so a heading
+    only counts after a blank line or a line that ended a sentence, and a
+    numbered clause ending in ":" is a clause lead-in rather than a section.
+    """
+    units: List[Tuple[int, str | None, bool]] = [(0, None, False)]
+    section = None
+    offset = 0
+    at_boundary = True
+    for line in text.splitlines(keepends=True):
+        stripped = line.strip()
+        if not stripped:
+            at_boundary = True
+        else:
+            clause = CLAUSE_START.match(stripped)
+            if SECTION_HEADING.match(stripped):
+                heading = stripped.rstrip(":")
+            elif at_boundary and not clause and len(stripped.split()) <= 10:
+                heading = heading_text(stripped)
+            else:
+                heading = None
+            if heading or clause:
+                if heading:
+                    section = heading
+                previous = text[units[-1][0]:offset].strip()
+                # A bare heading line stays with the unit that follows it
+                if previous and not (units[-1][2] and "\n" not in previous):
+                    units.append((offset, section, bool(heading)))
+                else:
+                    units[-1] = (units[-1][0], section, bool(heading) or units[-1][2])
+            at_boundary = bool(heading) or stripped[-1] in ".:;!?"
+        offset += len(line)
+    return units
+
+
+def _sentence_spans(text: str, start: int, end: int, limit: int) -> List[Tuple[int, int]]:
+    """Cut text[start:end] into pieces of at most `limit` chars at sentence ends (words as a last resort)."""
+    cuts = [m.end() for m in SENTENCE_END.finditer(text, start, end)] + [end]
+    spans: List[Tuple[int, int]] = []
+    piece_start = start
+    for cut in cuts:
+        while cut - piece_start > limit:
+            hard = text.rfind(" ", piece_start + 1, piece_start + limit)
+            hard = hard if hard > piece_start else piece_start + limit
+            spans.append((piece_start, hard))
+            piece_start = hard
+        if cut > piece_start:
+            spans.append((piece_start, cut))
+            piece_start = cut
+    return spans
+
+
+def _overlap_start(text: str, start: int, overlap: int) -> int:
+    """Pull a chunk's start back over whole trailing sentences of the previous one, up to `overlap` chars."""
+    if overlap <= 0 or start == 0:
+        return start
+    window = max(0, start - overlap)
+    m = SENTENCE_END.search(text, window, start)
+    return m.end() if m else start
+
+
+def structure_chunks(pages, chunk_size: int, chunk_overlap: int = 0) -> List[Tuple[str, int | None, str | None]]:
+    """Clause-aligned chunks of a document: (text, page, section heading).
+
+    Whole clauses are packed greedily up to chunk_size minus the overlap, and
+    a new section starts a new chunk once the current one is a third full.
+    Clauses are only split at sentence ends: when longer than the budget, or
+    to top up a chunk that is less than half full. The overlap (whole
+    sentences of the previous chunk) then fills at most the room left, so no
+    chunk exceeds chunk_size. A chunk is labelled with the section holding most
+    of its text. Chunks may cross a page break and are attributed to the page
+    they start on.
     """
-    loader = PyPDFLoader(file_path)
-    pages = loader.load()
+    text = ""
+    page_starts: List[int] = []
+    page_numbers: List = []
+    for page in pages:
+        page_starts.append(len(text))
+        page_numbers.append(page.metadata.get("page"))
+        text += page.page_content.rstrip() + "\n\n"
+
+    # Room for packed clauses; keep at least half of each chunk for new text
+    budget = chunk_size - min(max(chunk_overlap, 0), chunk_size // 2)
+    units = structure_units(text)
+    bounds = [u[0] for u in units[1:]] + [len(text)]
+    spans: List[Tuple[int, int, str | None]] = []
+    cur_start = cur_end = None
+    # Characters of the current chunk per section, in order of appearance
+    cur_sections: Dict[str | None, int] = {}
+
+    def flush():
+        if cur_start is not None and text[cur_start:cur_end].strip():
+            spans.append((cur_start, cur_end, max(cur_sections, key=cur_sections.get)))
 
-    splitter = build_text_splitter()
-    chunks = splitter.split_documents(pages)
+    for (start, section, new_section), end in zip(units, bounds):
+        filled = cur_end - cur_start if cur_start is not None else 0
+        if new_section and filled >= budget // 3:
+            flush()
+            cur_start, filled = None, 0
+        # A clause that does not fit goes whole into the next chunk, unless this
+        # one is still less than half full: then top it up sentence by sentence
+        if end - start <= budget and (filled + end - start <= budget or filled >= budget // 2):
+            pieces = [(start, end)]
+        else:
+            pieces = _sentence_spans(text, start, end, budget)
+        for p_start, p_end in pieces:
+            if cur_start is not None and p_end - cur_start > budget:
+                flush()
+                cur_start = None
+            if cur_start is None:
+                cur_start, cur_sections = p_start, {}
+            cur_sections[section] = cur_sections.get(section, 0) + p_end - p_start
+            cur_end = p_end
+    flush()
+
+    chunks: List[Tuple[str, int | None, str | None]] = []
+    for start, end, section in spans:
+        body_start = start + (len(text[start:end]) - len(text[start:end].lstrip()))
+        overlap = min(chunk_overlap, chunk_size - (end - start))
+        chunk_text = text[_overlap_start(text, start, overlap):end].strip()
+        page = page_numbers[bisect.bisect_right(page_starts, body_start) - 1] if page_starts else None
+        chunks.append((chunk_text, page, section or guess_section_name(chunk_text)))
+    return chunks
+
+
+def chunk_pages(pages, doc_id: int, chunking: Dict | None = None,
+                extra_metadata: Dict | None = None) -> Tuple[List[str], List[Dict]]:
+    """Split loaded pages into chunk texts plus their vector store metadata.
+    extra_metadata (e.g. the insurer used for sharding) is copied onto every chunk.
+    """
+    chunking = chunking or default_chunking()
+    if chunking.get("strategy", "recursive") == "structure":
+        chunks = structure_chunks(pages, chunking["chunk_size"], chunking["chunk_overlap"])
+    else:
+        splitter = build_text_splitter(chunking["chunk_size"], chunking["chunk_overlap"])
+        chunks = [(c.page_content, c.metadata.get("page"), guess_section_name(c.page_content))
+                  for c in splitter.split_documents(pages)]
 
-    texts = [c.page_content for c in chunks]
+    texts = [c[0] for c in chunks]
     metadatas: List[Dict] = []
-    for i, c in enumerate(chunks):
-        page_num = c.metadata.get("page")
-        section = guess_section_name(c.page_content)
+    for i, (_, page_num, section) in enumerate(chunks):
         # Build metadata without None values (Chroma rejects None)
         meta: Dict = {
             "doc_id": doc_id,
@@ -82,22 +270,37 @@ def process_pdf_into_chromadb(file_path: str, doc_id: int, llm_service, collecti
             meta["page_number"] = page_num
         if section:
             meta["section_name"] = section
+        meta.update({k: v for k, v in (extra_metadata or {}).items() if v is not None})
         metadatas.append(meta)
+    return texts, metadatas
 
-    embeddings = llm_service.get_embeddings(texts)
 
-    unique_prefix = f"doc{doc_id}_{int(datetime.now(timezone.utc).timestamp())}"
-    for i, (text, embedding, meta) in enumerate(zip(texts, embeddings, metadatas)):
-        collection.add(
-            documents=[text],
-            embeddings=[embedding],
-            metadatas=[meta],
-            ids=[f"{unique_prefix}_chunk_{i}"]
-        )
+def process_pdf_into_chromadb(file_path: str, doc_id: int, llm_service, collection,
+                              chunking: Dict | None = None, extra_metadata: Dict | None = None) -> Tuple[int, List[Dict]]:
+    """Load PDF, split, embed, and add to the vector store with metadata.
+    Returns number of chunks and the metadatas list for inspection.
+    """
+    pages = load_pdf_pages(file_path)
+    texts, metadatas = chunk_pages(pages, doc_id, chunking, extra_metadata)
+
+    embeddings = llm_service.get_embeddings(texts)
+    store_chunks(collection, doc_id, texts, embeddings, metadatas)
 
     return len(texts), metadatas
 
 
+def store_chunks(collection, doc_id: int, texts: List[str], embeddings, metadatas: List[Dict]) -> None:
+    """Add one uploaded document's chunks to the vector store."""
+    # Unique IDs avoid duplicate insert errors on re-uploads
+    unique_prefix = f"doc{doc_id}_{int(datetime.now(timezone.utc).timestamp())}"
+    collection.add(
+        ids=[f"{unique_prefix}_chunk_{i}" for i in range(len(texts))],
+        embeddings=embeddings,
+        documents=texts,
+        metadatas=metadatas,
+    )
+
+
 def build_context_and_refs(results: Dict, collection) -> Tuple[str, List[str], List[Dict]]:
     """Concatenate top documents into context and derive reference clauses from metadata.
     Applies clause stitcher when chunks end mid-sentence.
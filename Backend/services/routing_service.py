@@ -0,0 +1,186 @@
+"""Coarse-to-fine retrieval over per-document summary and section centroids.
+
+After upload each document gets a small "routing" entry set in a side
+collection: one centroid of all its chunk embeddings plus one centroid per
+section run. A query first searches this collection (a few entries per
+document) to pick the top candidate documents, then runs the chunk search
+only within them via a doc_id filter, so chunk-level cost stays roughly
+flat as the number of policies grows. Centroids are averaged from the
+stored chunk vectors, so building them costs no embedding calls.
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from services.change_feed import VersionedCache
+from services.db_service import SessionLocal, Document, update_document
+from services.request_trace import note, stage
+
+TWO_STAGE_RETRIEVAL = os.getenv("TWO_STAGE_RETRIEVAL", "1") != "0"
+# Below this many documents a plain chunk search is already cheap
+TWO_STAGE_MIN_DOCS = int(os.getenv("TWO_STAGE_MIN_DOCS", "20"))
+TWO_STAGE_TOP_DOCS = int(os.getenv("TWO_STAGE_TOP_DOCS", "5"))
+# Documents still waiting for a summary are searched unrouted alongside the
+# routed candidates; past this many (e.g. right after a bulk ingest or a
+# rebuild) the whole query falls back to a plain chunk search instead
+TWO_STAGE_MAX_PENDING = int(os.getenv("TWO_STAGE_MAX_PENDING", "20"))
+SUMMARY_MAX_CHARS = int(os.getenv("SUMMARY_MAX_CHARS", "800"))
+ROUTING_SUFFIX = "_routing"
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="doc-summary")
+# Completed/pending document ids, re-read only when the documents table changes
+_document_state = VersionedCache(["documents"], max_entries=1)
+
+
+def routing_collection_name(collection_name: str) -> str:
+    return f"{collection_name}{ROUTING_SUFFIX}"
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+def section_runs(metadatas: List[Dict]) -> List[Tuple[str, List[int]]]:
+    """Group chunk rows into sections; chunks without a heading join the previous section."""
+    order = sorted(range(len(metadatas)), key=lambda i: (metadatas[i] or {}).get("chunk_index", i))
+    runs: List[Tuple[str, List[int]]] = []
+    for i in order:
+        section = (metadatas[i] or {}).get("section_name")
+        if section and (not runs or runs[-1][0] != section):
+            runs.append((section, [i]))
+        elif runs:
+            runs[-1][1].append(i)
+    return runs
+
+
+def extractive_summary(texts: List[str], metadatas: List[Dict], max_chars: int = SUMMARY_MAX_CHARS) -> str:
+    """Section headings followed by the document's opening sentences."""
+    order = sorted(range(len(texts)), key=lambda i: (metadatas[i] or {}).get("chunk_index", i))
+    headings = list(dict.fromkeys(s for s, _ in section_runs(metadatas)))
+    lead = " ".join(re.sub(r"\s+", " ", texts[i] or "").strip() for i in order[:2])
+    summary = (f"Sections: {'; '.join(headings)}\n" if headings else "") + lead
+    if len(summary) > max_chars:
+        cut = summary[:max_chars]
+        m = re.search(r"[\.!?](?=[^\.!?]*$)", cut)
+        summary = cut[:m.end()] if m else cut + "…"
+    return summary
+
+
+def summarize_document(doc: Document, chunk_store, routing_store) -> str | None:
+    """(Re)write the routing entries for one document; returns its text summary."""
+    chunks = chunk_store.get(where={"doc_id": doc.id}, include=["documents", "metadatas", "embeddings"])
+    if not chunks.get("ids"):
+        return None
+    texts = chunks.get("documents") or []
+    metadatas = chunks.get("metadatas") or []
+    vectors = np.asarray(chunks["embeddings"], dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    base = {"doc_id": doc.id}
+    if doc.insurer:
+        base["insurer"] = doc.insurer
+    ids = [f"doc{doc.id}_summary"]
+    embeddings = [_unit(vectors.mean(axis=0))]
+    entries = [{**base, "kind": "document"}]
+    for k, (section, rows) in enumerate(section_runs(metadatas)):
+        ids.append(f"doc{doc.id}_section_{k}")
+        embeddings.append(_unit(vectors[rows].mean(axis=0)))
+        entries.append({**base, "kind": "section", "section_name": section})
+
+    summary = extractive_summary(texts, metadatas)
+    routing_store.delete(where={"doc_id": doc.id})
+    routing_store.add(ids=ids, embeddings=np.asarray(embeddings, dtype=np.float32),
+                      documents=[summary] + [e["section_name"] for e in entries[1:]], metadatas=entries)
+    return summary
+
+
+def refresh_document_summary(doc_id: int) -> None:
+    """Summarise one document into the active index's routing collection."""
+    from services.index_service import get_active_index
+    from services.resources import get_collection
+
+    db = SessionLocal()
+    try:
+        doc = db.get(Document, doc_id)
+        if doc is None or doc.status != "completed":
+            return
+        index = get_active_index(db)
+        summary = summarize_document(doc, get_collection(index.collection_name, index.sharding),
+                                     get_collection(routing_collection_name(index.collection_name)))
+        if summary is not None:
+            update_document(db, doc_id, {"summary": summary})
+    except Exception as e:
+        print(f"[WARN] Could not summarise document {doc_id}: {e}")
+    finally:
+        db.close()
+
+
+def schedule_document_summary(doc_id: int) -> None:
+    """Build the routing entries off the request path, after the upload has returned."""
+    _executor.submit(refresh_document_summary, doc_id)
+
+
+def build_missing_summaries(db, force: bool = False) -> int:
+    """Backfill routing entries for completed documents (all of them with force)."""
+    q = db.query(Document.id).filter(Document.status == "completed")
+    if not force:
+        q = q.filter(Document.summary.is_(None))
+    ids = [row[0] for row in q.order_by(Document.id).all()]
+    for doc_id in ids:
+        refresh_document_summary(doc_id)
+    return len(ids)
+
+
+def route_documents(db, query_embedding, routing_store, where: Dict | None = None,
+                    top_docs: int = TWO_STAGE_TOP_DOCS) -> List[int] | None:
+    """Candidate doc_ids for a query, or None when a plain chunk search should be used."""
+    if not TWO_STAGE_RETRIEVAL:
+        return None
+
+    def load_state():
+        completed = db.query(Document.id).filter(Document.status == "completed")
+        pending = [row[0] for row in completed.filter(Document.summary.is_(None)).all()]
+        return completed.count(), pending
+    completed_count, pending = _document_state.get_or_set("completed", load_state)
+    if completed_count < TWO_STAGE_MIN_DOCS:
+        return None
+    if len(pending) > TWO_STAGE_MAX_PENDING:
+        note(routing_fallback="pending_summaries", pending_docs=len(pending))
+        return None
+    result = routing_store.query(query_embeddings=[query_embedding], n_results=top_docs * 8, where=where,
+                                 include=["metadatas"])
+    candidates: List[int] = []
+    for meta in (result.get("metadatas") or [[]])[0]:
+        doc_id = (meta or {}).get("doc_id")
+        if doc_id is not None and doc_id not in candidates:
+            candidates.append(doc_id)
+            if len(candidates) >= top_docs:
+                break
+    if not candidates:
+        return None
+    # Documents whose summary is still being built have no routing entries yet
+    return candidates + [d for d in pending if d not in candidates]
+
+
+def two_stage_query(db, collection, query_embedding, n_results: int = 8, where: Dict | None = None,
+                    include=("documents", "metadatas")) -> Dict:
+    """Route to candidate documents, then search chunks only within them."""
+    from services.resources import get_collection
+
+    with stage("routing"):
+        candidates = route_documents(db, query_embedding, get_collection(routing_collection_name(collection.name)),
+                                     where=where)
+    note(candidate_docs=candidates)
+    if candidates:
+        doc_filter = {"doc_id": {"$in": candidates}}
+        results = collection.query(query_embeddings=[query_embedding], n_results=n_results,
+                                   where={"$and": [doc_filter, where]} if where else doc_filter,
+                                   include=list(include))
+        if results.get("ids") and results["ids"][0]:
+            return results
+    return collection.query(query_embeddings=[query_embedding], n_results=n_results, where=where,
+                            include=list(include))
@@ -0,0 +1,230 @@
+import os
+import re
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Set
+
+import numpy as np
+
+from services.vector_store import VectorStore, empty_query_result
+
+# ---------------------------
+# ✅ Configuration
+# ---------------------------
+# How new index versions are partitioned: "none", "hash" (crc32 of doc_id
+# modulo VECTOR_STORE_SHARDS) or "insurer" (one shard per Document.insurer).
+SHARD_BY = os.getenv("SHARD_BY", "none").lower()
+VECTOR_STORE_SHARDS = int(os.getenv("VECTOR_STORE_SHARDS", "4"))
+SHARD_QUERY_WORKERS = int(os.getenv("SHARD_QUERY_WORKERS", "8"))
+# Minimum seconds between insurer shard list lookups (the lookup itself is
+# cached until the documents table changes, see resources._insurer_shard_keys)
+SHARD_KEYS_TTL = float(os.getenv("SHARD_KEYS_TTL", "0"))
+DEFAULT_SHARD = "default"
+
+_CHUNK_ID_DOC = re.compile(r"^doc(\d+)_")
+_executor = ThreadPoolExecutor(max_workers=SHARD_QUERY_WORKERS, thread_name_prefix="shard-query")
+
+
+def sharding_config() -> Dict | None:
+    """Sharding layout for a new index version, from the environment."""
+    if SHARD_BY in ("", "none"):
+        return None
+    if SHARD_BY == "hash":
+        if VECTOR_STORE_SHARDS < 2:
+            return None
+        return {"by": "hash", "shards": VECTOR_STORE_SHARDS, "generations": {}}
+    if SHARD_BY == "insurer":
+        return {"by": "insurer", "generations": {}}
+    raise ValueError(f"Unknown SHARD_BY: {SHARD_BY}")
+
+
+def insurer_slug(insurer: str | None) -> str:
+    """Shard key for an insurer name (safe inside a collection name)."""
+    slug = re.sub(r"[^a-z0-9]+", "-", (insurer or "").lower()).strip("-")[:30].strip("-")
+    return slug or DEFAULT_SHARD
+
+
+def shard_key_for(sharding: Dict, doc_id=None, insurer: str | None = None) -> str:
+    if sharding["by"] == "hash":
+        return f"s{zlib.crc32(str(doc_id).encode()) % sharding['shards']}"
+    return insurer_slug(insurer)
+
+
+def shard_collection_name(name: str, sharding: Dict, key: str) -> str:
+    generation = (sharding.get("generations") or {}).get(key, 0)
+    return f"{name}_{key}" if not generation else f"{name}_{key}_g{generation}"
+
+
+def _values(condition) -> List | None:
+    """Values a simple where condition pins a field to, or None if unconstrained."""
+    if isinstance(condition, dict):
+        if "$eq" in condition:
+            return [condition["$eq"]]
+        if "$in" in condition:
+            return list(condition["$in"])
+        return None
+    return [condition]
+
+
+class ShardedVectorStore(VectorStore):
+    """Fan-out over per-shard collections with the usual Chroma-shaped API.
+
+    Chunks are routed to a shard by their metadata (doc_id hash or insurer).
+    Queries run on every relevant shard concurrently and the per-shard top-k
+    lists are merged by distance, so callers see one collection. Shards are
+    opened lazily and rebuilt independently (see index_service.rebuild_shard).
+    Only writes create shards; reads only open shards in shard_keys(), so a
+    filter on an unknown insurer returns nothing instead of a new collection.
+    """
+
+    def __init__(self, name: str, sharding: Dict, opener: Callable[[str], VectorStore],
+                 list_keys: Callable[[], Iterable[str]] | None = None):
+        self.name = name
+        self.sharding = sharding
+        self._open = opener
+        self._list_keys = list_keys
+        self._keys: Set[str] = set()
+        self._keys_checked = 0.0
+
+    # ---------------------------
+    # ✅ Shard Routing
+    # ---------------------------
+    def shard(self, key: str) -> VectorStore:
+        """Open (creating it if needed) the shard for `key`; the write path."""
+        self._keys.add(key)
+        return self._open(shard_collection_name(self.name, self.sharding, key))
+
+    def _existing(self, key: str) -> VectorStore:
+        """Open a shard for reading; `key` comes from shard_keys(), so this registers nothing."""
+        return self._open(shard_collection_name(self.name, self.sharding, key))
+
+    def shard_keys(self) -> List[str]:
+        if self.sharding["by"] == "hash":
+            return [f"s{i}" for i in range(self.sharding["shards"])]
+        now = time.monotonic()
+        if self._list_keys is not None and now - self._keys_checked > SHARD_KEYS_TTL:
+            self._keys.update(self._list_keys())
+            self._keys_checked = now
+        return sorted(self._keys | set((self.sharding.get("generations") or {}).keys()))
+
+    def collection_names(self) -> List[str]:
+        return [shard_collection_name(self.name, self.sharding, key) for key in self.shard_keys()]
+
+    def _key_for_meta(self, meta: Dict | None) -> str:
+        meta = meta or {}
+        return shard_key_for(self.sharding, doc_id=meta.get("doc_id"), insurer=meta.get("insurer"))
+
+    def _keys_for_where(self, where: Dict | None) -> List[str]:
+        """Existing shards that can hold rows matching `where` (all of them unless it pins the shard field)."""
+        field = "doc_id" if self.sharding["by"] == "hash" else "insurer"
+        conditions = list((where or {}).get("$and", [])) + [where or {}]
+        for condition in conditions:
+            if field in condition:
+                values = _values(condition[field])
+                if values is not None:
+                    if field == "doc_id":
+                        return sorted({shard_key_for(self.sharding, doc_id=v) for v in values})
+                    return sorted({insurer_slug(v) for v in values} & set(self.shard_keys()))
+        return self.shard_keys()
+
+    def _keys_for_ids(self, ids: List[str]) -> Dict[str, List[str]] | None:
+        """Group chunk ids ("doc{doc_id}_...") by shard; None if they cannot be routed."""
+        if self.sharding["by"] != "hash":
+            return None
+        groups: Dict[str, List[str]] = {}
+        for cid in ids:
+            m = _CHUNK_ID_DOC.match(cid)
+            if not m:
+                return None
+            groups.setdefault(shard_key_for(self.sharding, doc_id=int(m.group(1))), []).append(cid)
+        return groups
+
+    def _map(self, keys: List[str], fn) -> List:
+        if len(keys) == 1:
+            return [fn(self._existing(keys[0]))]
+        return list(_executor.map(lambda key: fn(self._existing(key)), keys))
+
+    # ---------------------------
+    # ✅ Collection API
+    # ---------------------------
+    def add(self, ids, embeddings, documents=None, metadatas=None):
+        ids = list(ids)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        groups: Dict[str, List[int]] = {}
+        for i in range(len(ids)):
+            groups.setdefault(self._key_for_meta(metadatas[i] if metadatas is not None else None), []).append(i)
+        for key, rows in groups.items():
+            self.shard(key).add(
+                ids=[ids[i] for i in rows],
+                embeddings=embeddings[rows],
+                documents=[documents[i] for i in rows] if documents is not None else None,
+                metadatas=[metadatas[i] for i in rows] if metadatas is not None else None,
+            )
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("documents", "metadatas", "distances")):
+        include = list(include)
+        shard_include = include if "distances" in include else include + ["distances"]
+        keys = self._keys_for_where(where)
+        n_queries = len(query_embeddings)
+        if not keys:
+            return empty_query_result(n_queries, include)
+        partials = self._map(keys, lambda store: store.query(
+            query_embeddings, n_results=n_results, where=where, include=shard_include))
+
+        merged = empty_query_result(n_queries, include)
+        for q in range(n_queries):
+            candidates = []
+            for p, part in enumerate(partials):
+                for pos, distance in enumerate(part["distances"][q]):
+                    candidates.append((float(distance), p, pos))
+            candidates.sort()
+            for _, p, pos in candidates[:n_results]:
+                merged["ids"][q].append(partials[p]["ids"][q][pos])
+                for field in include:
+                    merged[field][q].append(partials[p][field][q][pos])
+        return merged
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None):
+        include = list(include)
+        groups = self._keys_for_ids(list(ids)) if ids is not None else None
+        if groups is not None:
+            if where is not None:
+                keys = set(self._keys_for_where(where))
+                groups = {k: v for k, v in groups.items() if k in keys}
+            calls = [(key, chunk_ids) for key, chunk_ids in groups.items()]
+        else:
+            calls = [(key, ids) for key in self._keys_for_where(where)]
+        if not calls:
+            return {"ids": [], **{field: [] for field in include}}
+        partials = list(_executor.map(
+            lambda call: self._existing(call[0]).get(ids=call[1], where=where, include=include, limit=limit), calls))
+
+        merged: Dict[str, List] = {"ids": [], **{field: [] for field in include}}
+        for part in partials:
+            merged["ids"].extend(part["ids"])
+            for field in include:
+                values = part.get(field)
+                if values is not None:
+                    merged[field].extend(list(values))
+        if limit is not None:
+            merged = {field: values[:limit] for field, values in merged.items()}
+        if "embeddings" in include and merged["embeddings"]:
+            merged["embeddings"] = np.asarray(merged["embeddings"])
+        return merged
+
+    def delete(self, ids=None, where=None):
+        groups = self._keys_for_ids(list(ids)) if ids is not None else None
+        if groups is not None:
+            for key, chunk_ids in groups.items():
+                self._existing(key).delete(ids=chunk_ids, where=where)
+            return
+        for key in self._keys_for_where(where):
+            self._existing(key).delete(ids=ids, where=where)
+
+    def count(self) -> int:
+        return sum(self._map(self.shard_keys(), lambda store: store.count()))
+
+    def shard_counts(self) -> Dict[str, int]:
+        keys = self.shard_keys()
+        return dict(zip(keys, self._map(keys, lambda store: store.count())))
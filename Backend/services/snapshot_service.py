@@ -0,0 +1,390 @@
+"""Snapshots of the database and active vector index for replica bootstrap.
+
+A snapshot is one gzip-compressed tar holding the `documents`, `queries`,
+`text_blobs` and `query_archives` rows plus the query archive files they
+list, the active IndexVersion row, and the chunk and routing
+collections of that index (ids, texts, metadata and float32 embeddings), so a
+new node restores it without re-embedding a single PDF. Rows are read inside
+one explicit SQLite read transaction (pysqlite does not BEGIN before a
+SELECT on its own, so export issues the BEGIN itself) and the vector export
+is limited to the documents in that read, which keeps the two halves
+consistent while uploads continue.
+
+Every snapshot lists the chunk ids it covers. An incremental snapshot is
+taken against a previous snapshot file and ships only the chunks added or
+deleted since then, queries newer than the base, archive files written
+since the base (the replica drops the hot rows they hold), and the (small)
+documents table in full. Importing one requires the node to have applied
+exactly that base snapshot last.
+"""
+import base64
+import io
+import json
+import os
+import tarfile
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+from sqlalchemy import DateTime, LargeBinary
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from services.change_feed import INDEX_COUNTER
+from services.db_service import (
+    Document, IndexVersion, QueryArchive, QueryLog, SnapshotRecord, TextBlob, VERSIONED_TABLES,
+    bump_table_versions, rebuild_rollups,
+)
+from services.query_archive import (
+    ARCHIVE_PATH_RE, QUERY_ARCHIVE_DIR, delete_orphan_blobs, read_archive_file, remove_archive_file,
+    restore_archive_file,
+)
+from services.routing_service import routing_collection_name
+
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_COMPRESSLEVEL = int(os.getenv("SNAPSHOT_COMPRESSLEVEL", "6"))
+# Chunks written to the vector store per add() call on import
+SNAPSHOT_IMPORT_BATCH = int(os.getenv("SNAPSHOT_IMPORT_BATCH", "1000"))
+
+TABLES = (Document, QueryLog, TextBlob, QueryArchive)
+# SQLite's default limit on bound parameters is 999
+_DELETE_BATCH = 500
+
+
+# ---------------------------
+# ✅ Row (de)serialisation
+# ---------------------------
+def _dump_row(table, row) -> Dict:
+    out = {}
+    for column in table.columns:
+        value = row._mapping[column]
+        if value is not None and isinstance(column.type, DateTime):
+            value = value.isoformat()
+        elif value is not None and isinstance(column.type, LargeBinary):
+            value = base64.b64encode(value).decode("ascii")
+        out[column.name] = value
+    return out
+
+
+def _load_row(table, record: Dict) -> Dict:
+    out = {}
+    for column in table.columns:
+        if column.name not in record:
+            continue
+        value = record[column.name]
+        if value is not None and isinstance(column.type, DateTime):
+            value = datetime.fromisoformat(value)
+        elif value is not None and isinstance(column.type, LargeBinary):
+            value = base64.b64decode(value)
+        out[column.name] = value
+    return out
+
+
+def _jsonl(records) -> bytes:
+    return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+
+
+def _read_jsonl(payload: bytes | None) -> List[Dict]:
+    if not payload:
+        return []
+    return [json.loads(line) for line in payload.decode("utf-8").splitlines() if line]
+
+
+def _npy(array: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    np.save(buf, np.asarray(array, dtype=np.float32))
+    return buf.getvalue()
+
+
+# ---------------------------
+# ✅ Archive I/O
+# ---------------------------
+def _add_member(tar: tarfile.TarFile, name: str, payload: bytes):
+    info = tarfile.TarInfo(name)
+    info.size = len(payload)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(payload))
+
+
+def read_snapshot(path: str, manifest_only: bool = False) -> Dict[str, bytes]:
+    """All members of a snapshot archive (or just manifest + chunk ids) in one sequential pass."""
+    wanted = {"manifest.json", "chunk_ids.json"}
+    members: Dict[str, bytes] = {}
+    with tarfile.open(path, "r:gz") as tar:
+        for info in tar:
+            if manifest_only and info.name not in wanted:
+                continue
+            f = tar.extractfile(info)
+            if f is not None:
+                members[info.name] = f.read()
+            if manifest_only and wanted <= members.keys():
+                break
+    if "manifest.json" not in members:
+        raise ValueError(f"{path} is not a snapshot (no manifest.json)")
+    manifest = json.loads(members["manifest.json"])
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported snapshot format: {manifest.get('format')}")
+    return members
+
+
+def read_manifest(path: str) -> Dict:
+    return json.loads(read_snapshot(path, manifest_only=True)["manifest.json"])
+
+
+# ---------------------------
+# ✅ Export
+# ---------------------------
+def _index_stores(collection_name: str, sharding: Dict | None) -> Dict:
+    """An index version's collections, keyed by role rather than by name."""
+    from services.resources import get_collection
+    return {
+        "chunks": get_collection(collection_name, sharding),
+        "routing": get_collection(routing_collection_name(collection_name)),
+    }
+
+
+def export_snapshot(db, out_path: str, since: str | None = None) -> Dict:
+    """Write a full snapshot to out_path, or an incremental one against the snapshot file `since`."""
+    from services.index_service import get_active_index
+
+    base = None
+    base_ids: Dict[str, List[str]] = {}
+    if since:
+        members = read_snapshot(since, manifest_only=True)
+        base = json.loads(members["manifest.json"])
+        base_ids = json.loads(members.get("chunk_ids.json") or b"{}")
+
+    # One read transaction for every table, so the rows agree with each other.
+    # pysqlite only opens transactions before writes, so a bare SELECT sequence
+    # would see a different database state per statement; BEGIN explicitly.
+    # The first get_active_index may bootstrap (and commit) the index row.
+    get_active_index(db)
+    db.rollback()
+    db.connection().exec_driver_sql("BEGIN")
+    version = get_active_index(db)
+    if base is not None and base["index_version"]["id"] != version.id:
+        raise ValueError("The active index changed since the base snapshot; take a full snapshot instead")
+    version_row = _dump_row(IndexVersion.__table__, db.execute(
+        IndexVersion.__table__.select().where(IndexVersion.id == version.id)).one())
+    documents = [_dump_row(Document.__table__, r) for r in db.execute(
+        Document.__table__.select().order_by(Document.id))]
+    query_stmt = QueryLog.__table__.select().order_by(QueryLog.id)
+    if base is not None:
+        query_stmt = query_stmt.where(QueryLog.id > base["max_query_id"])
+    queries = [_dump_row(QueryLog.__table__, r) for r in db.execute(query_stmt)]
+    blob_stmt = TextBlob.__table__.select()
+    if base is not None:
+        hashes = {q[c] for q in queries for c in ("raw_context_hash", "raw_response_hash") if q.get(c)}
+        blob_stmt = blob_stmt.where(TextBlob.hash.in_(hashes))
+    blobs = [_dump_row(TextBlob.__table__, r) for r in db.execute(blob_stmt)]
+    # Archive files are written before their catalog row commits and never change after
+    archives = [_dump_row(QueryArchive.__table__, r) for r in db.execute(
+        QueryArchive.__table__.select().order_by(QueryArchive.id))]
+    base_archives = set(base.get("archives", [])) if base is not None else set()
+    new_archives = [a for a in archives if a["path"] not in base_archives]
+    max_query_id = queries[-1]["id"] if queries else (base["max_query_id"] if base else 0)
+    stores = _index_stores(version.collection_name, version.sharding)
+    # Release the read lock before the (much longer) vector export
+    db.rollback()
+
+    doc_ids = {d["id"] for d in documents}
+    chunk_ids: Dict[str, List[str]] = {}
+    collections: Dict[str, Dict] = {}
+    vectors: Dict[str, bytes] = {}
+    for key, store in stores.items():
+        rows = store.get(include=["documents", "metadatas", "embeddings"])
+        texts = rows.get("documents") or [None] * len(rows["ids"])
+        metadatas = rows.get("metadatas") or [{}] * len(rows["ids"])
+        # Chunks of documents uploaded after the table read belong to the next snapshot
+        keep = [i for i, meta in enumerate(metadatas) if (meta or {}).get("doc_id") in doc_ids]
+        current = [rows["ids"][i] for i in keep]
+        previous = set(base_ids.get(key, []))
+        added = [i for i in keep if rows["ids"][i] not in previous]
+        deleted = sorted(previous - set(current))
+
+        records = [{"id": rows["ids"][i], "document": texts[i], "metadata": metadatas[i]} for i in added]
+        embeddings = np.asarray(rows["embeddings"], dtype=np.float32)[added] if added else np.zeros((0, 0))
+        vectors[f"vectors/{key}.jsonl"] = _jsonl(records)
+        vectors[f"vectors/{key}.npy"] = _npy(embeddings)
+        chunk_ids[key] = current
+        collections[key] = {"total": len(current), "added": len(added), "deleted": deleted}
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "id": f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}",
+        "kind": "incremental" if base is not None else "full",
+        "base_id": base["id"] if base is not None else None,
+        "created_at": datetime.utcnow().isoformat(),
+        "index_version": version_row,
+        "document_ids": sorted(doc_ids),
+        "max_query_id": max_query_id,
+        "counts": {"documents": len(documents), "queries": len(queries), "text_blobs": len(blobs),
+                   "query_archives": len(new_archives)},
+        "archives": [a["path"] for a in archives],
+        "collections": collections,
+    }
+    # Manifest and chunk ids first: using a snapshot as a base only reads the head of the archive
+    with tarfile.open(out_path, "w:gz", compresslevel=SNAPSHOT_COMPRESSLEVEL) as tar:
+        _add_member(tar, "manifest.json", json.dumps(manifest, indent=2).encode("utf-8"))
+        _add_member(tar, "chunk_ids.json", json.dumps(chunk_ids).encode("utf-8"))
+        _add_member(tar, "db/documents.jsonl", _jsonl(documents))
+        _add_member(tar, "db/queries.jsonl", _jsonl(queries))
+        _add_member(tar, "db/text_blobs.jsonl", _jsonl(blobs))
+        _add_member(tar, "db/query_archives.jsonl", _jsonl(new_archives))
+        for archive in new_archives:
+            tar.add(os.path.join(QUERY_ARCHIVE_DIR, archive["path"]), arcname=f"archives/{archive['path']}")
+        for name, payload in vectors.items():
+            _add_member(tar, name, payload)
+
+    _record(db, manifest, "export", out_path)
+    return manifest
+
+
+# ---------------------------
+# ✅ Import
+# ---------------------------
+def last_imported_snapshot(db) -> SnapshotRecord | None:
+    return (
+        db.query(SnapshotRecord)
+        .filter(SnapshotRecord.direction == "import")
+        .order_by(SnapshotRecord.applied_at.desc())
+        .first()
+    )
+
+
+def _record(db, manifest: Dict, direction: str, path: str):
+    db.add(SnapshotRecord(
+        snapshot_id=manifest["id"],
+        kind=manifest["kind"],
+        base_id=manifest["base_id"],
+        direction=direction,
+        path=os.path.abspath(path),
+        index_version_id=manifest["index_version"]["id"],
+        chunks_added=sum(c["added"] for c in manifest["collections"].values()),
+        chunks_deleted=sum(len(c["deleted"]) for c in manifest["collections"].values()),
+        applied_at=datetime.utcnow(),
+    ))
+    db.commit()
+
+
+def _restore_vectors(version: IndexVersion, members: Dict[str, bytes], manifest: Dict, replace: bool) -> None:
+    from services.resources import get_chroma_client, forget_collection
+    from services.vector_store import VECTOR_STORE_BACKEND, drop_vector_store
+
+    if replace:
+        names = [routing_collection_name(version.collection_name), version.collection_name]
+        if version.sharding:
+            from services.resources import get_collection
+            names += get_collection(version.collection_name, version.sharding).collection_names()
+        client = get_chroma_client() if VECTOR_STORE_BACKEND == "chroma" else None
+        for name in names:
+            drop_vector_store(name, client=client)
+            forget_collection(name)
+
+    for key, store in _index_stores(version.collection_name, version.sharding).items():
+        deleted = manifest["collections"][key]["deleted"]
+        if deleted:
+            store.delete(ids=deleted)
+        records = _read_jsonl(members.get(f"vectors/{key}.jsonl"))
+        if not records:
+            continue
+        embeddings = np.load(io.BytesIO(members[f"vectors/{key}.npy"]))
+        for start in range(0, len(records), SNAPSHOT_IMPORT_BATCH):
+            batch = records[start:start + SNAPSHOT_IMPORT_BATCH]
+            store.add(
+                ids=[r["id"] for r in batch],
+                embeddings=embeddings[start:start + len(batch)],
+                documents=[r["document"] or "" for r in batch],
+                metadatas=[r["metadata"] for r in batch],
+            )
+
+
+def _restore_archives(db, members: Dict[str, bytes], full: bool) -> tuple[List[Dict], List[str]]:
+    """Write the snapshot's new archive files; returns (catalog rows to insert, local paths to drop).
+
+    The files are unreferenced until the caller commits their catalog rows.
+    """
+    archives = [_load_row(QueryArchive.__table__, r) for r in _read_jsonl(members.get("db/query_archives.jsonl"))]
+    local = {row[0] for row in db.query(QueryArchive.path).all()}
+    incoming = {a["path"] for a in archives}
+    archives = [a for a in archives if full or a["path"] not in local]
+    for archive in archives:
+        payload = members.get(f"archives/{archive['path']}")
+        if payload is None or not ARCHIVE_PATH_RE.match(archive["path"]):
+            raise ValueError(f"Snapshot lists query archive {archive['path']!r} but does not carry it")
+        restore_archive_file(archive["path"], payload)
+        archive.pop("id", None)
+    stale = sorted(local - incoming) if full else []
+    return archives, stale
+
+
+def import_snapshot(db, path: str, force: bool = False) -> Dict:
+    """Restore a snapshot on this node. Full snapshots replace the local tables and active index.
+
+    Run a full import while the node is not serving traffic; incremental
+    imports only add rows and chunks and are safe on a live replica.
+    """
+    from services.resources import invalidate_active_index
+
+    members = read_snapshot(path)
+    manifest = json.loads(members["manifest.json"])
+    full = manifest["kind"] == "full"
+    if not full and not force:
+        last = last_imported_snapshot(db)
+        if last is None or last.snapshot_id != manifest["base_id"]:
+            raise ValueError(
+                f"Snapshot {manifest['id']} applies on top of {manifest['base_id']}, but this node last "
+                f"imported {last.snapshot_id if last else 'nothing'}; import the missing snapshots or a full one"
+            )
+
+    version = IndexVersion(**_load_row(IndexVersion.__table__, manifest["index_version"]))
+    if not full and db.get(IndexVersion, version.id) is None:
+        raise ValueError(f"Index version {version.id} is missing here; import a full snapshot first")
+    _restore_vectors(version, members, manifest, replace=full)
+
+    documents = [_load_row(Document.__table__, r) for r in _read_jsonl(members.get("db/documents.jsonl"))]
+    queries = [_load_row(QueryLog.__table__, r) for r in _read_jsonl(members.get("db/queries.jsonl"))]
+    blobs = [_load_row(TextBlob.__table__, r) for r in _read_jsonl(members.get("db/text_blobs.jsonl"))]
+    archives, stale_archives = _restore_archives(db, members, full)
+    conn = db.connection()
+    if full:
+        for table in TABLES:
+            conn.execute(table.__table__.delete())
+        conn.execute(IndexVersion.__table__.delete())
+        conn.execute(IndexVersion.__table__.insert(), [_load_row(IndexVersion.__table__, manifest["index_version"])])
+    else:
+        conn.execute(Document.__table__.delete().where(Document.id.not_in(manifest["document_ids"])))
+    if documents:
+        stmt = sqlite_insert(Document.__table__)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=["id"],
+            set_={c.name: stmt.excluded[c.name] for c in Document.__table__.columns if c.name != "id"},
+        ), documents)
+    if blobs:
+        conn.execute(sqlite_insert(TextBlob.__table__).on_conflict_do_nothing(), blobs)
+    if queries:
+        conn.execute(sqlite_insert(QueryLog.__table__).on_conflict_do_nothing(), queries)
+    if archives:
+        conn.execute(QueryArchive.__table__.insert(), archives)
+        if not full:
+            # Rows the source archived since the base are still hot here
+            archived_ids = [row.id for a in archives
+                            for row in read_archive_file(os.path.join(QUERY_ARCHIVE_DIR, a["path"]))]
+            for i in range(0, len(archived_ids), _DELETE_BATCH):
+                conn.execute(QueryLog.__table__.delete().where(QueryLog.id.in_(archived_ids[i:i + _DELETE_BATCH])))
+            delete_orphan_blobs(db)
+    bump_table_versions(conn, (VERSIONED_TABLES | {INDEX_COUNTER}) if full else VERSIONED_TABLES)
+    db.commit()
+    for rel_path in stale_archives:
+        remove_archive_file(rel_path)
+    # Analytics rollups are derived data: recompute them from the restored queries and archives
+    rebuild_rollups(db)
+    invalidate_active_index()
+
+    _record(db, manifest, "import", path)
+    return manifest
+
+
+def list_snapshots(db, limit: int = 20) -> List[SnapshotRecord]:
+    return db.query(SnapshotRecord).order_by(SnapshotRecord.applied_at.desc()).limit(limit).all()
@@ -0,0 +1,161 @@
+import os
+from typing import Dict, List, Sequence
+
+# ---------------------------
+# ✅ Vector Store Interface
+# ---------------------------
+# Routes and retrieval code only use add/query/get/count/delete with Chroma's
+# argument and result shapes, so any backend exposing the same calls can be
+# swapped in via VECTOR_STORE_BACKEND ("chroma" or "numpy").
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "chroma").lower()
+
+# HNSW settings for newly created Chroma collections (unset = Chroma defaults).
+# Only ef_search can be changed on an existing collection; the rest require a rebuild.
+HNSW_ENV = {
+    "space": "CHROMA_HNSW_SPACE",
+    "max_neighbors": "CHROMA_HNSW_M",
+    "ef_construction": "CHROMA_HNSW_EF_CONSTRUCTION",
+    "ef_search": "CHROMA_HNSW_EF_SEARCH",
+}
+HNSW_SPACES = ("cosine", "l2", "ip")
+
+
+def hnsw_configuration(overrides: Dict | None = None) -> Dict:
+    """Build a Chroma HNSW configuration from the environment plus overrides."""
+    config: Dict = {}
+    for key, env in HNSW_ENV.items():
+        value = os.getenv(env)
+        if value:
+            config[key] = value if key == "space" else int(value)
+    config.update(overrides or {})
+    if "space" in config and config["space"] not in HNSW_SPACES:
+        raise ValueError(f"Unsupported HNSW space: {config['space']}")
+    return config
+
+
+def open_chroma_collection(client, name: str, hnsw: Dict | None = None):
+    """Get or create a Chroma collection, applying HNSW settings where Chroma allows."""
+    hnsw = hnsw_configuration() if hnsw is None else hnsw
+    try:
+        collection = client.get_collection(name=name)
+    except Exception:
+        if not hnsw:
+            return client.get_or_create_collection(name=name)
+        print(f"[INFO] Creating collection {name} with HNSW settings {hnsw}")
+        return client.get_or_create_collection(name=name, configuration={"hnsw": hnsw})
+    if "ef_search" in hnsw:
+        try:
+            collection.modify(configuration={"hnsw": {"ef_search": hnsw["ef_search"]}})
+        except Exception as e:
+            print(f"[WARN] Could not update ef_search on {name}: {e}")
+    return collection
+
+
+class VectorStore:
+    """Minimal collection API shared by all backends (Chroma-compatible shapes)."""
+
+    name: str = ""
+
+    def add(self, ids: Sequence[str], embeddings, documents: Sequence[str] | None = None,
+            metadatas: Sequence[Dict] | None = None):
+        raise NotImplementedError
+
+    def query(self, query_embeddings, n_results: int = 10, where: Dict | None = None,
+              include: Sequence[str] = ("documents", "metadatas", "distances")) -> Dict:
+        """Return {"ids": [[...]], "documents": [[...]], ...}, one inner list per query."""
+        raise NotImplementedError
+
+    def get(self, ids: Sequence[str] | None = None, where: Dict | None = None,
+            include: Sequence[str] = ("documents", "metadatas"), limit: int | None = None) -> Dict:
+        raise NotImplementedError
+
+    def delete(self, ids: Sequence[str] | None = None, where: Dict | None = None):
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+
+class ChromaVectorStore(VectorStore):
+    """Thin adapter over a Chroma collection."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.name = collection.name
+        try:
+            self.max_batch_size = collection._client.get_max_batch_size()
+        except Exception:
+            self.max_batch_size = 1000
+
+    def add(self, ids, embeddings, documents=None, metadatas=None):
+        ids = list(ids)
+        for start in range(0, len(ids), self.max_batch_size):
+            end = start + self.max_batch_size
+            self.collection.add(
+                ids=ids[start:end],
+                embeddings=embeddings[start:end],
+                documents=list(documents[start:end]) if documents is not None else None,
+                metadatas=list(metadatas[start:end]) if metadatas is not None else None,
+            )
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("documents", "metadatas", "distances")):
+        kwargs = {"query_embeddings": query_embeddings, "n_results": n_results, "include": list(include)}
+        if where:
+            kwargs["where"] = where
+        return self.collection.query(**kwargs)
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None):
+        kwargs = {"include": list(include)}
+        if ids is not None:
+            kwargs["ids"] = list(ids)
+        if where:
+            kwargs["where"] = where
+        if limit is not None:
+            kwargs["limit"] = limit
+        return self.collection.get(**kwargs)
+
+    def delete(self, ids=None, where=None):
+        kwargs = {}
+        if ids is not None:
+            kwargs["ids"] = list(ids)
+        if where:
+            kwargs["where"] = where
+        self.collection.delete(**kwargs)
+
+    def count(self) -> int:
+        return self.collection.count()
+
+
+def open_vector_store(name: str, backend: str | None = None, client=None) -> VectorStore:
+    """Open (or create) the named collection on the configured backend."""
+    backend = (backend or VECTOR_STORE_BACKEND).lower()
+    if backend == "chroma":
+        return ChromaVectorStore(open_chroma_collection(client, name))
+    if backend == "numpy":
+        from services.mmap_vector_store import MmapVectorStore, NUMPY_STORE_PATH
+        return MmapVectorStore(os.path.join(NUMPY_STORE_PATH, name), name=name)
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+
+def drop_vector_store(name: str, backend: str | None = None, client=None) -> None:
+    """Delete the named collection and its data (used to discard old index versions)."""
+    backend = (backend or VECTOR_STORE_BACKEND).lower()
+    if backend == "chroma":
+        try:
+            client.delete_collection(name)
+        except Exception as e:
+            # Already gone (or never created): nothing to drop
+            print(f"[WARN] Could not delete collection {name}: {e}")
+    elif backend == "numpy":
+        import shutil
+        from services.mmap_vector_store import NUMPY_STORE_PATH
+        shutil.rmtree(os.path.join(NUMPY_STORE_PATH, name), ignore_errors=True)
+    else:
+        raise ValueError(f"Unknown vector store backend: {backend}")
+
+
+def empty_query_result(n_queries: int, include: Sequence[str]) -> Dict:
+    result: Dict[str, List] = {"ids": [[] for _ in range(n_queries)]}
+    for key in include:
+        result[key] = [[] for _ in range(n_queries)]
+    return result
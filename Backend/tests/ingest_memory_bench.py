@@ -0,0 +1,161 @@
+"""Ingestion memory benchmark: float32 embedding arrays vs lists of Python floats.
+
+Renders one synthetic policy PDF (1,000 pages by default) and ingests it the
+way /api/process-pdf does (load, chunk, embed, store) in mock mode, once per
+embedding representation, each in its own subprocess:
+
+  lists    embeddings converted to lists of Python floats, as get_embeddings
+           used to return them (one 24-byte float object per dimension)
+  float32  the (chunks, dim) float32 array get_embeddings returns now
+
+Peak RSS is reported for the whole run and for the embed+store step alone
+(the peak is reset after parsing via /proc/self/clear_refs on Linux). Run
+from the repository root:
+
+    python Backend/tests/ingest_memory_bench.py --pages 1000 --backend numpy
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_DIR)
+
+MODES = ["lists", "float32"]
+CLAUSE = ("{n}. The insurer will pay reasonable and customary charges for treatment of the insured person, "
+          "subject to the waiting period of {months} months and the sub-limits in the schedule.")
+
+
+def make_pdf(path: str, pages: int):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    c = canvas.Canvas(path, pagesize=letter)
+    for page in range(pages):
+        c.setFont("Helvetica", 8)
+        c.drawString(40, 760, f"Section {page // 10 + 1}: Coverage Terms")
+        for line in range(30):
+            c.drawString(40, 740 - line * 22, CLAUSE.format(n=line + 1, months=(page + line) % 48))
+        c.showPage()
+    c.save()
+
+
+def rss_mb() -> tuple[float, float]:
+    """Current and peak resident set size in MB (Linux /proc, else ru_maxrss)."""
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f)
+        return int(fields["VmRSS"].split()[0]) / 1024, int(fields["VmHWM"].split()[0]) / 1024
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return peak, peak
+
+
+def reset_peak_rss() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def run_mode(mode: str, pdf_path: str, work_dir: str, backend: str) -> dict:
+    os.environ["GEMINI_API_KEY"] = "mock_key"
+    from services.llm_service import LLMService
+    from services.retrieval_service import chunk_pages, load_pdf_pages, store_chunks
+
+    if backend == "chroma":
+        import chromadb
+        from chromadb.config import Settings
+        from services.vector_store import ChromaVectorStore
+        client = chromadb.PersistentClient(path=work_dir, settings=Settings(anonymized_telemetry=False))
+        store = ChromaVectorStore(client.get_or_create_collection(name="bench"))
+    else:
+        from services.mmap_vector_store import MmapVectorStore
+        store = MmapVectorStore(work_dir, name="bench")
+
+    llm_service = LLMService()
+    baseline, _ = rss_mb()
+
+    started = time.perf_counter()
+    pages = load_pdf_pages(pdf_path)
+    texts, metadatas = chunk_pages(pages, 1)
+    del pages
+    parse_s = time.perf_counter() - started
+    after_parse, parse_peak = rss_mb()
+
+    peak_reset = reset_peak_rss()
+    started = time.perf_counter()
+    embeddings = llm_service.get_embeddings(texts)
+    if mode == "lists":
+        embeddings = embeddings.tolist()
+    store_chunks(store, 1, texts, embeddings, metadatas)
+    del embeddings
+    embed_s = time.perf_counter() - started
+    _, embed_peak = rss_mb()
+
+    return {
+        "mode": mode,
+        "chunks": len(texts),
+        "parse_s": round(parse_s, 2),
+        "embed_store_s": round(embed_s, 2),
+        "baseline_rss_mb": round(baseline, 1),
+        "parse_peak_mb": round(parse_peak, 1),
+        "embed_store_peak_mb": round(embed_peak, 1) if peak_reset else None,
+        "embed_store_delta_mb": round(embed_peak - after_parse, 1) if peak_reset else None,
+        "peak_rss_mb": round(max(parse_peak, embed_peak), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--backend", choices=["chroma", "numpy"], default="numpy")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--json", dest="json_path")
+    parser.add_argument("--child", nargs=3, metavar=("MODE", "PDF", "WORKDIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_mode(args.child[0], args.child[1], args.child[2], args.backend)))
+        return
+
+    tmp = tempfile.mkdtemp(prefix="ingest_bench_")
+    try:
+        pdf_path = os.path.join(tmp, "policy.pdf")
+        make_pdf(pdf_path, args.pages)
+
+        results = []
+        for mode in args.modes.split(","):
+            proc = subprocess.run(
+                [sys.executable, __file__, "--backend", args.backend, "--child", mode, pdf_path,
+                 os.path.join(tmp, mode)],
+                capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                print(f"[WARN] {mode} failed: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}")
+                continue
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+        print(f"{args.pages}-page PDF, {args.backend} vector store, mock embeddings")
+        if results:
+            columns = list(results[0].keys())
+            print("  ".join(f"{c:>20}" for c in columns))
+            for r in results:
+                print("  ".join(f"{str(r[c]):>20}" for c in columns))
+        if args.json_path:
+            with open(args.json_path, "w") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Startup-time benchmark.
+
+Measures `import main` in a fresh interpreter with `python -X importtime`,
+lists the slowest modules (cumulative, including their own imports) and then
+times the app lifespan start-up. Run from the repository root:
+
+    python Backend/tests/startup_bench.py [--top 25] [--json out.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+LIFESPAN_SNIPPET = """
+import time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    t2 = time.perf_counter()
+    client.get('/api/health')
+    t3 = time.perf_counter()
+print(f"{t1 - t0:.6f} {t2 - t1:.6f} {t3 - t2:.6f}")
+"""
+
+
+def parse_importtime(stderr: str):
+    """Parse `-X importtime` output into (module, self_us, cumulative_us, depth)."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def measure_imports():
+    env = dict(os.environ, WARMUP_MODE=os.environ.get("WARMUP_MODE", "off"))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+    return parse_importtime(proc.stderr)
+
+
+def measure_lifespan(mode: str):
+    env = dict(os.environ, WARMUP_MODE=mode)
+    proc = subprocess.run(
+        [sys.executable, "-c", LIFESPAN_SNIPPET],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+    import_s, startup_s, first_request_s = map(float, proc.stdout.strip().splitlines()[-1].split())
+    return {"import_s": import_s, "startup_s": startup_s, "first_request_s": first_request_s}
+
+
+def run(top: int, json_path: str | None):
+    started = time.perf_counter()
+    rows = measure_imports()
+    total_us = sum(r[1] for r in rows)
+    by_package: dict = {}
+    for name, self_us, _, _ in rows:
+        package = name.split(".")[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+
+    print(f"Total import time for `import main`: {total_us / 1e6:.3f}s ({len(rows)} modules)")
+    print(f"\nSlowest {top} modules (cumulative):")
+    for name, _, cumulative_us, _ in sorted(rows, key=lambda r: r[2], reverse=True)[:top]:
+        print(f"  {cumulative_us / 1e3:10.1f} ms  {name}")
+    print(f"\nSlowest {top} top-level packages (self time summed):")
+    for package, us in sorted(by_package.items(), key=lambda kv: kv[1], reverse=True)[:top]:
+        print(f"  {us / 1e3:10.1f} ms  {package}")
+
+    lifespan = {}
+    for mode in ("off", "background", "block"):
+        try:
+            lifespan[mode] = measure_lifespan(mode)
+        except RuntimeError as e:
+            lifespan[mode] = {"error": str(e).splitlines()[-1] if str(e) else "failed"}
+    print("\nLifespan start-up by WARMUP_MODE:")
+    for mode, result in lifespan.items():
+        if "error" in result:
+            print(f"  {mode:10s} error: {result['error']}")
+        else:
+            print(f"  {mode:10s} import {result['import_s']:.3f}s  startup {result['startup_s']:.3f}s  first request {result['first_request_s']:.3f}s")
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump({
+                "total_import_s": total_us / 1e6,
+                "modules": [{"module": n, "self_us": s, "cumulative_us": c} for n, s, c, _ in rows],
+                "packages_us": by_package,
+                "lifespan": lifespan,
+            }, f, indent=2)
+        print(f"\nWrote {json_path}")
+    print(f"\nBenchmark took {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+    run(args.top, args.json_path)
@@ -0,0 +1,162 @@
+"""Vector store benchmark: Chroma vs the memory-mapped NumPy backend.
+
+Builds each backend from the same synthetic (clustered) 768-dim corpus, then
+reports build time, query latency (p50/p95), recall@k against exact float32
+search, and process RSS. Each backend runs in its own subprocess so RSS
+numbers are not polluted by the others. Run from the repository root:
+
+    python Backend/tests/vector_store_bench.py --rows 50000 --queries 200
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_DIR)
+
+DIM = 768
+BACKENDS = ["chroma", "numpy-float16", "numpy-int8", "numpy-float16-ivf"]
+
+
+def make_corpus(rows: int, queries: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(8, rows // 250), DIM)).astype(np.float32)
+    corpus = centers[rng.integers(0, len(centers), rows)] + 0.6 * rng.normal(size=(rows, DIM)).astype(np.float32)
+    picks = rng.integers(0, rows, queries)
+    probes = corpus[picks] + 0.3 * rng.normal(size=(queries, DIM)).astype(np.float32)
+    return corpus.astype(np.float32), probes.astype(np.float32)
+
+
+def exact_neighbors(corpus: np.ndarray, probes: np.ndarray, k: int) -> np.ndarray:
+    from services.mmap_vector_store import normalize_rows
+    c = normalize_rows(corpus)
+    q = normalize_rows(probes)
+    scores = q @ c.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def rss_mb() -> tuple[float, float]:
+    """Current and peak resident set size in MB (Linux /proc, else ru_maxrss)."""
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f)
+        return int(fields["VmRSS"].split()[0]) / 1024, int(fields["VmHWM"].split()[0]) / 1024
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return peak, peak
+
+
+def run_backend(backend: str, data_path: str, work_dir: str, k: int) -> dict:
+    if backend.endswith("-ivf"):
+        # Use IVF even on small benchmark corpora
+        os.environ["NUMPY_IVF_MIN_ROWS"] = "0"
+    data = np.load(data_path)
+    corpus, probes, truth = data["corpus"], data["probes"], data["truth"]
+    ids = [f"row{i}" for i in range(len(corpus))]
+    docs = [f"chunk {i}" for i in range(len(corpus))]
+    metas = [{"doc_id": i % 50, "chunk_index": i} for i in range(len(corpus))]
+    del data
+
+    started = time.perf_counter()
+    if backend == "chroma":
+        import chromadb
+        from chromadb.config import Settings
+        from services.vector_store import ChromaVectorStore
+        client = chromadb.PersistentClient(path=work_dir, settings=Settings(anonymized_telemetry=False))
+        store = ChromaVectorStore(client.get_or_create_collection(name="bench"))
+    else:
+        from services.mmap_vector_store import MmapVectorStore
+        dtype = "int8" if "int8" in backend else "float16"
+        store = MmapVectorStore(work_dir, name="bench", dtype=dtype)
+    store.add(ids=ids, embeddings=corpus, documents=docs, metadatas=metas)
+    if backend.endswith("-ivf"):
+        store.build_ivf()
+    build_s = time.perf_counter() - started
+    del corpus
+
+    # Reload from disk so RSS reflects a worker that opened an existing index
+    if backend != "chroma":
+        from services.mmap_vector_store import MmapVectorStore
+        store = MmapVectorStore(work_dir, name="bench")
+
+    store.query(probes[:1], n_results=k)  # warm-up
+    latencies = []
+    hits = 0
+    for i, probe in enumerate(probes):
+        t0 = time.perf_counter()
+        result = store.query(probe[None, :], n_results=k, include=["documents", "metadatas"])
+        latencies.append(time.perf_counter() - t0)
+        found = {int(x[3:]) for x in result["ids"][0]}
+        hits += len(found & set(truth[i].tolist()))
+    rss, peak = rss_mb()
+    disk = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(work_dir) for f in files)
+    lat = np.array(latencies) * 1000
+    return {
+        "backend": backend,
+        "build_s": round(build_s, 3),
+        "p50_ms": round(float(np.percentile(lat, 50)), 3),
+        "p95_ms": round(float(np.percentile(lat, 95)), 3),
+        f"recall@{k}": round(hits / (len(probes) * k), 4),
+        "rss_mb": round(rss, 1),
+        "peak_rss_mb": round(peak, 1),
+        "disk_mb": round(disk / 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=8)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--json", dest="json_path")
+    parser.add_argument("--child", nargs=3, metavar=("BACKEND", "DATA", "WORKDIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_backend(args.child[0], args.child[1], args.child[2], args.k)))
+        return
+
+    tmp = tempfile.mkdtemp(prefix="vector_bench_")
+    try:
+        corpus, probes = make_corpus(args.rows, args.queries)
+        truth = exact_neighbors(corpus, probes, args.k)
+        data_path = os.path.join(tmp, "data.npz")
+        np.savez(data_path, corpus=corpus, probes=probes, truth=truth)
+        del corpus
+
+        results = []
+        for backend in args.backends.split(","):
+            work_dir = os.path.join(tmp, backend)
+            proc = subprocess.run(
+                [sys.executable, __file__, "-k", str(args.k), "--child", backend, data_path, work_dir],
+                capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                print(f"[WARN] {backend} failed: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}")
+                continue
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+        print(f"{args.rows} rows x {DIM} dims, {args.queries} queries, k={args.k}")
+        if results:
+            columns = list(results[0].keys())
+            print("  ".join(f"{c:>18}" for c in columns))
+            for r in results:
+                print("  ".join(f"{str(r[c]):>18}" for c in columns))
+        if args.json_path:
+            with open(args.json_path, "w") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()